@@ -1,7 +1,7 @@
 from decimal import Decimal
-import requests
-from django.contrib import admin
+from django.contrib import admin, messages
 from django import forms
+from django.db import transaction
 from django.utils import timezone
 from .models import (
     Category,
@@ -14,7 +14,9 @@ from .models import (
     Banner,
     Payment,
 )
-from .views import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+from .inventory import InsufficientStock, release_stock, secure_stock
+from .outbox import enqueue
+from .telegram import telegram_config
 
 # Register models
 admin.site.register(Category)
@@ -43,25 +45,32 @@ class OrderAdmin(admin.ModelAdmin):
     actions = ("mark_confirmed", "mark_shipping", "mark_completed", "mark_cancelled")
 
     def _notify_status(self, order: Order, status_text: str):
-        try:
-            msg = f"Order {order.order_code} updated: {status_text}"
-            base = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-            requests.post(
-                f"{base}/sendMessage",
-                json={"chat_id": TELEGRAM_CHAT_ID, "text": msg},
-                timeout=10,
-            )
-        except Exception:
-            pass
+        token, chat_id = telegram_config()
+        if not token or not chat_id:
+            return
+        msg = f"Order {order.order_code} updated: {status_text}"
+        enqueue("sendMessage", {"chat_id": chat_id, "text": msg})
 
     def _bulk_update(self, request, queryset, order_status, payment_status=None, label="updated"):
         payment_status = payment_status or "pending"
         count = 0
-        for order in queryset:
-            order.order_status = order_status
-            order.payment_status = payment_status
-            order.save(update_fields=["order_status", "payment_status"])
-            self._notify_status(order, f"{order_status} / {payment_status}")
+        for order_id in queryset.values_list("pk", flat=True):
+            try:
+                with transaction.atomic():
+                    order = Order.objects.select_for_update().get(pk=order_id)
+                    if order_status == "cancelled":
+                        release_stock(order)
+                    else:
+                        # Cancelled, rejected or expired orders gave their
+                        # stock back; take it again or leave the order alone.
+                        secure_stock(order)
+                    order.order_status = order_status
+                    order.payment_status = payment_status
+                    order.save(update_fields=["order_status", "payment_status"])
+                    self._notify_status(order, f"{order_status} / {payment_status}")
+            except InsufficientStock as exc:
+                self.message_user(request, f"Order {order.order_code} skipped: {exc}", level=messages.ERROR)
+                continue
             count += 1
         self.message_user(request, f"{count} orders {label}.")
 
@@ -150,29 +159,42 @@ class PaymentAdmin(admin.ModelAdmin):
     def mark_verified(self, request, queryset):
         count = 0
         for payment in queryset:
-            payment.status = "verified"
-            payment.paid_at = payment.paid_at or timezone.now()
-            payment.save(update_fields=["status", "paid_at", "updated_at"])
-            order = payment.order
-            if order:
-                if order.order_status == "pending":
-                    order.order_status = "confirmed"
-                order.payment_status = "paid"
-                order.payment_method = payment.method
-                order.save(update_fields=["order_status", "payment_status", "payment_method", "updated_at"])
+            try:
+                with transaction.atomic():
+                    order = None
+                    if payment.order_id:
+                        order = Order.objects.select_for_update().get(pk=payment.order_id)
+                        if order.order_status != "cancelled":
+                            secure_stock(order)
+                    payment.status = "verified"
+                    payment.paid_at = payment.paid_at or timezone.now()
+                    payment.save(update_fields=["status", "paid_at", "updated_at"])
+                    if order:
+                        if order.order_status == "pending":
+                            order.order_status = "confirmed"
+                        order.payment_status = "paid"
+                        order.payment_method = payment.method
+                        order.save(update_fields=["order_status", "payment_status", "payment_method", "updated_at"])
+            except InsufficientStock as exc:
+                self.message_user(
+                    request, f"Payment {payment.pk} not verified: {exc}", level=messages.ERROR
+                )
+                continue
             count += 1
         self.message_user(request, f"{count} payment(s) marked verified.")
 
     def mark_rejected(self, request, queryset):
         count = 0
         for payment in queryset:
-            payment.status = "rejected"
-            payment.paid_at = None
-            payment.save(update_fields=["status", "paid_at", "updated_at"])
-            order = payment.order
-            if order:
-                order.payment_status = "failed"
-                order.save(update_fields=["payment_status", "updated_at"])
+            with transaction.atomic():
+                payment.status = "rejected"
+                payment.paid_at = None
+                payment.save(update_fields=["status", "paid_at", "updated_at"])
+                if payment.order_id:
+                    order = Order.objects.select_for_update().get(pk=payment.order_id)
+                    order.payment_status = "failed"
+                    order.save(update_fields=["payment_status", "updated_at"])
+                    release_stock(order)
             count += 1
         self.message_user(request, f"{count} payment(s) rejected.")
 
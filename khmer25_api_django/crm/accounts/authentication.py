@@ -3,6 +3,20 @@ from rest_framework import exceptions
 from .models import AuthToken
 
 
+def token_key_from_header(auth_header):
+    """
+    The key in an Authorization header: "Token <key>", "Bearer <key>" or a
+    bare "<key>". None for other schemes.
+    """
+    auth_value = (auth_header or "").strip()
+    if " " in auth_value:
+        keyword, key = auth_value.split(" ", 1)
+        if keyword.lower() not in ("token", "bearer"):
+            return None
+        return key
+    return auth_value
+
+
 class AuthTokenAuthentication(BaseAuthentication):
     """
     Simple token authentication using our AuthToken model.
@@ -14,15 +28,10 @@ class AuthTokenAuthentication(BaseAuthentication):
         if not auth_header:
             return None
 
-        # Accept "Token <key>", "Bearer <key>", or bare "<key>"
-        auth_value = auth_header.strip()
-        if " " in auth_value:
-            keyword, key = auth_value.split(" ", 1)
-            if keyword.lower() not in ("token", "bearer"):
-                # Unrecognized scheme: ignore so other auth classes (or unauthenticated) can proceed
-                return None
-        else:
-            key = auth_value
+        key = token_key_from_header(auth_header)
+        if key is None:
+            # Unrecognized scheme: ignore so other auth classes (or unauthenticated) can proceed
+            return None
 
         if not key:
             raise exceptions.AuthenticationFailed("Missing token.")
@@ -0,0 +1,227 @@
+"""
+Catalog change tracking for the public product/category/banner endpoints.
+
+Every write to a catalog model bumps a per-section counter in
+``CatalogVersion``. List endpoints derive a strong ETag from those counters,
+so a client that already has the current catalog gets ``304 Not Modified``
+after a single indexed lookup instead of a full serialize. Rendered list
+bodies are cached under that ETag and evicted when their section changes.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from .models import CatalogVersion
+
+CATALOG_SECTIONS = ("product", "category", "banner")
+RESPONSE_CACHE_PREFIX = "catalog:resp"
+STATS_KEYS = {
+    "hits": f"{RESPONSE_CACHE_PREFIX}:stats:hits",
+    "misses": f"{RESPONSE_CACHE_PREFIX}:stats:misses",
+}
+
+
+def bump_catalog_version(*sections):
+    for section in sections:
+        updated = CatalogVersion.objects.filter(section=section).update(
+            version=F("version") + 1
+        )
+        if not updated:
+            CatalogVersion.objects.get_or_create(section=section, defaults={"version": 1})
+        evict_catalog_responses(section)
+
+
+def get_catalog_versions(sections):
+    """
+    Return the current versions for ``sections`` (in order) with one query.
+    """
+    found = dict(
+        CatalogVersion.objects.filter(section__in=sections).values_list("section", "version")
+    )
+    return tuple(found.get(section, 0) for section in sections)
+
+
+def catalog_etag(request, sections, versions=None):
+    """
+    Strong ETag for one representation of a catalog resource.
+
+    Besides the section versions it covers the scheme/host (serializers embed
+    absolute media URLs), the full path with query string and the negotiated
+    media type, since each of those changes the response bytes.
+    """
+    if versions is None:
+        versions = get_catalog_versions(sections)
+    basis = "|".join(
+        [
+            ",".join(f"{section}={version}" for section, version in zip(sections, versions)),
+            request.scheme,
+            request.get_host(),
+            request.get_full_path(),
+            getattr(request, "accepted_media_type", "") or "",
+        ]
+    )
+    return '"%s"' % hashlib.sha1(basis.encode("utf-8")).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    if "*" in candidates:
+        return True
+    # If-None-Match uses the weak comparison function.
+    bare = etag.removeprefix("W/")
+    return any(candidate.removeprefix("W/") == bare for candidate in candidates)
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    apply_catalog_headers(response, etag)
+    return response
+
+
+def apply_catalog_headers(response, etag):
+    response["ETag"] = etag
+    # Let clients and proxies keep the body but revalidate on every use.
+    response["Cache-Control"] = "no-cache"
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+def _response_cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+
+def _registry_key(section):
+    return f"{RESPONSE_CACHE_PREFIX}:{section}:keys"
+
+
+def response_cache_key(etag):
+    return "%s:%s" % (RESPONSE_CACHE_PREFIX, etag.strip('"'))
+
+
+def get_cached_response(key):
+    cached = _response_cache().get(key)
+    _count("hits" if cached is not None else "misses")
+    return cached
+
+
+def store_cached_response(key, content, content_type, sections):
+    _cache_set(key, (content, content_type), sections)
+
+
+def _cache_set(key, value, sections):
+    cache = _response_cache()
+    timeout = getattr(settings, "CATALOG_CACHE_TIMEOUT", 300)
+    cache.set(key, value, timeout)
+    # Remember which keys belong to each section so a write can drop exactly
+    # those entries. The registry update is not atomic; a lost key is still
+    # unreachable because the ETag (and so the key) embeds the section version.
+    for section in sections:
+        registry = _registry_key(section)
+        keys = cache.get(registry) or []
+        if key not in keys:
+            keys.append(key)
+            cache.set(registry, keys, timeout)
+
+
+def get_catalog_fragment(request, name, sections, versions, build):
+    """
+    Serialized data for one piece of a composite response, cached under the
+    versions of the ``sections`` it reads. ``build()`` runs on a miss.
+
+    Fragments embed absolute media URLs, so the key covers scheme and host.
+    """
+    basis = "|".join(
+        [
+            name,
+            ",".join(f"{section}={version}" for section, version in zip(sections, versions)),
+            request.scheme,
+            request.get_host(),
+        ]
+    )
+    key = "%s:frag:%s" % (RESPONSE_CACHE_PREFIX, hashlib.sha1(basis.encode("utf-8")).hexdigest())
+    data = get_cached_response(key)
+    if data is None:
+        data = build()
+        _cache_set(key, data, sections)
+    return data
+
+
+def evict_catalog_responses(section):
+    cache = _response_cache()
+    registry = _registry_key(section)
+    keys = cache.get(registry) or []
+    cache.delete_many([*keys, registry])
+
+
+def _count(stat):
+    cache = _response_cache()
+    key = STATS_KEYS[stat]
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); start over.
+        cache.set(key, 1, None)
+
+
+def get_response_cache_stats():
+    values = _response_cache().get_many(list(STATS_KEYS.values()))
+    return {stat: int(values.get(key) or 0) for stat, key in STATS_KEYS.items()}
+
+
+def reset_response_cache_stats():
+    _response_cache().delete_many(list(STATS_KEYS.values()))
+
+
+class CatalogETagMixin:
+    """
+    ViewSet mixin for catalog ``list`` endpoints.
+
+    Conditional GETs are answered from ``CatalogVersion`` alone; otherwise
+    the rendered body is served from the response cache when present.
+    Set ``catalog_sections`` to every section whose data appears in the
+    response.
+    """
+
+    catalog_sections = ()
+
+    def list(self, request, *args, **kwargs):
+        versions = get_catalog_versions(self.catalog_sections)
+        etag = catalog_etag(request, self.catalog_sections, versions)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        # The browsable API embeds per-user markup; only cache data renderers.
+        cacheable = getattr(request.accepted_renderer, "format", "") != "api"
+        key = response_cache_key(etag) if cacheable else None
+        if key:
+            cached = get_cached_response(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response["X-Cache"] = "HIT"
+                return apply_catalog_headers(response, etag)
+
+        response = super().list(request, *args, **kwargs)
+        self._catalog_cache_key = key
+        response["X-Cache"] = "MISS"
+        return apply_catalog_headers(response, etag)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "_catalog_cache_key", None)
+        if key and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            store_cached_response(
+                key, response.content, response["Content-Type"], self.catalog_sections
+            )
+        return response
@@ -1,23 +1,77 @@
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, urlparse
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from .authentication import token_key_from_header
+from .models import AuthToken
+from .ui_views import ADMIN_USERNAME
+
+# Every order event, for signed-in admin dashboard pages.
+ADMIN_GROUP = "orders_admin"
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers") or ():
+        if key.decode("latin-1").lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+@database_sync_to_async
+def _token_user_id(key):
+    return AuthToken.objects.filter(key=key).values_list("user_id", flat=True).first()
+
+
+@database_sync_to_async
+def _is_admin_session(session):
+    return session is not None and session.get("admin_user") == ADMIN_USERNAME
+
 
 class OrderEventConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Order events for one socket. Customer apps authenticate with their
+    AuthToken (``Authorization: Token <key>``, or ``?token=<key>`` where
+    the client cannot set headers) and receive only their own orders; the
+    admin dashboard, signed in through the session, receives every order.
+    Other sockets are refused.
+    """
+
     async def connect(self):
-        await self.channel_layer.group_add("orders", self.channel_name)
-        query = parse_qs(self.scope.get("query_string", b"").decode())
-        user_id = (query.get("user_id") or [None])[0]
-        if user_id:
-            await self.channel_layer.group_add(f"user_{user_id}", self.channel_name)
+        self.groups_joined = []
+        group = await self._group()
+        if group is None:
+            await self.close()
+            return
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.groups_joined.append(group)
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard("orders", self.channel_name)
-        query = parse_qs(self.scope.get("query_string", b"").decode())
-        user_id = (query.get("user_id") or [None])[0]
-        if user_id:
-            await self.channel_layer.group_discard(f"user_{user_id}", self.channel_name)
+        for group in getattr(self, "groups_joined", ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
 
     async def order_event(self, event):
         await self.send_json(event)
+
+    async def _group(self):
+        key = token_key_from_header(_header(self.scope, "authorization"))
+        if not key:
+            query = parse_qs(self.scope.get("query_string", b"").decode())
+            key = (query.get("token") or [""])[0]
+        if key:
+            user_id = await _token_user_id(key)
+            return user_group(user_id) if user_id else None
+        if self._same_origin() and await _is_admin_session(self.scope.get("session")):
+            return ADMIN_GROUP
+        return None
+
+    def _same_origin(self):
+        # The session cookie rides along on cross-site sockets too; only
+        # trust it from our own pages.
+        origin = _header(self.scope, "origin")
+        return bool(origin) and urlparse(origin).netloc == _header(self.scope, "host")
@@ -0,0 +1,91 @@
+"""
+Denormalized per-category product counts.
+
+``Category.product_count`` / ``in_stock_count`` (and ``sub_count``, which the
+app already displays) are adjusted with F() expressions as products are
+created, deleted, moved between categories or go in/out of stock, so reads
+never need ``Count('products')``.
+"""
+from django.db.models import Count, F, Q
+
+from .catalog import bump_catalog_version
+from .models import Category, Product
+
+
+def adjust_category_counts(category_id, products=0, in_stock=0):
+    if not category_id or not (products or in_stock):
+        return
+    updates = {}
+    if products:
+        updates["product_count"] = F("product_count") + products
+        updates["sub_count"] = F("sub_count") + products
+    if in_stock:
+        updates["in_stock_count"] = F("in_stock_count") + in_stock
+    Category.objects.filter(pk=category_id).update(**updates)
+    bump_catalog_version("category")
+
+
+def counted_state(product):
+    return (product.category_id, product.quantity)
+
+
+def load_counted_state(product):
+    """
+    State the counters last saw for ``product``; one query when the instance
+    was not loaded with both columns (e.g. built by hand or via only()).
+    """
+    state = getattr(product, "_counted_state", None)
+    if state is None and product.pk:
+        state = (
+            Product.objects.filter(pk=product.pk)
+            .values_list("category_id", "quantity")
+            .first()
+        )
+    return state
+
+
+def apply_product_change(old_state, new_state):
+    """
+    Adjust counters for a product going from ``old_state`` to ``new_state``,
+    each a (category_id, quantity) tuple or None (not existing).
+    """
+    old_category, old_quantity = old_state or (None, 0)
+    new_category, new_quantity = new_state or (None, 0)
+    old_in_stock = 1 if old_state and old_quantity > 0 else 0
+    new_in_stock = 1 if new_state and new_quantity > 0 else 0
+
+    if old_category == new_category:
+        adjust_category_counts(new_category, in_stock=new_in_stock - old_in_stock)
+        return
+    adjust_category_counts(old_category, products=-1 if old_state else 0, in_stock=-old_in_stock)
+    adjust_category_counts(new_category, products=1 if new_state else 0, in_stock=new_in_stock)
+
+
+def recount_categories(category_ids=None):
+    """
+    Recompute counters from Product rows. Returns the categories whose stored
+    values had drifted, as {id: (old_counts, new_counts)}.
+    """
+    totals = {
+        row["category_id"]: (row["total"], row["in_stock"])
+        for row in Product.objects.values("category_id").annotate(
+            total=Count("id"), in_stock=Count("id", filter=Q(quantity__gt=0))
+        )
+    }
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    drifted = {}
+    changed = []
+    for category in categories:
+        total, in_stock = totals.get(category.pk, (0, 0))
+        old = (category.product_count, category.in_stock_count, category.sub_count)
+        new = (total, in_stock, total)
+        if old != new:
+            drifted[category.pk] = (old, new)
+            category.product_count, category.in_stock_count, category.sub_count = new
+            changed.append(category)
+    if changed:
+        Category.objects.bulk_update(changed, ["product_count", "in_stock_count", "sub_count"])
+        bump_catalog_version("category")
+    return drifted
@@ -0,0 +1,90 @@
+"""
+Sparse fieldsets: ``?fields=id,name,price`` or ``?omit=items`` on GET.
+
+The serializer mixin drops unrequested fields before serialization, so their
+SerializerMethodFields never run. The viewset mixin narrows the SQL to the
+columns those fields read with ``QuerySet.only()``.
+"""
+
+FIELDS_PARAM = "fields"
+OMIT_PARAM = "omit"
+
+
+def _parse_names(value):
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+def selected_field_names(request, serializer_class):
+    """
+    Field names to render for ``request``, or None when nothing was narrowed.
+    """
+    if request is None or request.method not in ("GET", "HEAD"):
+        return None
+    params = getattr(request, "query_params", request.GET)
+    requested = _parse_names(params.get(FIELDS_PARAM))
+    omitted = _parse_names(params.get(OMIT_PARAM))
+    if not requested and not omitted:
+        return None
+    names = list(serializer_class.Meta.fields)
+    if requested:
+        names = [name for name in names if name in requested]
+    return [name for name in names if name not in omitted]
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin. Only the top-level serializer reads the query string:
+    nested serializers are built before they receive a context, so they
+    always render in full.
+    """
+
+    # Model columns read by computed fields, used to build QuerySet.only().
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        names = selected_field_names(self.context.get("request"), type(self))
+        if names is None:
+            return
+        keep = set(names)
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    @classmethod
+    def model_columns(cls, names):
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        columns = set()
+        for name in names:
+            if name in cls.field_sources:
+                columns.update(cls.field_sources[name])
+            elif name in model_fields:
+                columns.add(name)
+        return columns
+
+
+class SparseQuerysetMixin:
+    """
+    ViewSet mixin that applies ``only()`` on list requests that use
+    ``?fields=``/``?omit=``. ``sparse_required_fields`` lists columns the view
+    itself needs (primary key, pagination ordering).
+    """
+
+    sparse_required_fields = ("id",)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, "action", None) != "list":
+            return queryset
+        serializer_class = self.get_serializer_class()
+        names = selected_field_names(self.request, serializer_class)
+        if names is None or not hasattr(serializer_class, "model_columns"):
+            return queryset
+        columns = serializer_class.model_columns(names) | set(self.sparse_required_fields)
+        # select_related() on a relation whose columns are all deferred is an
+        # error, so keep only the joins the selected fields actually read.
+        relations = {column.split("__", 1)[0] for column in columns if "__" in column}
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*sorted(relations))
+        return queryset.only(*sorted(columns))
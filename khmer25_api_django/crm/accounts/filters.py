@@ -0,0 +1,74 @@
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Product
+
+TRUE_VALUES = {"1", "true", "yes"}
+FALSE_VALUES = {"0", "false", "no"}
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Query params for the product list (``list`` only), each backed by an
+    index on Product: category, tag, currency, min_price, max_price,
+    in_stock.
+    """
+
+    tag_values = {value for value, _ in Product.TAG_CHOICES if value}
+    currency_values = {value for value, _ in Product.CURRENCY_CHOICES}
+
+    def filter_queryset(self, request, queryset, view):
+        # get_object() runs the filter backends too; a product's detail URL
+        # must not 404 (or 400) because of list parameters.
+        if getattr(view, "action", None) != "list":
+            return queryset
+        params = request.query_params
+        errors = {}
+
+        category = params.get("category")
+        if category:
+            try:
+                queryset = queryset.filter(category_id=int(category))
+            except ValueError:
+                errors["category"] = "Must be a category id."
+
+        tag = (params.get("tag") or "").strip().lower()
+        if tag:
+            if tag in self.tag_values:
+                queryset = queryset.filter(tag=tag)
+            else:
+                errors["tag"] = f"Must be one of: {', '.join(sorted(self.tag_values))}."
+
+        currency = (params.get("currency") or "").strip().upper()
+        if currency:
+            if currency in self.currency_values:
+                queryset = queryset.filter(currency=currency)
+            else:
+                errors["currency"] = f"Must be one of: {', '.join(sorted(self.currency_values))}."
+
+        for param, lookup in (("min_price", "price__gte"), ("max_price", "price__lte")):
+            raw = params.get(param)
+            if not raw:
+                continue
+            try:
+                value = Decimal(raw)
+                if not value.is_finite():
+                    raise InvalidOperation
+            except (InvalidOperation, ValueError):
+                errors[param] = "Must be a number."
+                continue
+            queryset = queryset.filter(**{lookup: value})
+
+        in_stock = (params.get("in_stock") or "").strip().lower()
+        if in_stock in TRUE_VALUES:
+            queryset = queryset.filter(quantity__gt=0)
+        elif in_stock in FALSE_VALUES:
+            queryset = queryset.filter(quantity=0)
+        elif in_stock:
+            errors["in_stock"] = "Must be true or false."
+
+        if errors:
+            raise ValidationError(errors)
+        return queryset
@@ -0,0 +1,193 @@
+"""
+``Idempotency-Key`` support for POST endpoints that create things
+(orders, payments).
+
+The first request with a key claims a row in ``IdempotencyRecord``; the
+unique (user, scope, key) constraint makes concurrent duplicates lose the
+INSERT instead of running the view twice. When the view finishes, its
+status and response data are stored, and retries with the same key and
+the same body are answered from the row without touching the view, so no
+second order, payment or Telegram message. Reusing a key for a different
+body is rejected with 422; a retry that arrives while the first request is
+still running gets 409 and should try again shortly.
+
+Only successes and final client errors are stored. A 5xx, a 409 (e.g.
+out of stock), a 429 or an exception frees the key so the client can retry. Rows expire after
+``IDEMPOTENCY_TTL_HOURS``; ``manage.py purge_idempotency_records`` deletes
+them.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# An unfinished claim older than this belongs to a worker that died.
+STALE_CLAIM = timedelta(minutes=5)
+# 4xx answers that may change on retry, so they are not stored.
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+
+
+def _ttl():
+    return timedelta(hours=getattr(settings, "IDEMPOTENCY_TTL_HOURS", 24))
+
+
+def _file_digest(upload):
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return f"file:{upload.name}:{upload.size}:{digest.hexdigest()}"
+
+
+def _plain(value):
+    if isinstance(value, UploadedFile):
+        return _file_digest(value)
+    return value
+
+
+def _endpoint(request):
+    """
+    The resolved view and its URL arguments, so ``payments/create`` and
+    ``payments/create/`` count as the same request.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return request.path.rstrip("/")
+    return [f"{match.func.__module__}.{match.func.__qualname__}", sorted(match.kwargs.items())]
+
+
+def request_fingerprint(request):
+    """
+    sha256 of the method, endpoint and parsed body (uploads by content).
+    """
+    data = request.data
+    if hasattr(data, "lists"):
+        body = sorted((key, [_plain(value) for value in values]) for key, values in data.lists())
+    else:
+        body = data
+    payload = json.dumps([request.method, _endpoint(request), body], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _claim(user, scope, key, fingerprint):
+    """
+    (record, created). ``record`` is None when another request holds the
+    key and it could not be taken over.
+    """
+    for _ in range(2):
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(
+                    user=user, scope=scope, key=key, fingerprint=fingerprint, expires_at=now + _ttl()
+                )
+            return record, True
+        except IntegrityError:
+            pass
+        record = IdempotencyRecord.objects.filter(user=user, scope=scope, key=key).first()
+        if record is None:
+            continue
+        abandoned = record.status_code is None and record.created_at <= now - STALE_CLAIM
+        if record.expires_at <= now or abandoned:
+            IdempotencyRecord.objects.filter(pk=record.pk).delete()
+            continue
+        return record, False
+    return None, False
+
+
+def _store(record, response):
+    data = json.loads(json.dumps(response.data, cls=JSONEncoder))
+    IdempotencyRecord.objects.filter(pk=record.pk).update(
+        status_code=response.status_code, response_body=data
+    )
+
+
+def _replayable(response):
+    """
+    Successes and client errors a retry would only repeat. Conflicts (such
+    as insufficient stock), rate limits and server errors free the key, as
+    a later retry may well succeed.
+    """
+    if not hasattr(response, "data"):
+        return False
+    code = response.status_code
+    return 200 <= code < 300 or (400 <= code < 500 and code not in RETRYABLE_STATUSES)
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(scope):
+    """
+    Decorate a DRF view function (below ``@api_view``) or, through
+    ``method_decorator``, a viewset action. Requests without the header or
+    without an authenticated user run as before.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = (request.headers.get(HEADER) or "").strip()
+            user = getattr(request, "user", None)
+            if not key or not getattr(user, "is_authenticated", False):
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"detail": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            fingerprint = request_fingerprint(request)
+            record, created = _claim(user, scope, key, fingerprint)
+            if not created:
+                if record is not None and record.fingerprint != fingerprint:
+                    return Response(
+                        {"detail": f"{HEADER} was already used for a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                if record is None or record.status_code is None:
+                    response = Response(
+                        {"detail": f"A request with this {HEADER} is still being processed."},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                    response["Retry-After"] = "1"
+                    return response
+                return _replay(record)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                IdempotencyRecord.objects.filter(pk=record.pk).delete()
+                raise
+            if _replayable(response):
+                _store(record, response)
+            else:
+                IdempotencyRecord.objects.filter(pk=record.pk).delete()
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def purge_expired(now=None):
+    """
+    Delete expired records; returns how many.
+    """
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
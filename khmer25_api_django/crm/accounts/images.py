@@ -0,0 +1,183 @@
+"""
+Resized WebP/JPEG variants of uploaded images.
+
+Variants are written next to the original (``products/tea.jpg`` ->
+``products/tea__w320.webp``) and recorded on the row in a JSON field:
+
+    {"source": "products/tea.jpg",
+     "webp": {"160": "products/tea__w160.webp", ...},
+     "jpeg": {"160": "products/tea__w160.jpg", ...}}
+
+``source`` lets a save tell whether the variants are for the current file.
+Saving a new image queues an ``ImageVariantJob``; ``manage.py
+build_image_variants --watch`` builds the variants outside the request.
+Only widths smaller than the original are generated; clients fall back to
+the original URL for anything larger.
+"""
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .catalog import bump_catalog_version
+from .models import ImageVariantJob
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FORMATS = {
+    # key: (Pillow format, file extension)
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+
+
+def variant_widths():
+    return tuple(sorted(getattr(settings, "IMAGE_VARIANT_WIDTHS", (160, 320, 640, 1280))))
+
+
+def _variant_name(source_name, width, extension):
+    stem, _ = posixpath.splitext(source_name)
+    return f"{stem}__w{width}.{extension}"
+
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    quality = getattr(settings, "IMAGE_VARIANT_QUALITY", 80)
+    if image_format == "JPEG":
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha; flatten onto white like the app background.
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(field_file):
+    """
+    Write the variants for ``field_file`` and return the JSON to store, or
+    None when the file is not an image at all. Raises OSError when it cannot
+    be read or decoded right now (missing, or a half-written upload), which
+    may be worth retrying.
+    """
+    if not field_file or not field_file.name:
+        return None
+    storage = field_file.storage
+    name = field_file.name
+    try:
+        with storage.open(name, "rb") as handle:
+            with Image.open(handle) as opened:
+                opened.load()
+                original = ImageOps.exif_transpose(opened)
+    except UnidentifiedImageError as exc:
+        logger.warning("Cannot build variants for %s: %s", name, exc)
+        return None
+
+    variants = {"source": name}
+    for key in VARIANT_FORMATS:
+        variants[key] = {}
+    for width in variant_widths():
+        if width >= original.width:
+            break
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.Resampling.LANCZOS)
+        for key, (image_format, extension) in VARIANT_FORMATS.items():
+            try:
+                content = _encode(resized, image_format)
+            except (OSError, KeyError) as exc:
+                # e.g. Pillow built without WebP support.
+                logger.warning("Cannot encode %s as %s: %s", name, image_format, exc)
+                continue
+            target = _variant_name(name, width, extension)
+            if storage.exists(target):
+                storage.delete(target)
+            variants[key][str(width)] = storage.save(target, ContentFile(content))
+    return variants
+
+
+def delete_variants(variants, storage):
+    for key in VARIANT_FORMATS:
+        for name in (variants or {}).get(key, {}).values():
+            try:
+                storage.delete(name)
+            except OSError:
+                pass
+
+
+def queue_variants(instance):
+    """
+    Queue ``instance`` for ``build_image_variants --watch``; call in the
+    transaction that saved its new image. Re-queuing an object that is
+    waiting for a retry makes it due now.
+    """
+    ImageVariantJob.objects.bulk_create(
+        [ImageVariantJob(model=instance._meta.model_name, object_id=instance.pk)],
+        update_conflicts=True,
+        unique_fields=["model", "object_id"],
+        update_fields=["attempts", "next_attempt_at", "last_error"],
+    )
+
+
+def variants_current(field_file, variants):
+    if not field_file or not field_file.name:
+        return not variants
+    return bool(variants) and variants.get("source") == field_file.name
+
+
+def replace_variants(instance, field_name, variants_field, variants, section=None):
+    """
+    Store freshly generated ``variants`` and delete files only the previous
+    set referenced. Writes with update() so no save signals fire again;
+    bumps ``section`` so cached catalog responses pick up the new URLs.
+    """
+    previous = getattr(instance, variants_field) or {}
+    if previous:
+        # Same-named files were overwritten in place; drop only the leftovers.
+        kept = {name for key in VARIANT_FORMATS for name in variants.get(key, {}).values()}
+        stale = {
+            key: {width: name for width, name in previous.get(key, {}).items() if name not in kept}
+            for key in VARIANT_FORMATS
+        }
+        delete_variants(stale, getattr(instance, field_name).storage)
+    setattr(instance, variants_field, variants)
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field: variants})
+    if section:
+        bump_catalog_version(section)
+
+
+def variant_urls(variants, url_for_name):
+    """
+    Public form of stored variants: {"webp": {"160": url, ...}, "jpeg": {...}}.
+    """
+    if not variants:
+        return {}
+    return {
+        key: {width: url_for_name(name) for width, name in variants.get(key, {}).items()}
+        for key in VARIANT_FORMATS
+        if variants.get(key)
+    }
+
+
+def shrink_image(data, max_side):
+    """
+    JPEG bytes of the image in ``data`` fitted within ``max_side`` pixels,
+    or None when ``data`` is not a readable image.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as opened:
+            opened.load()
+            image = ImageOps.exif_transpose(opened)
+    except (UnidentifiedImageError, OSError):
+        return None
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return _encode(image, "JPEG")
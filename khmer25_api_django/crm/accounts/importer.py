@@ -0,0 +1,257 @@
+"""
+Bulk product import from CSV or XLSX, keyed on ``Product.sku``.
+
+Rows are streamed and upserted in batches with
+``bulk_create(update_conflicts=True)``, so memory stays bounded by the batch
+size whatever the file length. A bad row is reported and skipped; the rest of
+the file still loads (a batch the database rejects is retried row by row to
+find the rows at fault). bulk_create() bypasses model signals, so the search
+index, category counters and catalog version are brought up to date here.
+
+Columns (header row, case-insensitive): sku, name, category (English or
+Khmer title, or id), price, quantity; optional currency, tag, supplier_id,
+payway_link. Optional columns missing from the file are left untouched on
+existing products.
+"""
+import csv
+import io
+import posixpath
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError, transaction
+
+from .catalog import bump_catalog_version
+from .counters import recount_categories
+from .models import Category, Product
+from .search import index_products
+
+try:
+    import openpyxl
+except ImportError:  # optional dependency, only needed for .xlsx
+    openpyxl = None
+
+REQUIRED_COLUMNS = ("sku", "name", "category", "price", "quantity")
+OPTIONAL_COLUMNS = ("currency", "tag", "supplier_id", "payway_link")
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+
+def _normalize_header(values):
+    return [str(value or "").strip().lower() for value in values]
+
+
+def _csv_rows(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = _normalize_header(next(reader, []))
+        for values in reader:
+            yield header, values
+    finally:
+        # Leave the underlying file open for the caller.
+        text.detach()
+
+
+def _xlsx_rows(fileobj):
+    if openpyxl is None:
+        raise ImportFileError("Reading .xlsx files requires openpyxl (pip install openpyxl).")
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _normalize_header(next(rows, ()))
+        for values in rows:
+            yield header, ["" if value is None else value for value in values]
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename):
+    """
+    Yield (row_number, {column: value}) from a binary CSV/XLSX file object.
+    """
+    extension = posixpath.splitext(filename or "")[1].lower()
+    if extension == ".xlsx":
+        source = _xlsx_rows(fileobj)
+    elif extension in (".csv", ".txt", ""):
+        source = _csv_rows(fileobj)
+    else:
+        raise ImportFileError(f"Unsupported file type '{extension}'. Use .csv or .xlsx.")
+    for row_number, (header, values) in enumerate(source, start=2):
+        if not any(str(value).strip() for value in values):
+            continue
+        values = list(values) + [""] * (len(header) - len(values))
+        yield row_number, dict(zip(header, values))
+
+
+def category_lookup():
+    """
+    {key: category_id} for titles (case-insensitive) and ids.
+    """
+    lookup = {}
+    for category_id, title_en, title_kh in Category.objects.values_list("id", "title_en", "title_kh"):
+        for title in (title_kh, title_en):
+            if title:
+                lookup[title.strip().casefold()] = category_id
+        lookup[str(category_id)] = category_id
+    return lookup
+
+
+def _text(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def build_product(values, categories):
+    """
+    An unsaved Product for one row, or raise ValueError with the reason.
+    """
+    sku = _text(values.get("sku", ""))
+    if not sku:
+        raise ValueError("sku is required.")
+    if len(sku) > 64:
+        raise ValueError("sku is too long (max 64 characters).")
+    name = _text(values.get("name", ""))
+    if not name or len(name) > 200:
+        raise ValueError("name is required (max 200 characters).")
+    category_key = _text(values.get("category", "")).casefold()
+    category_id = categories.get(category_key)
+    if category_id is None:
+        raise ValueError(f"Unknown category '{_text(values.get('category', ''))}'.")
+    try:
+        price = Decimal(_text(values.get("price", "")))
+    except InvalidOperation:
+        raise ValueError("price must be a number.")
+    if not price.is_finite() or price < 0:
+        raise ValueError("price must be zero or more.")
+    price = price.quantize(Decimal("0.01"))
+    try:
+        quantity = int(Decimal(_text(values.get("quantity", ""))))
+    except (InvalidOperation, ValueError):
+        raise ValueError("quantity must be a whole number.")
+    if quantity < 0:
+        raise ValueError("quantity must be zero or more.")
+
+    product = Product(sku=sku, name=name, category_id=category_id, price=price, quantity=quantity)
+    if "currency" in values:
+        currency = _text(values["currency"]).upper() or "USD"
+        if currency not in dict(Product.CURRENCY_CHOICES):
+            raise ValueError("currency must be USD or KHR.")
+        product.currency = currency
+    if "tag" in values:
+        tag = _text(values["tag"]).lower()
+        if tag not in dict(Product.TAG_CHOICES):
+            raise ValueError("tag must be empty, 'hot' or 'discount'.")
+        product.tag = tag
+    if "supplier_id" in values:
+        supplier_id = _text(values["supplier_id"])
+        try:
+            product.supplier_id = int(supplier_id) if supplier_id else None
+        except ValueError:
+            raise ValueError("supplier_id must be a whole number.")
+    if "payway_link" in values:
+        link = _text(values["payway_link"])
+        if len(link) > 200:
+            raise ValueError("payway_link is too long (max 200 characters).")
+        product.payway_link = link or None
+    return product
+
+
+def _update_fields(header):
+    fields = ["name", "category", "price", "quantity"]
+    fields.extend(column for column in OPTIONAL_COLUMNS if column in header)
+    return fields
+
+
+def _upsert(rows, update_fields, reindex):
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            [product for _, product in rows],
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=update_fields,
+        )
+        if reindex:
+            index_products(
+                Product.objects.select_related("category").filter(sku__in=[product.sku for _, product in rows])
+            )
+
+
+def _flush(batch, update_fields, result, reindex):
+    """
+    Upsert one batch ({sku: (row_number, product)}). If the database rejects
+    the batch, its rows are retried one by one (each in its own savepoint)
+    so only the offending rows are reported.
+    """
+    rows = list(batch.values())
+    try:
+        _upsert(rows, update_fields, reindex)
+    except DatabaseError:
+        pass
+    else:
+        result.imported += len(rows)
+        return
+    for row in rows:
+        try:
+            _upsert([row], update_fields, reindex)
+        except DatabaseError as exc:
+            result.add_error(row[0], f"Database error: {exc}")
+        else:
+            result.imported += 1
+
+
+def import_products(fileobj, filename, batch_size=1000, reindex=True):
+    """
+    Import products from ``fileobj`` (binary). Raises ImportFileError when
+    the file itself is unusable; row problems end up in the result.
+    """
+    result = ImportResult()
+    categories = category_lookup()
+    batch = {}
+    update_fields = None
+
+    for row_number, values in iter_rows(fileobj, filename):
+        if update_fields is None:
+            missing = [column for column in REQUIRED_COLUMNS if column not in values]
+            if missing:
+                raise ImportFileError(f"Missing column(s): {', '.join(missing)}.")
+            update_fields = _update_fields(values)
+        result.rows += 1
+        try:
+            product = build_product(values, categories)
+        except ValueError as exc:
+            result.add_error(row_number, str(exc))
+            continue
+        # A repeated sku in one batch would hit the same row twice in a
+        # single INSERT ... ON CONFLICT; the later row wins.
+        batch.pop(product.sku, None)
+        batch[product.sku] = (row_number, product)
+        if len(batch) >= batch_size:
+            _flush(batch, update_fields, result, reindex)
+            batch = {}
+    if batch:
+        _flush(batch, update_fields, result, reindex)
+
+    if result.imported:
+        # Products may also have left other categories; a full recount is
+        # one aggregate query.
+        recount_categories()
+        bump_catalog_version("product")
+    return result
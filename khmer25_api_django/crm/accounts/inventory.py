@@ -0,0 +1,218 @@
+"""
+Stock reservation for checkout.
+
+Stock is taken with a conditional ``UPDATE ... SET quantity = quantity - n
+WHERE id = ? AND quantity >= n`` (one statement for the whole cart, with
+``n`` picked per row by a CASE): the database checks and decrements under
+row locks, so concurrent checkouts on the same product serialize on that
+row only, and a cart that cannot be filled updates fewer rows than it has
+lines and is rolled back. Nothing is read first and no table is locked.
+
+Every decrement is recorded as a ``StockReservation``. Unpaid QR/PayWay
+orders hold theirs until ``expires_at``; ``expire_reservations`` puts expired
+stock back. Cancelling or rejecting an order releases its reservations;
+if the order is later resubmitted or paid anyway, ``secure_stock`` takes the
+units again (or raises InsufficientStock) before it can be marked paid.
+"""
+from collections import Counter
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .counters import adjust_category_counts
+from .models import Order, Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Not enough stock for {product.name}.")
+
+
+def reservation_expiry(payment_method, now=None):
+    """
+    When a new order's reservation lapses; None (never) for cash on delivery.
+    """
+    if payment_method == "COD":
+        return None
+    minutes = getattr(settings, "STOCK_RESERVATION_TTL_MINUTES", 30)
+    return (now or timezone.now()) + timedelta(minutes=minutes)
+
+
+def _merge(lines):
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return sorted(quantities.items())
+
+
+def _adjust_in_stock(crossed, delta):
+    """
+    Move ``in_stock_count`` for products that just crossed zero.
+    """
+    if not crossed:
+        return
+    per_category = Counter(
+        Product.objects.filter(reduce(or_, crossed)).values_list("category_id", flat=True)
+    )
+    for category_id, count in per_category.items():
+        adjust_category_counts(category_id, in_stock=delta * count)
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def _take(merged):
+    """
+    Decrement every product in one conditional UPDATE; all or nothing.
+    """
+    delta = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in merged],
+        output_field=IntegerField(),
+    )
+    try:
+        with transaction.atomic():
+            taken = Product.objects.filter(
+                pk__in=[product_id for product_id, _ in merged], quantity__gte=delta
+            ).update(quantity=F("quantity") - delta)
+            if taken != len(merged):
+                raise _Shortfall
+    except _Shortfall:
+        stock = dict(
+            Product.objects.filter(pk__in=[product_id for product_id, _ in merged]).values_list(
+                "pk", "quantity"
+            )
+        )
+        short = [product_id for product_id, quantity in merged if stock.get(product_id, 0) < quantity]
+        # Empty only if a competing checkout restocked in between; report the first line.
+        return short or [merged[0][0]]
+    return []
+
+
+def reserve_stock(order, lines, products, expires_at=None):
+    """
+    Take stock for ``lines`` [(product_id, quantity)] and record reservations
+    for ``order``. ``products`` maps id -> Product (for error messages).
+    Raises InsufficientStock; call inside the order's transaction so a
+    failure undoes the order too. Costs the same few queries for any cart.
+    """
+    merged = _merge(lines)
+    short = _take(merged)
+    if short:
+        raise InsufficientStock(products[short[0]])
+    status = StockReservation.HELD if expires_at else StockReservation.COMMITTED
+    StockReservation.objects.bulk_create(
+        StockReservation(
+            order=order, product_id=product_id, quantity=quantity, status=status, expires_at=expires_at
+        )
+        for product_id, quantity in merged
+    )
+    _adjust_in_stock([Q(pk=product_id, quantity=0) for product_id, _ in merged], -1)
+    bump_catalog_version("product")
+
+
+def commit_stock(order):
+    """
+    The order is paid/confirmed: its held stock no longer expires.
+    """
+    return StockReservation.objects.filter(order=order, status=StockReservation.HELD).update(
+        status=StockReservation.COMMITTED, expires_at=None
+    )
+
+
+def reclaim_stock(order, expires_at=None):
+    """
+    Take stock again for an order whose reservations were all released
+    (rejected, failed or expired). Orders that still hold stock, and orders
+    placed before reservations existed, are left alone. Lock the order row
+    first so two callers cannot both reclaim. Returns whether stock was
+    taken; raises InsufficientStock when it has been sold meanwhile.
+    """
+    reservations = StockReservation.objects.filter(order=order)
+    if not reservations.exists() or reservations.exclude(status=StockReservation.RELEASED).exists():
+        return False
+    lines = list(order.items.values_list("product_id", "quantity"))
+    if not lines:
+        return False
+    products = Product.objects.in_bulk({product_id for product_id, _ in lines})
+    with transaction.atomic():
+        reserve_stock(order, lines, products, expires_at)
+    return True
+
+
+def secure_stock(order):
+    """
+    The order is being paid or confirmed: commit its stock, reclaiming it
+    first if it was released. Raises InsufficientStock.
+    """
+    reclaim_stock(order)
+    commit_stock(order)
+
+
+def release_stock(order, statuses=(StockReservation.HELD, StockReservation.COMMITTED)):
+    """
+    Put the order's reserved units back. Safe to call repeatedly or
+    concurrently: each reservation is released by exactly one caller.
+    Returns the number of units restocked.
+    """
+    now = timezone.now()
+    released = 0
+    crossed = []
+    with transaction.atomic():
+        reservations = StockReservation.objects.filter(order=order, status__in=statuses).order_by(
+            "product_id"
+        )
+        for reservation in reservations:
+            claimed = StockReservation.objects.filter(
+                pk=reservation.pk, status=reservation.status
+            ).update(status=StockReservation.RELEASED, released_at=now)
+            if not claimed:
+                continue
+            Product.objects.filter(pk=reservation.product_id).update(
+                quantity=F("quantity") + reservation.quantity
+            )
+            # Back from zero when the restocked amount is all there is.
+            crossed.append(Q(pk=reservation.product_id, quantity=reservation.quantity))
+            released += reservation.quantity
+        if released:
+            _adjust_in_stock(crossed, 1)
+            bump_catalog_version("product")
+    return released
+
+
+def expired_order_ids(now=None):
+    """
+    Orders whose held stock has lapsed. Orders with an uploaded receipt are
+    waiting on staff review, not on the customer, so they keep their stock.
+    """
+    return list(
+        StockReservation.objects.filter(
+            status=StockReservation.HELD, expires_at__lte=now or timezone.now()
+        )
+        .exclude(order__payments__receipt_uploaded_at__isnull=False)
+        .values_list("order_id", flat=True)
+        .distinct()
+    )
+
+
+def expire_order(order_id):
+    """
+    Release an unpaid order's held stock and cancel it. Returns the order
+    when it was cancelled, None if it was paid or handled meanwhile.
+    """
+    with transaction.atomic():
+        cancelled = Order.objects.filter(
+            pk=order_id, payment_status="pending", order_status="pending"
+        ).exclude(payments__receipt_uploaded_at__isnull=False).update(order_status="cancelled", payment_status="failed", updated_at=timezone.now())
+        if not cancelled:
+            return None
+        order = Order.objects.get(pk=order_id)
+        release_stock(order, statuses=(StockReservation.HELD,))
+    return order
@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+STOP = "bench.stop"
+
+
+async def _serve(first, count, ready, results):
+    layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+    names = [await layer.new_channel() for _ in range(count)]
+    for offset, name in enumerate(names):
+        # What a socket does on connect: the firehose plus its own user group.
+        await layer.group_add("bench_all", name)
+        await layer.group_add(f"bench_user_{first + offset}", name)
+    ready.put(count)
+    latencies = []
+
+    async def consume(name):
+        while True:
+            message = await layer.receive(name)
+            if message["type"] == STOP:
+                return
+            latencies.append((message["phase"], time.time() - message["sent"]))
+
+    await asyncio.gather(*(consume(name) for name in names))
+    results.put(latencies)
+    await layer.flush()
+
+
+def _host(first, count, ready, results):
+    asyncio.run(_serve(first, count, ready, results))
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Measure order-event fan-out through the channel layer to sockets held by several processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=5000, help="Simulated WebSocket consumers.")
+        parser.add_argument("--processes", type=int, default=4, help="Worker processes holding them.")
+        parser.add_argument("--broadcasts", type=int, default=20, help="Messages sent to every socket.")
+
+    def handle(self, *args, **options):
+        sockets = max(1, options["sockets"])
+        processes = max(1, min(options["processes"], sockets))
+        broadcasts = max(1, options["broadcasts"])
+        layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+        if isinstance(layer, InMemoryChannelLayer):
+            raise CommandError("The in-memory channel layer does not cross processes; configure PostgreSQL.")
+
+        context = multiprocessing.get_context("fork")
+        ready = context.Queue()
+        results = context.Queue()
+        # Children must not share the parent's database sockets.
+        connections.close_all()
+        children = []
+        per_process, extra = divmod(sockets, processes)
+        first = 0
+        for index in range(processes):
+            count = per_process + (1 if index < extra else 0)
+            child = context.Process(target=_host, args=(first, count, ready, results), daemon=True)
+            child.start()
+            children.append(child)
+            first += count
+
+        started = time.perf_counter()
+        joined = sum(ready.get(timeout=300) for _ in children)
+        self.stdout.write(f"{joined} sockets joined in {time.perf_counter() - started:.1f}s")
+
+        group_send = async_to_sync(layer.group_send)
+        started = time.perf_counter()
+        for _ in range(broadcasts):
+            group_send("bench_all", {"type": "order.event", "phase": "broadcast", "sent": time.time()})
+        for user in range(sockets):
+            group_send(f"bench_user_{user}", {"type": "order.event", "phase": "targeted", "sent": time.time()})
+        sent_in = time.perf_counter() - started
+        group_send("bench_all", {"type": STOP})
+
+        latencies = []
+        for _ in children:
+            try:
+                latencies.extend(results.get(timeout=120))
+            except queue.Empty:
+                break
+        for child in children:
+            child.join(timeout=10)
+
+        self.stdout.write(f"{broadcasts + sockets} group_send calls in {sent_in:.2f}s")
+        for phase, expected in (("broadcast", broadcasts * sockets), ("targeted", sockets)):
+            values = sorted(latency for name, latency in latencies if name == phase)
+            if not values:
+                self.stdout.write(self.style.ERROR(f"  {phase:<10} no deliveries"))
+                continue
+            self.stdout.write(
+                f"  {phase:<10} {len(values):>8}/{expected:<8} delivered  "
+                f"p50 {_percentile(values, 0.50) * 1000:7.1f} ms  "
+                f"p95 {_percentile(values, 0.95) * 1000:7.1f} ms  "
+                f"max {values[-1] * 1000:7.1f} ms"
+            )
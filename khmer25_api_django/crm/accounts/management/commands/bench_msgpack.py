@@ -0,0 +1,66 @@
+import json
+import time
+import zlib
+from decimal import Decimal
+
+import msgpack
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import Category, Product
+from accounts.renderers import MessagePackRenderer
+from accounts.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare JSON and MessagePack encode time and payload size for ProductSerializer output."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000], help="Product counts.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per renderer; best is reported.")
+
+    def handle(self, *args, **options):
+        repeat = max(1, options["repeat"])
+        request = RequestFactory().get("/api/products/", HTTP_HOST="api.khmer25.test")
+        category = Category(id=1, title_en="Rice", title_kh="Rice")
+        renderers = (("json", JSONRenderer()), ("msgpack", MessagePackRenderer()))
+
+        for count in options["counts"]:
+            # Unsaved instances: serialization and encoding only, no database.
+            products = [
+                Product(
+                    id=index,
+                    category=category,
+                    name=f"Product {index}",
+                    price=Decimal("2.50") + index % 100,
+                    currency="USD",
+                    quantity=index % 50,
+                    tag="hot" if index % 7 == 0 else "",
+                    image=f"products/product_{index}.jpg",
+                )
+                for index in range(1, count + 1)
+            ]
+            data = ProductSerializer(products, many=True, context={"request": request}).data
+
+            self.stdout.write(f"{count} products")
+            sizes = {}
+            for label, renderer in renderers:
+                best = None
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    body = renderer.render(data)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                sizes[label] = len(body)
+                self.stdout.write(
+                    f"  {label:<8} encode {best * 1000:8.1f} ms  "
+                    f"{len(body):>10} bytes  gzip {len(zlib.compress(body, 6)):>9} bytes"
+                )
+            # Both must carry prices as the same exact strings.
+            decoded = msgpack.unpackb(renderers[1][1].render(data), raw=False)
+            if decoded != json.loads(renderers[0][1].render(data)):
+                raise CommandError("JSON and MessagePack payloads differ.")
+            self.stdout.write(
+                self.style.SUCCESS(f"  msgpack is {sizes['msgpack'] / sizes['json']:.0%} of JSON size")
+            )
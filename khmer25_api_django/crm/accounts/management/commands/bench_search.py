@@ -0,0 +1,66 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Category, Product, ProductSearchTerm
+from accounts.search import product_terms, search_product_ids
+
+KHMER_WORDS = ["អង្ករ", "ស្រូវ", "ទឹកដោះគោ", "កាហ្វេ", "តែ", "ស្ករ", "អំបិល", "ប្រេង", "នំបុ័ង", "ស៊ុត", "ត្រី", "សាច់"]
+LATIN_WORDS = ["jasmine", "rice", "milk", "coffee", "green", "tea", "sugar", "salt", "oil", "bread", "egg", "fish"]
+QUERIES = ["jas", "rice", "green tea", "coffee milk", "អង្ករ", "ទឹកដោះ", "កាហ្វេ ទឹកដោះគោ", "ស្រូវ"]
+
+
+class Command(BaseCommand):
+    help = "Time search_product_ids against a synthetic catalog (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000, help="Synthetic products to index.")
+        parser.add_argument("--repeat", type=int, default=20, help="Runs per query.")
+
+    def handle(self, *args, **options):
+        count = max(1, options["products"])
+        repeat = max(1, options["repeat"])
+        rng = random.Random(25)
+        with transaction.atomic():
+            category = Category.objects.create(title_en="Bench groceries", title_kh="គ្រឿងទេស")
+            started = time.perf_counter()
+            for first in range(0, count, 5000):
+                products = Product.objects.bulk_create(
+                    [
+                        Product(
+                            category=category,
+                            name=" ".join(
+                                rng.sample(KHMER_WORDS, 2) + rng.sample(LATIN_WORDS, 2) + [str(index)]
+                            ),
+                            price=Decimal("1.00"),
+                            quantity=1,
+                        )
+                        for index in range(first, min(first + 5000, count))
+                    ]
+                )
+                titles = (category.title_en, category.title_kh)
+                ProductSearchTerm.objects.bulk_create(
+                    [
+                        ProductSearchTerm(product_id=product.pk, term=term, weight=weight)
+                        for product in products
+                        for term, weight in product_terms(product.name, titles).items()
+                    ],
+                    batch_size=5000,
+                )
+            self.stdout.write(f"Indexed {count} products in {time.perf_counter() - started:.1f}s")
+
+            for query in QUERIES:
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    hits = search_product_ids(query)
+                    timings.append(time.perf_counter() - started)
+                timings.sort()
+                self.stdout.write(
+                    f"  {query:<20} {len(hits):>3} hits  "
+                    f"p50 {timings[len(timings) // 2] * 1000:7.2f} ms  max {timings[-1] * 1000:7.2f} ms"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,82 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework import serializers
+
+from accounts.models import Category, Product
+from accounts.serializers import ProductSerializer
+
+
+class LegacyProductSerializer(serializers.ModelSerializer):
+    """
+    ProductSerializer as it was before the shared media resolver: one
+    build_absolute_uri() per file field per row.
+    """
+
+    image_url = serializers.SerializerMethodField()
+    category_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ProductSerializer.Meta.fields
+
+    def get_image_url(self, obj):
+        request = self.context.get("request")
+        if obj.image and hasattr(obj.image, "url"):
+            if request:
+                return request.build_absolute_uri(obj.image.url)
+            return obj.image.url
+        return None
+
+    def get_category_name(self, obj):
+        return ProductSerializer.get_category_name(self, obj)
+
+
+class Command(BaseCommand):
+    help = "Benchmark ProductSerializer media URL rendering against the legacy per-row build_absolute_uri."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000, help="Products to serialize.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per serializer; best is reported.")
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        repeat = max(1, options["repeat"])
+        # Unsaved instances: this measures serialization only, no database.
+        category = Category(id=1, title_en="Rice", title_kh="Rice")
+        products = [
+            Product(
+                id=index,
+                category=category,
+                name=f"Product {index}",
+                price=Decimal("2.50"),
+                currency="USD",
+                quantity=10,
+                tag="",
+                image=f"products/product_{index}.jpg",
+            )
+            for index in range(1, count + 1)
+        ]
+        request = RequestFactory().get("/api/products/", HTTP_HOST="api.khmer25.test")
+
+        results = {}
+        for label, serializer_class in (
+            ("before (build_absolute_uri)", LegacyProductSerializer),
+            ("after (MediaURLResolver)", ProductSerializer),
+        ):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                serializer_class(products, many=True, context={"request": request}).data
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[label] = best
+            self.stdout.write(
+                f"{label:<30} {best * 1000:9.1f} ms  {best / count * 1e6:7.2f} us/row"
+            )
+
+        before, after = results.values()
+        if after:
+            self.stdout.write(self.style.SUCCESS(f"speedup: {before / after:.2f}x for {count} products"))
@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from accounts.telegram import TelegramClient
+from accounts.telegram_stub import StubTelegramServer
+
+
+class Command(BaseCommand):
+    help = "Compare one-connection-per-message requests.post with the pooled Telegram client on a local stub."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000, help="Messages per run.")
+        parser.add_argument("--chats", type=int, default=20, help="Distinct group chats.")
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent senders.")
+        parser.add_argument(
+            "--latency", type=float, default=0.0, help="Seconds the stub waits before answering."
+        )
+
+    def handle(self, *args, **options):
+        messages = max(1, options["messages"])
+        chats = [f"-100{index}" for index in range(max(1, options["chats"]))]
+        threads = max(1, options["threads"])
+
+        with StubTelegramServer(latency=options["latency"]) as stub:
+            url = f"{stub.base_url}/botbench/sendMessage"
+
+            def bare(chat_id, text):
+                response = requests.post(url, json={"chat_id": chat_id, "text": text}, timeout=10)
+                response.raise_for_status()
+
+            # Limits off: this measures transport cost, not Telegram's quotas.
+            client = TelegramClient(
+                "bench",
+                base_url=stub.base_url,
+                pool_size=threads,
+                global_rate=None,
+                group_rate=None,
+                chat_rate=None,
+            )
+            runs = (("requests.post", bare), ("TelegramClient", client.send_message))
+            for label, send in runs:
+                seen = len(stub.connections)
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    list(
+                        executor.map(
+                            lambda index: send(chats[index % len(chats)], f"message {index}"),
+                            range(messages),
+                        )
+                    )
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  {label:<15} {messages / elapsed:9.0f} msg/s  "
+                    f"{elapsed * 1000 / messages:6.2f} ms/msg  "
+                    f"{len(stub.connections) - seen:>6} connections"
+                )
+            client.close()
+
+        group_rate = 20 / 60
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"With Telegram's limits on, {len(chats)} groups sustain "
+                f"{min(30.0, group_rate * len(chats)):.1f} msg/s."
+            )
+        )
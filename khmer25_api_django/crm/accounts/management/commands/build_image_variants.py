@@ -0,0 +1,164 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.db.models.fields.json import KT
+from django.utils import timezone
+
+from accounts.catalog import bump_catalog_version
+from accounts.images import generate_variants, replace_variants, variants_current
+from accounts.models import ImageVariantJob
+from accounts.signals import IMAGE_VARIANT_FIELDS
+
+MODELS = {model._meta.model_name: model for model in IMAGE_VARIANT_FIELDS}
+RETRY_BASE_SECONDS = 30
+# After this many unreadable attempts the file is recorded as done.
+MAX_ATTEMPTS = 6
+
+
+def pending_images(model, force=False):
+    """
+    Rows with an image whose variants are missing or for another file.
+    A full scan, for backfills; --watch follows the ImageVariantJob queue.
+    """
+    field_name, variants_field, _ = IMAGE_VARIANT_FIELDS[model]
+    queryset = model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+    if not force:
+        queryset = queryset.annotate(variants_source=KT(f"{variants_field}__source")).filter(
+            Q(variants_source__isnull=True) | ~Q(variants_source=F(field_name))
+        )
+    return list(queryset.only("pk", field_name, variants_field))
+
+
+def build(field_file):
+    """
+    (variants, error) for one image; runs in worker threads.
+    """
+    try:
+        return generate_variants(field_file), None
+    except OSError as exc:
+        return None, exc
+
+
+def work_queue(mapper=map, batch=100, now=None):
+    """
+    Build the variants of due ImageVariantJobs. Unreadable files are retried
+    with backoff; files that are not images, or still unreadable after
+    MAX_ATTEMPTS, are recorded as done. Returns (built, unreadable, retried).
+    """
+    now = now or timezone.now()
+    jobs = list(ImageVariantJob.objects.filter(next_attempt_at__lte=now).order_by("next_attempt_at", "id")[:batch])
+    finished, work = [], []
+    for name in {job.model for job in jobs}:
+        model = MODELS.get(name)
+        field_name, variants_field, section = IMAGE_VARIANT_FIELDS.get(model, (None, None, None))
+        model_jobs = [job for job in jobs if job.model == name]
+        instances = (
+            model.objects.only("pk", field_name, variants_field).in_bulk([job.object_id for job in model_jobs])
+            if model
+            else {}
+        )
+        for job in model_jobs:
+            instance = instances.get(job.object_id)
+            if instance is None or variants_current(getattr(instance, field_name), getattr(instance, variants_field)):
+                finished.append(job)
+            else:
+                work.append((job, instance, field_name, variants_field, section))
+
+    built = unreadable = retried = 0
+    sections = set()
+    # Threads only decode/resize/write files; rows are updated here.
+    results = mapper(lambda item: build(getattr(item[1], item[2])), work)
+    for (job, instance, field_name, variants_field, section), (variants, error) in zip(work, results):
+        if error is not None and job.attempts + 1 < MAX_ATTEMPTS:
+            ImageVariantJob.objects.filter(pk=job.pk, next_attempt_at=job.next_attempt_at).update(
+                attempts=job.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** job.attempts),
+                last_error=str(error)[:1000],
+            )
+            retried += 1
+            continue
+        if variants is None:
+            # Not an image, or never readable: record it so it is not retried.
+            variants = {"source": getattr(instance, field_name).name}
+            unreadable += 1
+        else:
+            built += 1
+        replace_variants(instance, field_name, variants_field, variants)
+        sections.add(section)
+        finished.append(job)
+
+    for section in sections - {None}:
+        bump_catalog_version(section)
+    for job in finished:
+        # A job re-queued meanwhile (a newer upload) has a new due time; keep it.
+        ImageVariantJob.objects.filter(pk=job.pk, next_attempt_at=job.next_attempt_at).delete()
+    return built, unreadable, retried
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants for product, category, banner and avatar images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            action="append",
+            choices=sorted(MODELS),
+            help="Only process this model (repeatable). Defaults to all.",
+        )
+        parser.add_argument("--workers", type=int, default=4, help="Parallel resize threads.")
+        parser.add_argument("--force", action="store_true", help="Rebuild variants that look current.")
+        parser.add_argument(
+            "--watch", action="store_true", help="Keep running and build variants for queued uploads."
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5.0, help="Seconds to wait when the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        names = options["model"] or sorted(MODELS)
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as executor:
+            if not options["watch"]:
+                self._scan(executor, names, options["force"])
+                self.stdout.write(self.style.SUCCESS("Image variants up to date."))
+                return
+            while True:
+                close_old_connections()
+                built, unreadable, retried = work_queue(executor.map)
+                if built or unreadable or retried:
+                    self.stdout.write(f"{built} built, {unreadable} unreadable, {retried} to retry")
+                else:
+                    time.sleep(options["interval"])
+
+    def _scan(self, executor, names, force):
+        for name in names:
+            model = MODELS[name]
+            field_name, variants_field, section = IMAGE_VARIANT_FIELDS[model]
+            pending = pending_images(model, force)
+            if not pending:
+                self.stdout.write(f"{name}: up to date")
+                continue
+
+            built = unreadable = failed = 0
+            # Threads only decode/resize/write files; rows are updated here.
+            results = executor.map(lambda obj: build(getattr(obj, field_name)), pending)
+            for instance, (variants, error) in zip(pending, results):
+                if error is not None:
+                    # Possibly a half-written upload: leave it for a later run.
+                    failed += 1
+                    self.stderr.write(f"{name} {instance.pk}: {error}")
+                    continue
+                if variants is None:
+                    unreadable += 1
+                    # Recorded as done, so a file that is not an image is not
+                    # retried every run; --force tries again.
+                    variants = {"source": getattr(instance, field_name).name}
+                else:
+                    built += 1
+                replace_variants(instance, field_name, variants_field, variants)
+            if section:
+                bump_catalog_version(section)
+            self.stdout.write(f"{name}: {built} built, {unreadable} unreadable, {failed} failed")
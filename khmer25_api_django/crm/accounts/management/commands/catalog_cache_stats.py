@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from accounts.catalog import get_response_cache_stats, reset_response_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters for the catalog list response cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        stats = get_response_cache_stats()
+        total = stats["hits"] + stats["misses"]
+        ratio = (stats["hits"] / total * 100) if total else 0
+        self.stdout.write(f"hits={stats['hits']} misses={stats['misses']} hit_ratio={ratio:.1f}%")
+        if options["reset"]:
+            reset_response_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
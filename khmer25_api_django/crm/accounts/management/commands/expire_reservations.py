@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.inventory import expire_order, expired_order_ids
+from accounts.views import _broadcast_order_event
+
+
+class Command(BaseCommand):
+    help = "Cancel unpaid QR/PayWay orders whose stock reservation has expired and restock them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="List the orders without changing them.")
+        parser.add_argument(
+            "--loop",
+            type=int,
+            default=0,
+            metavar="SECONDS",
+            help="Keep running, sweeping every SECONDS (for a worker process).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self._sweep(options["dry_run"])
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
+
+    def _sweep(self, dry_run):
+        order_ids = expired_order_ids()
+        if dry_run:
+            self.stdout.write(f"{len(order_ids)} expired orders: {', '.join(map(str, order_ids))}")
+            return
+        expired = 0
+        for order_id in order_ids:
+            order = expire_order(order_id)
+            if order is None:
+                continue
+            _broadcast_order_event(order, "expired")
+            expired += 1
+        self.stdout.write(self.style.SUCCESS(f"{expired} orders expired and restocked."))
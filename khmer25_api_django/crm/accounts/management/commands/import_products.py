@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importer import ImportFileError, import_products
+
+
+class Command(BaseCommand):
+    help = "Upsert products from a CSV or XLSX file keyed on sku."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or XLSX file.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--no-index",
+            action="store_true",
+            help="Skip search indexing; run rebuild_search_index afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options["path"], "rb") as handle:
+                result = import_products(
+                    handle,
+                    options["path"],
+                    batch_size=max(1, options["batch_size"]),
+                    reindex=not options["no_index"],
+                )
+        except (OSError, ImportFileError) as exc:
+            raise CommandError(str(exc))
+        for row_number, message in result.errors:
+            self.stderr.write(f"row {row_number}: {message}")
+        if result.failed > len(result.errors):
+            self.stderr.write(f"... {result.failed - len(result.errors)} more errors not shown")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{result.rows} rows read, {result.imported} products upserted, "
+                f"{result.failed} rows failed in {elapsed:.1f}s."
+            )
+        )
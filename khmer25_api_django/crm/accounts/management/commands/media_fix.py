@@ -1,11 +1,30 @@
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
 from django.core.files import File
 from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
-
-from accounts.models import Banner, Category, Product
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.catalog import bump_catalog_version
+from accounts.images import VARIANT_FORMATS
+from accounts.models import AdminProfile, Banner, Category, MediaManifest, Payment, Product, User
+from accounts.signals import IMAGE_VARIANT_FIELDS
+from accounts.storage import HashedMediaStorage, is_hashed_name
+
+# (model, file field, catalog section) for --hash-names.
+HASHED_FIELDS = (
+    (Category, "image", "category"),
+    (Product, "image", "product"),
+    (Banner, "image", "banner"),
+    (User, "avatar", None),
+    (AdminProfile, "avatar", None),
+    (Payment, "receipt_image", None),
+)
+# Files stored this recently may belong to a row that is not committed yet.
+PRUNE_GRACE = timedelta(days=1)
 
 
 class Command(BaseCommand):
@@ -27,13 +46,25 @@ class Command(BaseCommand):
             action="store_true",
             help="Clear image fields that reference missing files.",
         )
+        parser.add_argument(
+            "--hash-names",
+            action="store_true",
+            help="Move referenced media into the content-hashed layout (MEDIA_HASHED_STORAGE).",
+        )
+        parser.add_argument(
+            "--prune-hashed",
+            action="store_true",
+            help="Delete content-hashed files that no image field or variant references.",
+        )
 
     def handle(self, *args, **options):
         copy_bundled = options["copy_bundled"]
         report = options["report"]
         clear_missing = options["clear_missing"]
+        hash_names = options["hash_names"]
+        prune_hashed = options["prune_hashed"]
 
-        if not (copy_bundled or report or clear_missing):
+        if not (copy_bundled or report or clear_missing or hash_names or prune_hashed):
             copy_bundled = report = clear_missing = True
 
         bundled_root = Path(settings.BASE_DIR) / "media"
@@ -50,6 +81,12 @@ class Command(BaseCommand):
         if clear_missing and missing:
             self._clear_missing(missing)
 
+        if hash_names:
+            self._hash_names()
+
+        if prune_hashed:
+            self._prune_hashed()
+
         self.stdout.write(self.style.SUCCESS("Media fix completed."))
 
     def _copy_bundled_media(self, bundled_root: Path) -> None:
@@ -115,3 +152,66 @@ class Command(BaseCommand):
         if missing["banners"]:
             ids = [item_id for item_id, _ in missing["banners"]]
             Banner.objects.filter(id__in=ids).update(image="")
+        # Bulk updates bypass the model signals that version the catalog.
+        bump_catalog_version("category", "product", "banner")
+
+    def _hash_names(self):
+        if isinstance(default_storage, HashedMediaStorage):
+            storage = default_storage
+        else:
+            storage = HashedMediaStorage()
+        renamed = {}
+        for model, field_name, section in HASHED_FIELDS:
+            rows = (
+                model.objects.exclude(**{field_name: ""})
+                .exclude(**{f"{field_name}__isnull": True})
+                .values_list("pk", field_name)
+            )
+            moved = 0
+            for pk, name in rows.iterator():
+                if is_hashed_name(name):
+                    continue
+                if name not in renamed:
+                    if not default_storage.exists(name):
+                        continue
+                    with default_storage.open(name, "rb") as handle:
+                        renamed[name] = storage.save(name, File(handle))
+                model.objects.filter(pk=pk).update(**{field_name: renamed[name]})
+                moved += 1
+            if moved and section:
+                bump_catalog_version(section)
+            self.stdout.write(f"{model._meta.model_name}.{field_name}: {moved} rows moved to hashed names.")
+        # Original files stay in place for URLs already handed out.
+        if renamed:
+            self.stdout.write("Run build_image_variants to regenerate variants for the new names.")
+
+    def _referenced_names(self):
+        names = set()
+        for model, field_name, _ in HASHED_FIELDS:
+            names.update(model.objects.exclude(**{field_name: ""}).values_list(field_name, flat=True))
+        for model, (_, variants_field, _) in IMAGE_VARIANT_FIELDS.items():
+            for variants in model.objects.values_list(variants_field, flat=True).iterator():
+                for key in VARIANT_FORMATS:
+                    names.update((variants or {}).get(key, {}).values())
+        names.discard(None)
+        return names
+
+    def _prune_hashed(self):
+        if isinstance(default_storage, HashedMediaStorage):
+            storage = default_storage
+        else:
+            storage = HashedMediaStorage()
+        referenced = self._referenced_names()
+        candidates = (
+            MediaManifest.objects.values("hashed_name")
+            .annotate(last_stored=Max("created_at"))
+            .filter(last_stored__lt=timezone.now() - PRUNE_GRACE)
+            .values_list("hashed_name", flat=True)
+        )
+        pruned = 0
+        for name in list(candidates):
+            if name in referenced:
+                continue
+            storage.purge(name)
+            pruned += 1
+        self.stdout.write(f"Pruned {pruned} unreferenced hashed files.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses that have expired."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} expired idempotency records deleted."))
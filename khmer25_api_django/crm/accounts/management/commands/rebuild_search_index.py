@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Product, ProductSearchTerm
+from accounts.search import index_products
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index from Product and Category data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        ProductSearchTerm.objects.all().delete()
+        indexed = 0
+        batch = []
+        for product in Product.objects.select_related("category").order_by("id").iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                index_products(batch)
+                indexed += len(batch)
+                batch = []
+        index_products(batch)
+        indexed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts.counters import recount_categories
+
+
+class Command(BaseCommand):
+    help = "Recompute Category product_count/in_stock_count/sub_count from Product rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("category_ids", nargs="*", type=int, help="Limit to these categories.")
+
+    def handle(self, *args, **options):
+        drifted = recount_categories(options["category_ids"] or None)
+        for category_id, (old, new) in sorted(drifted.items()):
+            self.stdout.write(
+                f"category {category_id}: products {old[0]} -> {new[0]}, "
+                f"in stock {old[1]} -> {new[1]}, sub_count {old[2]} -> {new[2]}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(drifted)} categories corrected."))
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.outbox import (
+    CLAIM_RENEW_SECONDS,
+    cached_file_ids,
+    claim,
+    due_jobs,
+    purge_sent,
+    record_outcome,
+    release_stale_claims,
+    release_unsent,
+    renew_claims,
+    send_chat,
+)
+
+PURGE_EVERY_SECONDS = 3600
+
+
+class Command(BaseCommand):
+    help = "Deliver queued Telegram notifications from the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Chats sent to in parallel.")
+        parser.add_argument(
+            "--interval", type=float, default=1.0, help="Seconds to wait when the outbox is empty."
+        )
+        parser.add_argument("--batch", type=int, default=500, help="Jobs read per round.")
+        parser.add_argument("--once", action="store_true", help="Deliver one round and exit.")
+
+    def handle(self, *args, **options):
+        retention_days = getattr(settings, "OUTBOX_RETENTION_DAYS", 7)
+        last_purge = 0.0
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as executor:
+            while True:
+                close_old_connections()
+                if time.monotonic() - last_purge > PURGE_EVERY_SECONDS:
+                    purge_sent(retention_days)
+                    last_purge = time.monotonic()
+                sent, failed = self._round(executor, options["batch"])
+                if sent or failed:
+                    self.stdout.write(f"{sent} sent, {failed} failed")
+                if options["once"]:
+                    break
+                if not (sent or failed):
+                    time.sleep(options["interval"])
+
+    def _round(self, executor, batch):
+        release_stale_claims()
+        batches = [jobs for jobs in map(claim, due_jobs(batch).values()) if jobs]
+        file_ids = cached_file_ids([job for jobs in batches for job in jobs])
+        running = {executor.submit(send_chat, jobs, file_ids): jobs for jobs in batches}
+        sent = failed = 0
+        renewed = time.monotonic()
+        while running:
+            done, _ = wait(running, timeout=CLAIM_RENEW_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                jobs = running.pop(future)
+                outcomes = future.result()
+                for job, result, error in outcomes:
+                    record_outcome(job, result, error)
+                    if error is None:
+                        sent += 1
+                    else:
+                        failed += 1
+                release_unsent(jobs[len(outcomes):])
+            if running and time.monotonic() - renewed >= CLAIM_RENEW_SECONDS:
+                # Rate-limited chats can outlast CLAIM_TIMEOUT; without this
+                # another worker would release and resend their jobs.
+                renew_claims([job for jobs in running.values() for job in jobs])
+                renewed = time.monotonic()
+        return sent, failed
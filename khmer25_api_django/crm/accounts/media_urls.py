@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import models
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+
+from .images import variant_urls, variants_current
+
+
+class MediaURLResolver:
+    """
+    Turns stored file names into absolute media URLs.
+
+    The absolute prefix (settings.MEDIA_BASE_URL, or the request host plus
+    the storage base URL) is computed once per storage, and each file is a
+    string join instead of a build_absolute_uri() call per row.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.base_url = getattr(settings, "MEDIA_BASE_URL", "") or ""
+        self._prefixes = {}
+
+    def url(self, field_file):
+        if not field_file:
+            return None
+        return self.name_url(field_file.name, field_file.storage)
+
+    def name_url(self, name, storage=None):
+        """
+        URL for a stored file name, e.g. an image variant kept in a JSONField.
+        """
+        if not name:
+            return None
+        storage = storage or default_storage
+        prefix = self._prefix_for(storage)
+        if prefix is None:
+            # Remote storages (S3 etc.) sign or route URLs themselves.
+            return self._absolute(storage.url(name))
+        return prefix + filepath_to_uri(name).lstrip("/")
+
+    def _prefix_for(self, storage):
+        key = id(storage)
+        if key not in self._prefixes:
+            prefix = None
+            if isinstance(storage, FileSystemStorage):
+                if self.base_url:
+                    prefix = self.base_url
+                else:
+                    prefix = self._absolute(storage.base_url or settings.MEDIA_URL)
+                if not prefix.endswith("/"):
+                    prefix += "/"
+            self._prefixes[key] = prefix
+        return self._prefixes[key]
+
+    def _absolute(self, url):
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+
+def get_media_resolver(context):
+    """
+    Resolver shared by every serializer rendered with ``context``; list
+    serializers hand their children the same context dict.
+    """
+    resolver = context.get("media_resolver")
+    if resolver is None:
+        resolver = MediaURLResolver(context.get("request"))
+        context["media_resolver"] = resolver
+    return resolver
+
+
+class MediaFileField(serializers.FileField):
+    def to_representation(self, value):
+        if not value:
+            return None
+        if not getattr(self, "use_url", True):
+            return value.name
+        return get_media_resolver(self.context).url(value)
+
+
+class MediaImageField(serializers.ImageField):
+    def to_representation(self, value):
+        if not value:
+            return None
+        if not getattr(self, "use_url", True):
+            return value.name
+        return get_media_resolver(self.context).url(value)
+
+
+class MediaURLMixin:
+    """
+    ModelSerializer mixin: file/image model fields render through the shared
+    resolver, and ``media_url()`` does the same for SerializerMethodFields.
+    """
+
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FileField: MediaFileField,
+        models.ImageField: MediaImageField,
+    }
+
+    def media_url(self, field_file):
+        return get_media_resolver(self.context).url(field_file)
+
+    def media_variants(self, field_file, variants):
+        """
+        Variant URLs for ``field_file``; empty while they are stale or missing.
+        """
+        if not variants_current(field_file, variants):
+            return {}
+        resolver = get_media_resolver(self.context)
+        storage = field_file.storage
+        return variant_urls(variants, lambda name: resolver.name_url(name, storage))
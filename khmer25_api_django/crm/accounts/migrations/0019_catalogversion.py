@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+def seed_sections(apps, schema_editor):
+    CatalogVersion = apps.get_model("accounts", "CatalogVersion")
+    for section in ("product", "category", "banner"):
+        CatalogVersion.objects.get_or_create(section=section, defaults={"version": 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0018_product_date_id_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("section", models.CharField(max_length=20, unique=True)),
+                ("version", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sections, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,131 @@
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# A frozen copy of accounts.search's tokenizer as it was when this migration
+# was written, so later changes there do not change what it backfills.
+# `manage.py rebuild_search_index` reindexes with the current rules.
+NAME_WEIGHT = 6
+CATEGORY_WEIGHT = 2
+MAX_TERM_LENGTH = 64
+MIN_PREFIX = 2
+MAX_PREFIX = 20
+COENG = "\u17d2"
+KHMER_DIGITS = {chr(0x17E0 + digit): str(digit) for digit in range(10)}
+
+
+def _is_khmer_base(char):
+    return "\u1780" <= char <= "\u17b3"
+
+
+def _is_khmer_mark(char):
+    return "\u17b4" <= char <= "\u17d3" or char == "\u17dd"
+
+
+def _khmer_clusters(run):
+    clusters = []
+    for index, char in enumerate(run):
+        previous = run[index - 1] if index else ""
+        if clusters and (_is_khmer_mark(char) or previous == COENG):
+            clusters[-1] += char
+        elif _is_khmer_base(char):
+            clusters.append(char)
+    return clusters
+
+
+def _runs(text):
+    text = unicodedata.normalize("NFC", text or "").casefold()
+    kind, buffer = None, []
+    for char in text:
+        char = KHMER_DIGITS.get(char, char)
+        if _is_khmer_base(char) or _is_khmer_mark(char):
+            char_kind = "khmer"
+        elif char.isalnum():
+            char_kind = "word"
+        else:
+            char_kind = None
+        if char_kind != kind and buffer:
+            yield kind, "".join(buffer)
+            buffer = []
+        kind = char_kind
+        if char_kind:
+            buffer.append(char)
+    if buffer and kind:
+        yield kind, "".join(buffer)
+
+
+def _index_terms(text, weight):
+    terms = {}
+
+    def add(term, term_weight):
+        term = term[:MAX_TERM_LENGTH]
+        if term_weight > terms.get(term, 0):
+            terms[term] = term_weight
+
+    for kind, run in _runs(text):
+        if kind == "word":
+            add(run, weight)
+            for length in range(MIN_PREFIX, min(len(run), MAX_PREFIX + 1)):
+                add(run[:length], weight // 2 or 1)
+        else:
+            clusters = _khmer_clusters(run)
+            for cluster in clusters:
+                add(cluster, weight // 2 or 1)
+            for first, second in zip(clusters, clusters[1:]):
+                add(first + second, weight)
+    return terms
+
+
+def _product_terms(name, category_titles):
+    terms = _index_terms(name, NAME_WEIGHT)
+    for title in category_titles:
+        for term, weight in _index_terms(title, CATEGORY_WEIGHT).items():
+            terms[term] = max(weight, terms.get(term, 0))
+    return terms
+
+
+def build_index(apps, schema_editor):
+    Product = apps.get_model("accounts", "Product")
+    ProductSearchTerm = apps.get_model("accounts", "ProductSearchTerm")
+    rows = []
+    for product in Product.objects.select_related("category").iterator(chunk_size=500):
+        titles = (product.category.title_en, product.category.title_kh) if product.category else ()
+        for term, weight in _product_terms(product.name, titles).items():
+            rows.append(ProductSearchTerm(product_id=product.pk, term=term, weight=weight))
+        if len(rows) >= 5000:
+            ProductSearchTerm.objects.bulk_create(rows)
+            rows = []
+    ProductSearchTerm.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0019_catalogversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchTerm",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("term", models.CharField(max_length=64)),
+                ("weight", models.PositiveSmallIntegerField(default=1)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_terms",
+                        to="accounts.product",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("term", "product"), name="search_term_product_uniq"),
+                ],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
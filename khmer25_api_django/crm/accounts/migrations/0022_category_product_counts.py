@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def recount(apps, schema_editor):
+    Category = apps.get_model("accounts", "Category")
+    Product = apps.get_model("accounts", "Product")
+    totals = {
+        row["category_id"]: (row["total"], row["in_stock"])
+        for row in Product.objects.values("category_id").annotate(
+            total=Count("id"), in_stock=Count("id", filter=Q(quantity__gt=0))
+        )
+    }
+    categories = list(Category.objects.all())
+    for category in categories:
+        total, in_stock = totals.get(category.pk, (0, 0))
+        category.product_count = total
+        category.in_stock_count = in_stock
+        category.sub_count = total
+    Category.objects.bulk_update(categories, ["product_count", "in_stock_count", "sub_count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0021_product_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="product_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="in_stock_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(recount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0026_stockreservation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderCodeCounter",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("year", models.PositiveIntegerField(unique=True)),
+                ("last_value", models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
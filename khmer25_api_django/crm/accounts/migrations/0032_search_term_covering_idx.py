@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0031_telegramfile"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productsearchterm",
+            index=models.Index(fields=["term", "product", "weight"], name="search_term_covering_idx"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0032_search_term_covering_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(model_name="product", name="product_category_id_idx"),
+        migrations.RemoveIndex(model_name="product", name="product_tag_id_idx"),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["category", "product_date", "id"], name="product_category_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["tag", "product_date", "id"], name="product_tag_date_idx"),
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+TABLE = "accounts_productsearchterm"
+
+
+def _sql(schema_editor, *statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def use_covering_constraint(apps, schema_editor):
+    quote = schema_editor.quote_name
+    _sql(schema_editor, f"DROP INDEX {quote('search_term_covering_idx')}")
+    # Only PostgreSQL has INCLUDE; elsewhere the plain constraint stays.
+    if schema_editor.connection.vendor == "postgresql":
+        _sql(
+            schema_editor,
+            f"ALTER TABLE {quote(TABLE)} DROP CONSTRAINT {quote('search_term_product_uniq')}",
+            f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote('search_term_product_uniq')} "
+            f"UNIQUE ({quote('term')}, {quote('product_id')}) INCLUDE ({quote('weight')})",
+        )
+
+
+def use_covering_index(apps, schema_editor):
+    quote = schema_editor.quote_name
+    if schema_editor.connection.vendor == "postgresql":
+        _sql(
+            schema_editor,
+            f"ALTER TABLE {quote(TABLE)} DROP CONSTRAINT {quote('search_term_product_uniq')}",
+            f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote('search_term_product_uniq')} "
+            f"UNIQUE ({quote('term')}, {quote('product_id')})",
+        )
+    _sql(
+        schema_editor,
+        f"CREATE INDEX {quote('search_term_covering_idx')} ON {quote(TABLE)} "
+        f"({quote('term')}, {quote('product_id')}, {quote('weight')})",
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0033_product_filter_date_indexes"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(model_name="productsearchterm", name="search_term_covering_idx"),
+                migrations.RemoveConstraint(model_name="productsearchterm", name="search_term_product_uniq"),
+                migrations.AddConstraint(
+                    model_name="productsearchterm",
+                    constraint=models.UniqueConstraint(
+                        fields=["term", "product"], include=["weight"], name="search_term_product_uniq"
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(use_covering_constraint, use_covering_index),
+            ],
+        ),
+    ]
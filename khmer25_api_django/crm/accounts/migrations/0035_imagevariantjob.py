@@ -0,0 +1,62 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Q
+from django.db.models.fields.json import KT
+
+# (model, image field, variants field), as in accounts.signals.IMAGE_VARIANT_FIELDS.
+IMAGE_FIELDS = [
+    ("product", "image", "image_variants"),
+    ("category", "image", "image_variants"),
+    ("banner", "image", "image_variants"),
+    ("user", "avatar", "avatar_variants"),
+]
+
+
+def queue_pending_images(apps, schema_editor):
+    """
+    The worker now follows the queue instead of scanning; queue the images
+    that were still waiting for their variants.
+    """
+    ImageVariantJob = apps.get_model("accounts", "ImageVariantJob")
+    for model_name, field_name, variants_field in IMAGE_FIELDS:
+        model = apps.get_model("accounts", model_name)
+        pending = (
+            model.objects.exclude(**{field_name: ""})
+            .exclude(**{f"{field_name}__isnull": True})
+            .annotate(variants_source=KT(f"{variants_field}__source"))
+            .filter(Q(variants_source__isnull=True) | ~Q(variants_source=F(field_name)))
+            .values_list("pk", flat=True)
+        )
+        ImageVariantJob.objects.bulk_create(
+            (ImageVariantJob(model=model_name, object_id=pk) for pk in pending.iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0034_search_term_covering_constraint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageVariantJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model", models.CharField(max_length=50)),
+                ("object_id", models.BigIntegerField()),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("next_attempt_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["next_attempt_at", "id"], name="image_job_due_idx")],
+                "constraints": [
+                    models.UniqueConstraint(fields=("model", "object_id"), name="image_job_object_uniq")
+                ],
+            },
+        ),
+        migrations.RunPython(queue_pending_images, migrations.RunPython.noop),
+    ]
@@ -8,7 +8,12 @@ class Category(models.Model):
     title_en = models.CharField(max_length=100)
     title_kh = models.CharField(max_length=100)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Resized copies of ``image``; see accounts.images.
+    image_variants = models.JSONField(default=dict, blank=True)
     sub_count = models.IntegerField(default=0)
+    # Maintained by accounts.counters; repair with `manage.py recount_categories`.
+    product_count = models.IntegerField(default=0)
+    in_stock_count = models.IntegerField(default=0)
 
     def __str__(self):
         return self.title_en
@@ -26,18 +31,59 @@ class Product(models.Model):
         ("discount", "Discount"),
     ]
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
+    # Merchant stock-keeping unit; the upsert key for bulk imports.
+    sku = models.CharField(max_length=64, unique=True, blank=True, null=True)
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default="USD")
     quantity = models.PositiveIntegerField()
     tag = models.CharField(max_length=20, choices=TAG_CHOICES, blank=True, default="")
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True)
     payway_link = models.URLField(blank=True, null=True)
     supplier_id = models.IntegerField(blank=True, null=True)
     product_date = models.DateField(auto_now_add=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the category counters last saw for this row.
+        loaded = dict(zip(field_names, values))
+        if "category_id" in loaded and "quantity" in loaded:
+            instance._counted_state = (loaded["category_id"], loaded["quantity"])
+        return instance
+
+    class Meta:
+        indexes = [
+            # Keyset pagination walks (product_date, id) for "newest first".
+            models.Index(fields=["product_date", "id"], name="product_date_id_idx"),
+            # List filters (accounts.filters.ProductFilterBackend), in the
+            # default "newest" order so a filtered page needs no sort.
+            models.Index(fields=["category", "product_date", "id"], name="product_category_date_idx"),
+            models.Index(fields=["tag", "product_date", "id"], name="product_tag_date_idx"),
+            models.Index(fields=["currency", "price"], name="product_currency_price_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
+class ProductSearchTerm(models.Model):
+    """
+    Inverted index posting for product search: one row per (term, product).
+    Kept current by signals; rebuild with ``manage.py rebuild_search_index``.
+    """
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, related_name="search_terms", on_delete=models.CASCADE)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            # Covering on PostgreSQL, so search sums weights from the index alone.
+            models.UniqueConstraint(
+                fields=["term", "product"], include=["weight"], name="search_term_product_uniq"
+            ),
+        ]
+
 # models.py
 
 
@@ -47,6 +93,7 @@ class User(models.Model):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True)
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
+    avatar_variants = models.JSONField(default=dict, blank=True)
 
 
 
@@ -115,15 +162,31 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Order history: one user's orders, newest first, keyset-paginated.
+            models.Index(fields=["user", "created_at", "id"], name="order_user_created_idx"),
+        ]
+
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
+        # Assign the human-readable order code in the same INSERT.
+        if self._state.adding and not self.order_code:
+            from .order_codes import allocate_order_code
+
+            self.order_code = allocate_order_code()
         super().save(*args, **kwargs)
-        # Generate a human-readable order code after we have a primary key
-        if is_new and not self.order_code:
-            from django.utils import timezone
 
-            self.order_code = f"ORD-{timezone.now().year}-{self.pk:04d}"
-            super().save(update_fields=["order_code"])
+
+class OrderCodeCounter(models.Model):
+    """
+    Last order number issued per year, for databases without sequences
+    (see accounts.order_codes).
+    """
+    year = models.PositiveIntegerField(unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.year}: {self.last_value}"
 
 
 class OrderItem(models.Model):
@@ -146,6 +209,38 @@ class OrderItem(models.Model):
         super().save(*args, **kwargs)
 
 
+class StockReservation(models.Model):
+    """
+    Units taken from ``Product.quantity`` for an order (see accounts.inventory).
+    Held reservations of unpaid orders expire and go back on the shelf.
+    """
+    HELD = "held"
+    COMMITTED = "committed"
+    RELEASED = "released"
+    STATUS_CHOICES = [
+        (HELD, "Held"),
+        (COMMITTED, "Committed"),
+        (RELEASED, "Released"),
+    ]
+
+    order = models.ForeignKey(Order, related_name="stock_reservations", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name="stock_reservations", on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # The sweeper scans held reservations by expiry.
+            models.Index(fields=["status", "expires_at"], name="reservation_status_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} for order {self.order_id} ({self.status})"
+
+
 class Payment(models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
@@ -210,6 +305,31 @@ class PaymentTransaction(models.Model):
         ordering = ["-created_at"]
 
 
+class IdempotencyRecord(models.Model):
+    """
+    Stored outcome of a POST sent with an ``Idempotency-Key`` header, replayed
+    for retries of the same request until ``expires_at`` (see
+    accounts.idempotency). ``status_code`` is null while the first request
+    is still running.
+    """
+    user = models.ForeignKey(User, related_name="idempotency_records", on_delete=models.CASCADE)
+    scope = models.CharField(max_length=40)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "scope", "key"], name="idempotency_user_scope_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status_code or 'in progress'})"
+
+
 
 
 
@@ -220,8 +340,126 @@ class PaymentTransaction(models.Model):
 
 
 
+class NotificationJob(models.Model):
+    """
+    A Telegram Bot API call queued by a request and delivered by
+    ``manage.py run_outbox_worker`` (see accounts.outbox). Jobs for the same
+    chat are delivered in id order.
+    """
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    chat_id = models.CharField(max_length=64)
+    method = models.CharField(max_length=40)
+    payload = models.JSONField(default=dict, blank=True)
+    # Media file uploaded as the photo of a sendPhoto call.
+    attachment = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # The worker scans unsent jobs oldest first.
+            models.Index(fields=["status", "id"], name="notification_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.method} to {self.chat_id} ({self.status})"
+
+
+class ImageVariantJob(models.Model):
+    """
+    An uploaded image whose resized variants are still to be built (see
+    accounts.images). Queued by the save signal in the upload's transaction
+    and worked off by ``manage.py build_image_variants --watch``; one row
+    per object, deleted once its variants are stored.
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["model", "object_id"], name="image_job_object_uniq"),
+        ]
+        indexes = [
+            # The worker takes due jobs, oldest first.
+            models.Index(fields=["next_attempt_at", "id"], name="image_job_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} (attempt {self.attempts})"
+
+
+class TelegramFile(models.Model):
+    """
+    Telegram ``file_id`` of a media file the bot has already uploaded, sent
+    instead of the bytes on later messages (see accounts.outbox).
+    """
+    name = models.CharField(max_length=255, unique=True)
+    file_id = models.CharField(max_length=255)
+    file_size = models.PositiveIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class CatalogVersion(models.Model):
+    """
+    Change counter per catalog section ("product", "category", "banner").
+    Bumped on every write so list endpoints can answer conditional GETs
+    without reading any catalog rows.
+    """
+    section = models.CharField(max_length=20, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.section} v{self.version}"
+
+
+class MediaManifest(models.Model):
+    """
+    Upload name -> content-addressed file written by HashedMediaStorage.
+    Identical uploads share one file, so one hashed name can have many rows.
+    """
+    original_name = models.CharField(max_length=255)
+    hashed_name = models.CharField(max_length=255, db_index=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["original_name", "hashed_name"], name="media_manifest_pair_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.original_name} -> {self.hashed_name}"
+
+
 class Banner(models.Model):
     image = models.ImageField(upload_to="banners/")
+    image_variants = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Banner {self.pk}"
@@ -0,0 +1,92 @@
+"""
+Order code allocation (``ORD-<year>-<n:04d>``) before the Order INSERT.
+
+On PostgreSQL each year has its own sequence, ``order_code_seq_<year>``,
+created on first use and started after the highest code already issued
+that year. ``nextval()`` never blocks and is not rolled back, so concurrent
+checkouts never wait on each other; an aborted checkout leaves a gap, which
+is fine for a reference number. Other databases (SQLite in development) use
+an ``OrderCodeCounter`` row per year incremented with ``F()``.
+"""
+import re
+
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OrderCodeCounter
+
+SEQUENCE_NAME = "order_code_seq_%d"
+_known_sequences = set()
+
+
+def format_order_code(year, number):
+    return f"ORD-{year}-{number:04d}"
+
+
+def _highest_issued(year):
+    """
+    Largest number already used in ``year``'s codes (older codes embed the pk).
+    """
+    pattern = re.compile(r"^ORD-%d-(\d+)$" % year)
+    highest = 0
+    codes = Order.objects.filter(order_code__startswith=f"ORD-{year}-").values_list(
+        "order_code", flat=True
+    )
+    for code in codes.iterator():
+        match = pattern.match(code)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+
+def _ensure_sequence(year):
+    if year in _known_sequences:
+        return
+    name = SEQUENCE_NAME % year
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_class WHERE relkind = 'S' AND relname = %s", [name])
+        exists = cursor.fetchone() is not None
+    if exists:
+        _known_sequences.add(year)
+        return
+    start = _highest_issued(year) + 1
+    try:
+        # Savepoint: a concurrent creator winning the race must not abort
+        # the surrounding checkout transaction.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {name} START WITH {int(start)}")
+    except DatabaseError:
+        pass
+    # The CREATE is transactional; only trust it once it is committed.
+    transaction.on_commit(lambda: _known_sequences.add(year))
+
+
+def _next_from_sequence(year):
+    _ensure_sequence(year)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [SEQUENCE_NAME % year])
+        return cursor.fetchone()[0]
+
+
+def _next_from_counter(year):
+    with transaction.atomic():
+        updated = OrderCodeCounter.objects.filter(year=year).update(last_value=F("last_value") + 1)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    OrderCodeCounter.objects.create(year=year, last_value=_highest_issued(year) + 1)
+            except IntegrityError:
+                # Created concurrently; take the next value from it.
+                OrderCodeCounter.objects.filter(year=year).update(last_value=F("last_value") + 1)
+        return OrderCodeCounter.objects.values_list("last_value", flat=True).get(year=year)
+
+
+def allocate_order_code(now=None):
+    year = (now or timezone.now()).year
+    if connection.vendor == "postgresql":
+        number = _next_from_sequence(year)
+    else:
+        number = _next_from_counter(year)
+    return format_order_code(year, number)
@@ -0,0 +1,113 @@
+"""
+Order placement for the mobile checkout (``OrderViewSet.create``).
+
+Prices come from the database, never from the client. All products are
+fetched with one ``in_bulk`` query, items are inserted with one
+``bulk_create``, and the whole order is a single transaction, so a bad line
+leaves nothing behind. Stock is reserved in the same transaction (see
+accounts.inventory).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .inventory import reservation_expiry, reserve_stock
+from .models import Order, OrderItem, Payment, Product
+
+
+class OrderInputError(Exception):
+    """
+    The checkout payload cannot become an order; the message is client-safe.
+    """
+
+
+def parse_order_lines(items):
+    """
+    [(product_id, quantity)] from the client's item dicts. Lines with a
+    non-positive quantity are dropped, as before.
+    """
+    lines = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise OrderInputError(f"Invalid item {item}")
+        try:
+            quantity = int(item.get("qty") or item.get("quantity") or 0)
+        except (TypeError, ValueError):
+            raise OrderInputError(f"Invalid quantity in item {item}")
+        if quantity <= 0:
+            continue
+        try:
+            product_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            raise OrderInputError(f"Product not found for item {item}")
+        lines.append((product_id, quantity))
+    return lines
+
+
+def create_order(lines, **order_fields):
+    """
+    Create an ``Order`` and its items from ``lines`` priced at the current
+    product prices. ``order_fields`` are passed to the Order (user, contact
+    details, payment method and statuses). Raises OrderInputError, or
+    InsufficientStock when a product cannot cover its quantity.
+    """
+    with transaction.atomic():
+        products = Product.objects.in_bulk({product_id for product_id, _ in lines})
+        missing = [product_id for product_id, _ in lines if product_id not in products]
+        if missing:
+            raise OrderInputError(f"Product not found: {', '.join(map(str, missing))}")
+
+        items = []
+        total = Decimal("0")
+        for product_id, quantity in lines:
+            product = products[product_id]
+            subtotal = product.price * quantity
+            total += subtotal
+            items.append(
+                OrderItem(
+                    product=product,
+                    product_name=product.name[:150],
+                    price=product.price,
+                    quantity=quantity,
+                    subtotal=subtotal,
+                )
+            )
+        if total <= 0:
+            raise OrderInputError("Order total must be greater than zero.")
+
+        order = Order.objects.create(total_amount=total, **order_fields)
+        reserve_stock(order, lines, products, reservation_expiry(order.payment_method))
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+    return order
+
+
+def order_detail_prefetches(fields=None):
+    """
+    Prefetch objects for OrderSerializer: items with their products, and the
+    payments carrying a receipt (as ``receipt_payments``). ``fields`` limits
+    them to the fields being rendered (None = all).
+    """
+    prefetches = []
+    if fields is None or "items" in fields:
+        prefetches.append(
+            Prefetch("items", queryset=OrderItem.objects.select_related("product").order_by("id"))
+        )
+    if fields is None or "receipt_url" in fields:
+        prefetches.append(
+            Prefetch(
+                "payments",
+                queryset=Payment.objects.filter(receipt_image__isnull=False).order_by("id"),
+                to_attr="receipt_payments",
+            )
+        )
+    return prefetches
+
+
+def prefetch_order_details(orders):
+    """
+    Load everything OrderSerializer reads for ``orders`` in two queries.
+    """
+    prefetch_related_objects(list(orders), *order_detail_prefetches())
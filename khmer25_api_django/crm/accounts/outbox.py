@@ -0,0 +1,268 @@
+"""
+Outbox for Telegram notifications.
+
+Requests never call api.telegram.org themselves: ``enqueue`` inserts a
+``NotificationJob`` in the same transaction as the order or payment change
+it reports, so a notification exists exactly when the change committed and
+checkout latency does not depend on Telegram. ``manage.py
+run_outbox_worker`` delivers the jobs.
+
+Delivery keeps per-chat order: a chat's jobs go out one at a time in id
+order, and a job waiting to be retried holds back the later jobs of its
+chat. Different chats are sent in parallel from a thread pool; the threads
+only do HTTP (through the pooled, rate-limited accounts.telegram client),
+rows are updated by the worker's main thread. Failures are retried with
+exponential backoff (or after Telegram's ``retry_after``); client errors
+other than 429 are not retried. Claims are renewed while a chat is still
+sending, so only a dead worker's jobs are taken over by another.
+
+Photos are uploaded once: the first upload is shrunk to
+``TELEGRAM_PHOTO_MAX_SIDE`` and the ``file_id`` Telegram returns is kept in
+``TelegramFile``, so later messages about the same receipt send that id (a
+few hundred bytes) instead of the image.
+"""
+import io
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .images import shrink_image
+from .models import NotificationJob, TelegramFile
+from .telegram import TelegramError, get_client
+
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+# A job left in "sending" longer than this belongs to a worker that died.
+# Live workers renew their claims well within it (see renew_claims), since a
+# group chat drains at 20 messages a minute and a batch can take far longer.
+CLAIM_TIMEOUT = timedelta(minutes=2)
+CLAIM_RENEW_SECONDS = CLAIM_TIMEOUT.total_seconds() / 4
+
+
+def enqueue(method, payload, chat_id=None, attachment=""):
+    """
+    Queue a Bot API call. ``chat_id`` orders the job against others for the
+    same chat (defaults to payload["chat_id"]); ``attachment`` is a media
+    file name uploaded as the ``photo`` of a sendPhoto call, with
+    payload["photo"] (a URL) used if the file cannot be read.
+    """
+    return NotificationJob.objects.create(
+        chat_id=str(chat_id if chat_id is not None else payload.get("chat_id", "")),
+        method=method,
+        payload=payload,
+        attachment=attachment or "",
+    )
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+def cached_file_ids(jobs):
+    """
+    {attachment: file_id} for the attachments Telegram already has.
+    """
+    names = {job.attachment for job in jobs if job.attachment}
+    if not names:
+        return {}
+    return dict(TelegramFile.objects.filter(name__in=names).values_list("name", "file_id"))
+
+
+def uploaded_photo(result):
+    """
+    The largest size Telegram made of a sent photo, or None.
+    """
+    photos = (result or {}).get("photo") if isinstance(result, dict) else None
+    return photos[-1] if photos else None
+
+
+def photo_upload(name):
+    """
+    The attachment as an upload, shrunk to TELEGRAM_PHOTO_MAX_SIDE when it is
+    an image that gets smaller that way (Telegram keeps at most 1280px
+    anyway). None when the file cannot be read.
+    """
+    try:
+        with default_storage.open(name, "rb") as fh:
+            data = fh.read()
+    except OSError:
+        return None
+    filename = posixpath.basename(name)
+    shrunk = shrink_image(data, getattr(settings, "TELEGRAM_PHOTO_MAX_SIDE", 1280))
+    if shrunk is not None and len(shrunk) < len(data):
+        data = shrunk
+        filename = posixpath.splitext(filename)[0] + ".jpg"
+    upload = io.BytesIO(data)
+    upload.name = filename
+    return upload
+
+
+def _send_attachment(client, job, params, file_ids):
+    file_id = file_ids.get(job.attachment)
+    if file_id:
+        try:
+            return client.dispatch(job.method, {**params, "photo": file_id})
+        except TelegramError as exc:
+            if not exc.permanent:
+                raise
+            # The file_id is no longer accepted; upload the file again.
+            file_ids.pop(job.attachment, None)
+    upload = photo_upload(job.attachment)
+    if upload is None:
+        if "photo" not in params:
+            raise DeliveryError(f"Attachment {job.attachment} is missing.", permanent=True)
+        return client.dispatch(job.method, params)
+    with upload:
+        result = client.dispatch(job.method, {**params, "photo": upload})
+    photo = uploaded_photo(result)
+    if photo:
+        # Later jobs in this round (e.g. the receipt message after the
+        # order message) reuse it right away; record_outcome stores it.
+        file_ids[job.attachment] = photo["file_id"]
+        job.uploaded_photo = photo
+    return result
+
+
+def deliver(job, file_ids=None):
+    """
+    Make the job's API call through the shared client; returns Telegram's
+    ``result`` or raises DeliveryError. Attachments go by ``file_ids``
+    ({attachment: file_id}) when Telegram already has them, and are
+    uploaded (and added to ``file_ids``) otherwise.
+    """
+    client = get_client()
+    if client is None:
+        raise DeliveryError("Telegram bot token is not configured.")
+    params = dict(job.payload)
+    try:
+        if job.attachment:
+            return _send_attachment(client, job, params, {} if file_ids is None else file_ids)
+        return client.dispatch(job.method, params)
+    except TelegramError as exc:
+        raise DeliveryError(str(exc), retry_after=exc.retry_after, permanent=exc.permanent)
+
+
+def send_chat(jobs, file_ids=None):
+    """
+    Deliver one chat's claimed jobs in order, stopping at the first failure.
+    Returns [(job, result, error)] for the jobs attempted. Runs in worker
+    threads, so it does not touch the database.
+    """
+    outcomes = []
+    for job in jobs:
+        try:
+            outcomes.append((job, deliver(job, file_ids), None))
+        except DeliveryError as exc:
+            outcomes.append((job, None, exc))
+            break
+    return outcomes
+
+
+def release_stale_claims(now=None):
+    cutoff = (now or timezone.now()) - CLAIM_TIMEOUT
+    return NotificationJob.objects.filter(
+        status=NotificationJob.SENDING, claimed_at__lte=cutoff
+    ).update(status=NotificationJob.PENDING, claimed_at=None)
+
+
+def renew_claims(jobs, now=None):
+    """
+    Keep claims on jobs that are still being sent from going stale.
+    """
+    return NotificationJob.objects.filter(
+        pk__in=[job.pk for job in jobs], status=NotificationJob.SENDING
+    ).update(claimed_at=now or timezone.now())
+
+
+def due_jobs(limit=500, now=None):
+    """
+    {chat_id: [job, ...]} that may be sent now, oldest first. A chat is
+    skipped while another worker is sending for it, and cut off at its first
+    job that is still waiting for a retry.
+    """
+    now = now or timezone.now()
+    blocked = set(
+        NotificationJob.objects.filter(status=NotificationJob.SENDING).values_list("chat_id", flat=True)
+    )
+    batches = {}
+    for job in NotificationJob.objects.filter(status=NotificationJob.PENDING).order_by("id")[:limit]:
+        if job.chat_id in blocked:
+            continue
+        if job.next_attempt_at > now:
+            blocked.add(job.chat_id)
+            continue
+        batches.setdefault(job.chat_id, []).append(job)
+    return batches
+
+
+def claim(jobs):
+    """
+    Mark a chat's jobs as being sent; stops at the first job another worker
+    took, so claimed jobs stay contiguous.
+    """
+    now = timezone.now()
+    claimed = []
+    for job in jobs:
+        taken = NotificationJob.objects.filter(pk=job.pk, status=NotificationJob.PENDING).update(
+            status=NotificationJob.SENDING, claimed_at=now
+        )
+        if not taken:
+            break
+        claimed.append(job)
+    return claimed
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+
+
+def record_outcome(job, result, error):
+    now = timezone.now()
+    if error is None:
+        NotificationJob.objects.filter(pk=job.pk).update(
+            status=NotificationJob.SENT, sent_at=now, claimed_at=None, last_error=""
+        )
+        # Only a job that uploaded the bytes learns a new file_id; sends
+        # that reused the cached id keep it as it is.
+        photo = getattr(job, "uploaded_photo", None)
+        if photo:
+            TelegramFile.objects.update_or_create(
+                name=job.attachment,
+                defaults={"file_id": photo["file_id"], "file_size": photo.get("file_size")},
+            )
+        return
+    attempts = job.attempts + 1
+    max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+    if error.permanent or attempts >= max_attempts:
+        status, next_attempt_at = NotificationJob.FAILED, job.next_attempt_at
+    else:
+        status = NotificationJob.PENDING
+        next_attempt_at = now + timedelta(seconds=error.retry_after or backoff(attempts))
+    NotificationJob.objects.filter(pk=job.pk).update(
+        status=status,
+        attempts=attempts,
+        next_attempt_at=next_attempt_at,
+        claimed_at=None,
+        last_error=str(error)[:1000],
+    )
+
+
+def release_unsent(jobs):
+    """
+    Put claimed jobs that were not attempted back in the queue.
+    """
+    NotificationJob.objects.filter(
+        pk__in=[job.pk for job in jobs], status=NotificationJob.SENDING
+    ).update(status=NotificationJob.PENDING, claimed_at=None)
+
+
+def purge_sent(older_than_days, now=None):
+    cutoff = (now or timezone.now()) - timedelta(days=older_than_days)
+    deleted, _ = NotificationJob.objects.filter(status=NotificationJob.SENT, sent_at__lte=cutoff).delete()
+    return deleted
@@ -0,0 +1,152 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def positive_int(value, default, cap=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return default
+    if number <= 0:
+        return default
+    if cap:
+        return min(number, cap)
+    return number
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique, stable ordering such as ("id",) or
+    ("-product_date", "-id").
+
+    The cursor stores the ordering values of the last row on the page, so the
+    next page is an indexed range scan instead of an OFFSET that gets slower
+    the deeper the client scrolls.
+
+    Views declare the orderings they allow:
+
+        keyset_orderings = {"newest": ("-product_date", "-id"), "id": ("id",)}
+
+    The first entry is the default; clients pick another with ?ordering=<key>.
+    Pagination is opt-in (?page_size= or ?cursor=) so older app builds that
+    expect a bare list keep working.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering_query_param = "ordering"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.page_size = self.get_page_size(request)
+        self.ordering_key, self.ordering = self.get_ordering(request, view)
+        self.base_url = request.build_absolute_uri()
+
+        self.model = queryset.model
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._after_position(position))
+
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        self.next_position = self._position_of(self.page[-1]) if self.has_next else None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        default = positive_int(getattr(settings, "API_PAGE_SIZE", 50), 50)
+        cap = positive_int(getattr(settings, "API_MAX_PAGE_SIZE", 200), 200)
+        return positive_int(
+            request.query_params.get(self.page_size_query_param), default, cap
+        )
+
+    def get_ordering(self, request, view):
+        orderings = getattr(view, "keyset_orderings", None) or {"id": ("id",)}
+        key = request.query_params.get(self.ordering_query_param)
+        if key not in orderings:
+            key = next(iter(orderings))
+        return key, tuple(orderings[key])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def encode_cursor(self, position):
+        payload = json.dumps({"o": self.ordering_key, "v": position}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            values = payload["v"]
+        except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if payload.get("o") != self.ordering_key or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _position_of(self, obj):
+        position = []
+        for field_name in self._field_names():
+            value = getattr(obj, field_name)
+            position.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        return position
+
+    def _field_names(self):
+        return [term.lstrip("-") for term in self.ordering]
+
+    def _after_position(self, position):
+        # (a, b) after (x, y) == a > x OR (a == x AND b > y), per-term direction.
+        condition = Q()
+        equal_so_far = {}
+        for term, raw_value in zip(self.ordering, position):
+            field_name = term.lstrip("-")
+            lookup = "lt" if term.startswith("-") else "gt"
+            value = self._to_python(field_name, raw_value)
+            condition |= Q(**equal_so_far, **{f"{field_name}__{lookup}": value})
+            equal_so_far[field_name] = value
+        return condition
+
+    def _to_python(self, field_name, value):
+        meta = self.model._meta
+        field = meta.pk if field_name == "pk" else meta.get_field(field_name)
+        try:
+            return field.to_python(value)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
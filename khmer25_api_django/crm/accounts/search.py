@@ -0,0 +1,171 @@
+"""
+Product search over a maintained inverted index (``ProductSearchTerm``).
+
+Khmer is written without spaces between words, so Khmer runs are split into
+orthographic syllable clusters (a base consonant/vowel plus its subscripts,
+dependent vowels and signs) and indexed as cluster unigrams and bigrams; a
+query matches when all of its bigrams do, which behaves like a substring
+search. Latin words are indexed whole plus their prefixes for
+search-as-you-type. The postings table is plain SQL, so the same code runs
+on PostgreSQL and SQLite.
+"""
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Product, ProductSearchTerm
+
+NAME_WEIGHT = 6
+CATEGORY_WEIGHT = 2
+MAX_TERM_LENGTH = 64
+MIN_PREFIX = 2
+MAX_PREFIX = 20
+
+COENG = "\u17d2"
+KHMER_DIGITS = {chr(0x17E0 + digit): str(digit) for digit in range(10)}
+
+
+def _is_khmer_base(char):
+    # Consonants and independent vowels start a new cluster.
+    return "\u1780" <= char <= "\u17b3"
+
+
+def _is_khmer_mark(char):
+    # Dependent vowels, signs, and the coeng (subscript) marker.
+    return "\u17b4" <= char <= "\u17d3" or char == "\u17dd"
+
+
+def _khmer_clusters(run):
+    clusters = []
+    for index, char in enumerate(run):
+        previous = run[index - 1] if index else ""
+        if clusters and (_is_khmer_mark(char) or previous == COENG):
+            clusters[-1] += char
+        elif _is_khmer_base(char):
+            clusters.append(char)
+    return clusters
+
+
+def _runs(text):
+    """
+    Yield ("khmer" | "word", text) runs from normalized ``text``.
+    """
+    text = unicodedata.normalize("NFC", text or "").casefold()
+    kind, buffer = None, []
+    for char in text:
+        char = KHMER_DIGITS.get(char, char)
+        if _is_khmer_base(char) or _is_khmer_mark(char):
+            char_kind = "khmer"
+        elif char.isalnum():
+            char_kind = "word"
+        else:
+            char_kind = None
+        if char_kind != kind and buffer:
+            yield kind, "".join(buffer)
+            buffer = []
+        kind = char_kind
+        if char_kind:
+            buffer.append(char)
+    if buffer and kind:
+        yield kind, "".join(buffer)
+
+
+def index_terms(text, weight):
+    """
+    Postings for one field: {term: weight}.
+    """
+    terms = {}
+
+    def add(term, term_weight):
+        term = term[:MAX_TERM_LENGTH]
+        if term_weight > terms.get(term, 0):
+            terms[term] = term_weight
+
+    for kind, run in _runs(text):
+        if kind == "word":
+            add(run, weight)
+            for length in range(MIN_PREFIX, min(len(run), MAX_PREFIX + 1)):
+                add(run[:length], weight // 2 or 1)
+        else:
+            clusters = _khmer_clusters(run)
+            for cluster in clusters:
+                add(cluster, weight // 2 or 1)
+            for first, second in zip(clusters, clusters[1:]):
+                add(first + second, weight)
+    return terms
+
+
+def query_terms(text):
+    terms = []
+    for kind, run in _runs(text):
+        if kind == "word":
+            terms.append(run[:MAX_TERM_LENGTH])
+            continue
+        clusters = _khmer_clusters(run)
+        if len(clusters) == 1:
+            terms.extend(clusters)
+        else:
+            terms.extend(first + second for first, second in zip(clusters, clusters[1:]))
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+def product_terms(name, category_titles=()):
+    terms = index_terms(name, NAME_WEIGHT)
+    for title in category_titles:
+        for term, weight in index_terms(title, CATEGORY_WEIGHT).items():
+            terms[term] = max(weight, terms.get(term, 0))
+    return terms
+
+
+def _category_titles(product):
+    category = product.category
+    if not category:
+        return ()
+    return (category.title_en, category.title_kh)
+
+
+def index_products(products):
+    """
+    Replace the postings for ``products`` (with categories loaded).
+    """
+    products = list(products)
+    if not products:
+        return
+    rows = [
+        ProductSearchTerm(product_id=product.pk, term=term, weight=weight)
+        for product in products
+        for term, weight in product_terms(product.name, _category_titles(product)).items()
+    ]
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id__in=[p.pk for p in products]).delete()
+        ProductSearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+def index_category(category_id, batch_size=500):
+    queryset = Product.objects.select_related("category").filter(category_id=category_id).order_by("id")
+    batch = []
+    for product in queryset.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            index_products(batch)
+            batch = []
+    index_products(batch)
+
+
+def search_product_ids(query, limit=20, offset=0):
+    """
+    Ranked product ids matching every query term, as [(product_id, score)].
+    Fetches ``limit + 1`` rows so callers can tell whether a next page exists.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    rows = (
+        ProductSearchTerm.objects.filter(term__in=terms)
+        .values("product_id")
+        .annotate(score=Sum("weight"), matched=Count("term", distinct=True))
+        .filter(matched=len(terms))
+        .order_by("-score", "-product_id")[offset : offset + limit + 1]
+    )
+    return [(row["product_id"], row["score"]) for row in rows]
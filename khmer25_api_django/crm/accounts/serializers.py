@@ -13,10 +13,14 @@ from .models import (
     Supplier,
 )
 from rest_framework.permissions import AllowAny
+from .fieldsets import SparseFieldsMixin
+from .media_urls import MediaURLMixin
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, MediaURLMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    field_sources = {"image_url": ("image",), "image_variants": ("image", "image_variants")}
 
     class Meta:
         model = Category
@@ -26,26 +30,36 @@ class CategorySerializer(serializers.ModelSerializer):
             "title_kh",
             "image",
             "image_url",
+            "image_variants",
             "sub_count",
+            "product_count",
+            "in_stock_count",
         ]
+        # Maintained by accounts.counters.
+        read_only_fields = ["sub_count", "product_count", "in_stock_count"]
 
     def get_image_url(self, obj):
-        request = self.context.get("request")
-        if obj.image and hasattr(obj.image, "url"):
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url
-        return None
+        return self.media_url(obj.image)
+
+    def get_image_variants(self, obj):
+        return self.media_variants(obj.image, obj.image_variants)
         
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, MediaURLMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     category_name = serializers.SerializerMethodField()
+    field_sources = {
+        "image_url": ("image",),
+        "image_variants": ("image", "image_variants"),
+        "category_name": ("category", "category__title_en", "category__title_kh"),
+    }
 
     class Meta:
         model = Product
         fields = [
             "id",
+            "sku",
             "name",
             "price",
             "currency",
@@ -55,20 +69,17 @@ class ProductSerializer(serializers.ModelSerializer):
             "product_date",
             "image",
             "image_url",
+            "image_variants",
             "payway_link",
             "category",
             "category_name",
         ]
 
     def get_image_url(self, obj):
-        request = self.context.get("request")
+        return self.media_url(obj.image)
 
-        if obj.image and hasattr(obj.image, 'url'):
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url  # Fallback (absolute path not required)
-
-        return None
+    def get_image_variants(self, obj):
+        return self.media_variants(obj.image, obj.image_variants)
 
     def get_category_name(self, obj):
         category = getattr(obj, "category", None)
@@ -80,12 +91,13 @@ class ProductSerializer(serializers.ModelSerializer):
         return (getattr(category, "title_kh", "") or "").strip()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MediaURLMixin, serializers.ModelSerializer):
     avatar_url = serializers.SerializerMethodField(read_only=True)
+    avatar_variants = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
-        fields = ["id", "username", "password", "email", "phone", "avatar", "avatar_url"]
+        fields = ["id", "username", "password", "email", "phone", "avatar", "avatar_url", "avatar_variants"]
         extra_kwargs = {
             "password": {"write_only": True},
             "username": {"required": True},
@@ -114,15 +126,13 @@ class UserSerializer(serializers.ModelSerializer):
         return value
 
     def get_avatar_url(self, obj):
-        request = self.context.get("request")
-        if obj.avatar:
-            if request:
-                return request.build_absolute_uri(obj.avatar.url)
-            return obj.avatar.url
-        return None
+        return self.media_url(obj.avatar)
 
+    def get_avatar_variants(self, obj):
+        return self.media_variants(obj.avatar, obj.avatar_variants)
 
-class UserPublicSerializer(serializers.ModelSerializer):
+
+class UserPublicSerializer(MediaURLMixin, serializers.ModelSerializer):
     avatar_url = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -130,12 +140,7 @@ class UserPublicSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email", "phone", "avatar_url"]
 
     def get_avatar_url(self, obj):
-        request = self.context.get("request")
-        if obj.avatar:
-            if request:
-                return request.build_absolute_uri(obj.avatar.url)
-            return obj.avatar.url
-        return None
+        return self.media_url(obj.avatar)
 
 class CartSerializer(serializers.ModelSerializer):
     class Meta:
@@ -143,7 +148,7 @@ class CartSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(MediaURLMixin, serializers.ModelSerializer):
     product_image = serializers.SerializerMethodField()
 
     class Meta:
@@ -160,14 +165,11 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     def get_product_image(self, obj):
         product = obj.product
-        if not product or not product.image:
+        if not product:
             return None
-        request = self.context.get("request")
-        if request:
-            return request.build_absolute_uri(product.image.url)
-        return product.image.url
+        return self.media_url(product.image)
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, MediaURLMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     created_at = serializers.SerializerMethodField()
     receipt_url = serializers.SerializerMethodField()
@@ -196,16 +198,18 @@ class OrderSerializer(serializers.ModelSerializer):
             return obj.created_at.isoformat() if obj.created_at else None
 
     def get_receipt_url(self, obj):
-        payment = obj.payments.filter(receipt_image__isnull=False).first()
-        if not payment or not payment.receipt_image:
+        # Prefetched by accounts.orders.order_detail_prefetches().
+        payments = getattr(obj, "receipt_payments", None)
+        if payments is None:
+            payment = obj.payments.filter(receipt_image__isnull=False).first()
+        else:
+            payment = payments[0] if payments else None
+        if not payment:
             return None
-        request = self.context.get("request")
-        if request:
-            return request.build_absolute_uri(payment.receipt_image.url)
-        return payment.receipt_image.url
+        return self.media_url(payment.receipt_image)
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(MediaURLMixin, serializers.ModelSerializer):
     payment_id = serializers.IntegerField(source="id", read_only=True)
     order_id = serializers.IntegerField(read_only=True)
     user_id = serializers.SerializerMethodField()
@@ -248,12 +252,7 @@ class PaymentSerializer(serializers.ModelSerializer):
         return mapping.get(obj.status, obj.status)
 
     def get_receipt_upload(self, obj):
-        if not obj.receipt_image:
-            return None
-        request = self.context.get("request")
-        if request:
-            return request.build_absolute_uri(obj.receipt_image.url)
-        return obj.receipt_image.url
+        return self.media_url(obj.receipt_image)
 
 
 
@@ -266,10 +265,15 @@ class PaymentSerializer(serializers.ModelSerializer):
 
 
 
-class BannerSerializer(serializers.ModelSerializer):
+class BannerSerializer(MediaURLMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Banner
-        fields = ["id", "image"]
+        fields = ["id", "image", "image_variants"]
+
+    def get_image_variants(self, obj):
+        return self.media_variants(obj.image, obj.image_variants)
 
 
 
@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .counters import apply_product_change, counted_state, load_counted_state
+from .images import queue_variants, replace_variants, variants_current
+from .models import Banner, Category, Product, User
+from .search import index_category, index_products
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    bump_catalog_version("product")
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    # Postings of deleted products go away with the CASCADE.
+    index_products([instance])
+
+
+@receiver(pre_save, sender=Product)
+def product_counts_before_save(sender, instance, **kwargs):
+    instance._counted_state = None if instance._state.adding else load_counted_state(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_counts_after_save(sender, instance, **kwargs):
+    new_state = counted_state(instance)
+    apply_product_change(instance._counted_state, new_state)
+    instance._counted_state = new_state
+
+
+@receiver(post_delete, sender=Product)
+def product_counts_after_delete(sender, instance, **kwargs):
+    apply_product_change(counted_state(instance), None)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    bump_catalog_version("category")
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # Category titles are searchable on every product in the category.
+    if not created:
+        index_category(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Banner)
+def banner_changed(sender, instance, **kwargs):
+    bump_catalog_version("banner")
+
+
+# (image field, variants field, catalog section) per model with resized variants.
+IMAGE_VARIANT_FIELDS = {
+    Product: ("image", "image_variants", "product"),
+    Category: ("image", "image_variants", "category"),
+    Banner: ("image", "image_variants", "banner"),
+    User: ("avatar", "avatar_variants", None),
+}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    A new image is queued for ``manage.py build_image_variants --watch``;
+    until it has run, serializers give the original only. A removed image's
+    variants are deleted here, as that needs no decoding.
+    """
+    spec = IMAGE_VARIANT_FIELDS.get(sender)
+    if spec is None or raw:
+        return
+    field_name, variants_field, section = spec
+    if update_fields is not None and field_name not in update_fields:
+        return
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field)
+    if field_file:
+        if not variants_current(field_file, variants):
+            # In the save's transaction: queued exactly when the upload commits.
+            queue_variants(instance)
+        return
+    if not variants:
+        return
+    # After commit so a rolled-back change keeps its files.
+    transaction.on_commit(
+        lambda: replace_variants(instance, field_name, variants_field, {}, section)
+    )
@@ -0,0 +1,87 @@
+"""
+Content-addressed media storage.
+
+Enabled with ``MEDIA_HASHED_STORAGE=true``. An upload to ``products/tea.jpg``
+is stored as ``products/<sha256 prefix>.jpg``: the URL changes whenever the
+bytes do, so clients and proxies may cache it forever (see crm.media), and
+re-uploading the same image reuses the existing file instead of writing
+``tea_AbC123x.jpg``. Every save is recorded in ``MediaManifest``.
+"""
+import hashlib
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 32
+HASHED_STEM_RE = re.compile(r"^[0-9a-f]{%d}$" % HASH_LENGTH)
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest(), size
+
+
+def hashed_name_for(name, sha256):
+    directory, filename = posixpath.split(name)
+    _, extension = posixpath.splitext(filename)
+    return posixpath.join(directory, sha256[:HASH_LENGTH] + extension.lower())
+
+
+def is_hashed_name(name):
+    stem, _ = posixpath.splitext(posixpath.basename(name or ""))
+    return bool(HASHED_STEM_RE.match(stem))
+
+
+class HashedMediaStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The upload name is only a hint (directory and extension), so keep it
+        # unsuffixed for the manifest. Hashed names still get the usual
+        # collision handling from FileSystemStorage._save.
+        if is_hashed_name(name):
+            return super().get_available_name(name, max_length=max_length)
+        return name
+
+    def _save(self, name, content):
+        sha256, size = content_digest(content)
+        hashed = hashed_name_for(name, sha256)
+        if not self.exists(hashed):
+            stored = super()._save(hashed, content)
+            if stored != hashed:
+                # A concurrent identical upload won the race; same bytes.
+                super().delete(stored)
+        self._record(name, hashed, sha256, size)
+        return hashed
+
+    def _record(self, original_name, hashed_name, sha256, size):
+        from .models import MediaManifest
+
+        MediaManifest.objects.get_or_create(
+            original_name=original_name,
+            hashed_name=hashed_name,
+            defaults={"sha256": sha256, "size": size},
+        )
+
+    def delete(self, name):
+        # Hashed files can be shared by several rows (dedupe), so they are
+        # never removed through a model; ``media_fix --prune-hashed`` removes
+        # the ones nothing references. Legacy names delete as before.
+        if is_hashed_name(name):
+            return
+        super().delete(name)
+
+    def purge(self, name):
+        """
+        Remove a hashed file and its manifest rows. The caller checks that no
+        row references it any more.
+        """
+        from .models import MediaManifest
+
+        super().delete(name)
+        MediaManifest.objects.filter(hashed_name=name).delete()
@@ -0,0 +1,282 @@
+"""
+Telegram Bot API client.
+
+One ``TelegramClient`` per process (``get_client()``) keeps a pooled
+``requests.Session``, so messages reuse open TLS connections instead of
+handshaking for every call. Calls are paced with token buckets to stay
+inside Telegram's limits: about 30 messages/second per bot, one per second
+per private chat and ``TELEGRAM_GROUP_RATE_PER_MINUTE`` (20) per group.
+A 429 pauses the chat's bucket for ``retry_after``; short waits are retried
+in place, longer ones raise ``TelegramError`` so the caller (the outbox)
+can reschedule.
+"""
+import json
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+API_BASE = "https://api.telegram.org"
+REQUEST_TIMEOUT = 10
+
+
+def telegram_config():
+    """
+    (bot token, chat id) from settings; either may be empty when unset.
+    """
+    return getattr(settings, "TELEGRAM_BOT_TOKEN", ""), getattr(settings, "TELEGRAM_CHAT_ID", "")
+
+
+class TelegramError(Exception):
+    def __init__(self, description, status_code=None, retry_after=None):
+        super().__init__(description)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def permanent(self):
+        """
+        Retrying will not help (bad request, blocked bot, unknown chat).
+        """
+        return self.status_code is not None and 400 <= self.status_code < 500 and self.status_code != 429
+
+
+class TokenBucket:
+    """
+    ``rate`` tokens per second, bursts up to ``capacity``. Takers reserve a
+    token and sleep until it is due, so waiters are served in order.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        Take a token; returns the seconds to wait before using it.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Hand out nothing for ``seconds`` (Telegram said retry_after).
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+def _is_file(value):
+    return hasattr(value, "read")
+
+
+def _form_value(value):
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+class TelegramClient:
+    """
+    Thread-safe Bot API client. ``group_rate``/``chat_rate``/``global_rate``
+    are messages per second (None disables that limit). A 429 asking to
+    wait at most ``max_retry_wait`` seconds is retried, up to
+    ``max_attempts`` calls in all.
+    """
+
+    TYPED_METHODS = {
+        "sendMessage": "send_message",
+        "sendPhoto": "send_photo",
+        "editMessageText": "edit_message_text",
+        "editMessageReplyMarkup": "edit_message_reply_markup",
+        "answerCallbackQuery": "answer_callback_query",
+    }
+
+    def __init__(
+        self,
+        token,
+        base_url=API_BASE,
+        timeout=REQUEST_TIMEOUT,
+        pool_size=16,
+        global_rate=30.0,
+        group_rate=20 / 60,
+        chat_rate=1.0,
+        max_retry_wait=5.0,
+        max_attempts=3,
+    ):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retry_wait = max_retry_wait
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.global_bucket = TokenBucket(global_rate, global_rate) if global_rate else None
+        self.group_rate = group_rate
+        self.chat_rate = chat_rate
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def close(self):
+        self.session.close()
+
+    def _chat_bucket(self, chat_id):
+        if chat_id is None:
+            return None
+        chat_id = str(chat_id)
+        # Group and channel ids are negative.
+        rate = self.group_rate if chat_id.startswith("-") else self.chat_rate
+        if not rate:
+            return None
+        with self._buckets_lock:
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                # Groups may burst up to a minute's allowance.
+                capacity = max(1, int(rate * 60)) if chat_id.startswith("-") else 1
+                bucket = self._buckets[chat_id] = TokenBucket(rate, capacity)
+            return bucket
+
+    def _post(self, url, params):
+        files = {name: value for name, value in params.items() if _is_file(value)}
+        if not files:
+            return self.session.post(url, json=params, timeout=self.timeout)
+        for value in files.values():
+            if hasattr(value, "seek"):
+                value.seek(0)
+        data = {name: _form_value(value) for name, value in params.items() if name not in files}
+        return self.session.post(url, data=data, files=files, timeout=self.timeout)
+
+    def call(self, method, params):
+        """
+        Call any Bot API method; file objects in ``params`` are uploaded.
+        Returns the ``result`` of the reply or raises TelegramError.
+        """
+        params = {name: value for name, value in params.items() if value is not None}
+        bucket = self._chat_bucket(params.get("chat_id"))
+        url = f"{self.base_url}/bot{self.token}/{method}"
+        for attempt in range(1, self.max_attempts + 1):
+            if bucket:
+                bucket.acquire()
+            if self.global_bucket:
+                self.global_bucket.acquire()
+            try:
+                response = self._post(url, params)
+            except requests.RequestException as exc:
+                raise TelegramError(str(exc))
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            if response.status_code == 200 and data.get("ok", True):
+                return data.get("result")
+
+            description = data.get("description") or f"HTTP {response.status_code}"
+            retry_after = (data.get("parameters") or {}).get("retry_after")
+            if response.status_code != 429 or retry_after is None:
+                raise TelegramError(description, response.status_code)
+            limiter = bucket or self.global_bucket
+            if limiter:
+                limiter.pause(retry_after)
+            if retry_after > self.max_retry_wait or attempt == self.max_attempts:
+                raise TelegramError(description, 429, retry_after)
+            if not limiter:
+                time.sleep(retry_after)
+
+    def dispatch(self, method, params):
+        """
+        Route a stored (method, params) pair through the typed method.
+        """
+        name = self.TYPED_METHODS.get(method)
+        if name is None:
+            return self.call(method, params)
+        return getattr(self, name)(**params)
+
+    def send_message(self, chat_id, text, parse_mode=None, reply_markup=None, **extra):
+        return self.call(
+            "sendMessage",
+            {"chat_id": chat_id, "text": text, "parse_mode": parse_mode, "reply_markup": reply_markup, **extra},
+        )
+
+    def send_photo(self, chat_id, photo, caption=None, parse_mode=None, reply_markup=None, **extra):
+        """
+        ``photo`` is a file_id, a URL or an open binary file.
+        """
+        return self.call(
+            "sendPhoto",
+            {
+                "chat_id": chat_id,
+                "photo": photo,
+                "caption": caption,
+                "parse_mode": parse_mode,
+                "reply_markup": reply_markup,
+                **extra,
+            },
+        )
+
+    def edit_message_text(self, chat_id, message_id, text, parse_mode=None, reply_markup=None, **extra):
+        return self.call(
+            "editMessageText",
+            {
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "text": text,
+                "parse_mode": parse_mode,
+                "reply_markup": reply_markup,
+                **extra,
+            },
+        )
+
+    def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None, **extra):
+        return self.call(
+            "editMessageReplyMarkup",
+            {"chat_id": chat_id, "message_id": message_id, "reply_markup": reply_markup, **extra},
+        )
+
+    def answer_callback_query(self, callback_query_id, text=None, show_alert=False, **extra):
+        return self.call(
+            "answerCallbackQuery",
+            {"callback_query_id": callback_query_id, "text": text, "show_alert": show_alert, **extra},
+        )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    The shared client for the configured bot, or None without a token.
+    """
+    global _client
+    token, _ = telegram_config()
+    if not token:
+        return None
+    base_url = getattr(settings, "TELEGRAM_API_BASE", "") or API_BASE
+    with _client_lock:
+        if _client is None or (_client.token, _client.base_url) != (token, base_url.rstrip("/")):
+            _client = TelegramClient(
+                token,
+                base_url=base_url,
+                group_rate=getattr(settings, "TELEGRAM_GROUP_RATE_PER_MINUTE", 20) / 60,
+            )
+        return _client
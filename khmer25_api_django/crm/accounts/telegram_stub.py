@@ -0,0 +1,155 @@
+"""
+A local stand-in for the Telegram Bot API, for tests and benchmarks.
+
+    with StubTelegramServer() as stub:
+        client = TelegramClient("token", base_url=stub.base_url)
+        client.send_message("-100", "hello")
+        stub.calls  # [("sendMessage", {"chat_id": "-100", "text": "hello"})]
+
+It speaks HTTP/1.1 keep-alive like the real API, records every call and the
+client connections it saw, answers sendPhoto with a ``photo`` size list
+carrying a ``file_id``, and can be told to rate-limit the next calls with
+``fail_with_429(count, retry_after)``.
+"""
+import itertools
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def _parse_multipart(content_type, body):
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    params = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename():
+            params[name] = {"filename": part.get_filename(), "size": len(payload)}
+        else:
+            params[name] = payload.decode("utf-8")
+    return params
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith("multipart/form-data"):
+            return _parse_multipart(content_type, body)
+        return dict(parse_qsl(body.decode("utf-8")))
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        stub = self.server.stub
+        method = self.path.rsplit("/", 1)[-1]
+        params = self._params()
+        stub.record(self.client_address, method, params)
+        if stub.latency:
+            time.sleep(stub.latency)
+        retry_after = stub.take_429()
+        if retry_after is not None:
+            self._reply(
+                429,
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                },
+            )
+            return
+        self._reply(200, {"ok": True, "result": stub.result_for(method, params)})
+
+
+class StubTelegramServer:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._pending_429 = []
+        self._ids = itertools.count(1)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def fail_with_429(self, count=1, retry_after=1):
+        with self._lock:
+            self._pending_429.extend([retry_after] * count)
+
+    def take_429(self):
+        with self._lock:
+            return self._pending_429.pop(0) if self._pending_429 else None
+
+    def record(self, client_address, method, params):
+        with self._lock:
+            self.connections.add(client_address)
+            self.calls.append((method, params))
+
+    def result_for(self, method, params):
+        message_id = next(self._ids)
+        if method == "answerCallbackQuery":
+            return True
+        result = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": params.get("chat_id")},
+        }
+        if method == "sendPhoto":
+            photo = params.get("photo")
+            size = photo.get("size", 0) if isinstance(photo, dict) else 0
+            result["photo"] = [
+                {
+                    "file_id": f"stub-photo-{message_id}",
+                    "file_unique_id": f"stub-unique-{message_id}",
+                    "width": 1280,
+                    "height": 960,
+                    "file_size": size,
+                }
+            ]
+            result["caption"] = params.get("caption")
+        else:
+            result["text"] = params.get("text")
+        return result
@@ -1,3 +1,1134 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+import msgpack
+import openpyxl
+from django.contrib.auth.hashers import make_password
+from django.contrib import admin
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from crm.channel_layers import PostgresChannelLayer, psycopg
+from crm.media import serve_media
+from crm.middleware import CompressionMiddleware, brotli
+
+from .admin import OrderAdmin
+from .consumers import OrderEventConsumer
+from .fieldsets import selected_field_names
+from .idempotency import request_fingerprint
+from .importer import import_products
+from .management.commands.build_image_variants import work_queue
+from .models import (
+    AuthToken,
+    Category,
+    ImageVariantJob,
+    MediaManifest,
+    NotificationJob,
+    Order,
+    OrderItem,
+    Payment,
+    Product,
+    StockReservation,
+    TelegramFile,
+    User,
+)
+from .outbox import CLAIM_TIMEOUT, claim, enqueue, release_stale_claims, renew_claims
+from .renderers import MessagePackParser, MessagePackRenderer
+from .search import index_terms, query_terms, search_product_ids
+from .serializers import ProductSerializer
+from .telegram import TelegramClient, TelegramError, TokenBucket
+from .telegram_stub import StubTelegramServer
+from .views import _apply_order_decision, _broadcast_order_event, _compute_payway_hash
+
+
+class OrderCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username="buyer", password="x", email="buyer@example.com", phone="012345678"
+        )
+        cls.token = AuthToken.objects.create(key="t" * 40, user=cls.user)
+        category = Category.objects.create(title_en="Rice", title_kh="Rice")
+        cls.products = [
+            Product.objects.create(
+                category=category,
+                name=f"Product {index}",
+                price=Decimal("1.50") + index,
+                quantity=100,
+            )
+            for index in range(10)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def _post(self, items, payment_method="ABA_QR", **headers):
+        payload = {
+            "name": "Buyer",
+            "phone": "012345678",
+            "address": "Phnom Penh",
+            "payment_method": payment_method,
+            "items": items,
+        }
+        return self.client.post(
+            "/api/orders/", {"payload": json.dumps(payload)}, format="multipart", headers=headers
+        )
+
+    def _count_queries(self, products):
+        items = [{"id": product.pk, "qty": 2, "price": "0.01"} for product in products]
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post(items)
+        self.assertEqual(response.status_code, 201, response.content)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        # The year's first order also seeds its order code counter (or
+        # sequence); measure the orders after it.
+        self._count_queries(self.products[:1])
+        self.assertEqual(
+            self._count_queries(self.products[:1]),
+            self._count_queries(self.products),
+        )
+
+    def test_items_are_priced_from_the_database(self):
+        product = self.products[3]
+        response = self._post([{"id": product.pk, "qty": 3, "price": "0.01"}])
+        self.assertEqual(response.status_code, 201, response.content)
+        order = Order.objects.get(pk=response.data["id"])
+        self.assertEqual(order.total_amount, product.price * 3)
+        item = order.items.get()
+        self.assertEqual(item.price, product.price)
+        self.assertEqual(item.subtotal, product.price * 3)
+
+    def test_unknown_product_creates_nothing(self):
+        response = self._post([{"id": self.products[0].pk, "qty": 1}, {"id": 999999, "qty": 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_stock_is_reserved_and_never_oversold(self):
+        product = self.products[0]
+        response = self._post([{"id": product.pk, "qty": 101}])
+        self.assertEqual(response.status_code, 409)
+        response = self._post([{"id": product.pk, "qty": 60}, {"id": product.pk, "qty": 40}])
+        self.assertEqual(response.status_code, 201, response.content)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(self._post([{"id": product.pk, "qty": 1}]).status_code, 409)
+
+    def test_idempotency_key_replays_the_first_order(self):
+        items = [{"id": self.products[0].pk, "qty": 1}]
+        first = self._post(items, **{"Idempotency-Key": "checkout-1"})
+        self.assertEqual(first.status_code, 201, first.content)
+        retry = self._post(items, **{"Idempotency-Key": "checkout-1"})
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data["id"], first.data["id"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        other = self._post([{"id": self.products[1].pk, "qty": 1}], **{"Idempotency-Key": "checkout-1"})
+        self.assertEqual(other.status_code, 422)
+
+    def test_out_of_stock_is_not_replayed_after_a_restock(self):
+        product = self.products[0]
+        items = [{"id": product.pk, "qty": 150}]
+        first = self._post(items, **{"Idempotency-Key": "checkout-2"})
+        self.assertEqual(first.status_code, 409, first.content)
+        Product.objects.filter(pk=product.pk).update(quantity=200)
+        retry = self._post(items, **{"Idempotency-Key": "checkout-2"})
+        self.assertEqual(retry.status_code, 201, retry.content)
+        self.assertFalse(retry.has_header("Idempotent-Replayed"))
+
+    def test_trailing_slash_does_not_change_the_fingerprint(self):
+        factory = RequestFactory()
+        with_slash, without = factory.post("/api/payment/qr/"), factory.post("/api/payment/qr")
+        for request in (with_slash, without):
+            request.resolver_match = resolve(request.path)
+            request.data = {"order_id": "1"}
+        self.assertEqual(request_fingerprint(with_slash), request_fingerprint(without))
+
+    @override_settings(TELEGRAM_BOT_TOKEN="test-token", TELEGRAM_CHAT_ID="-100")
+    def test_cod_checkout_queues_the_telegram_notification(self):
+        response = self._post([{"id": self.products[0].pk, "qty": 1}], payment_method="COD")
+        self.assertEqual(response.status_code, 201, response.content)
+        job = NotificationJob.objects.get()
+        self.assertEqual(job.method, "sendMessage")
+        self.assertEqual(job.status, NotificationJob.PENDING)
+        self.assertIn(response.data["order_code"], job.payload["text"])
+
+    @override_settings(PAYWAY_MERCHANT_ID="merchant", PAYWAY_API_KEY="secret")
+    def test_signed_payway_failure_releases_the_stock(self):
+        product = self.products[0]
+        response = self._post([{"id": product.pk, "qty": 4}], payment_method="ABA_PAYWAY")
+        self.assertEqual(response.status_code, 201, response.content)
+        order = Order.objects.get(pk=response.data["id"])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 96)
+
+        def callback(signed):
+            data = {"order_id": order.order_code, "amount": str(order.total_amount), "currency": "USD"}
+            signature = _compute_payway_hash({"merchant_id": "merchant", **data}, "secret")
+            data.update(transaction_id=f"tx-{signed}", status="FAILED", hash=signature if signed else "forged")
+            return self.client.post("/api/payments/callback/", data, format="json", secure=True)
+
+        self.assertEqual(callback(signed=False).status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 96)
+
+        self.assertEqual(callback(signed=True).status_code, 200)
+        product.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual(product.quantity, 100)
+        self.assertEqual(order.payment_status, "failed")
+
+
+    def _rejected_qr_order(self, quantity=4):
+        response = self._post([{"id": self.products[0].pk, "qty": quantity}])
+        self.assertEqual(response.status_code, 201, response.content)
+        order = Order.objects.get(pk=response.data["id"])
+        payment = Payment.objects.create(order=order, method="ABA_QR", amount=order.total_amount)
+        self.assertEqual(_apply_order_decision(order, "reject")[0], True)
+        return order, payment
+
+    def _upload_receipt(self, payment):
+        receipt = SimpleUploadedFile("receipt.png", b"png", content_type="image/png")
+        return self.client.post(
+            "/api/payment/qr/receipt/", {"payment_id": payment.pk, "file": receipt}, format="multipart"
+        )
+
+    def _stock(self):
+        return Product.objects.get(pk=self.products[0].pk).quantity
+
+    def test_resubmitted_receipt_takes_the_released_stock_again(self):
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            order, payment = self._rejected_qr_order()
+            self.assertEqual(self._stock(), 100)
+
+            self.assertEqual(self._upload_receipt(payment).status_code, 200)
+            self.assertEqual(self._stock(), 96)
+            self.assertEqual(_apply_order_decision(order, "approve")[0], True)
+
+        order.refresh_from_db()
+        self.assertEqual((order.payment_status, order.order_status), ("paid", "confirmed"))
+        self.assertEqual(self._stock(), 96)
+        self.assertEqual(
+            sorted(order.stock_reservations.values_list("status", flat=True)),
+            [StockReservation.COMMITTED, StockReservation.RELEASED],
+        )
+
+    def test_sold_out_stock_blocks_the_resubmission_and_the_approval(self):
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            order, payment = self._rejected_qr_order()
+            Product.objects.filter(pk=self.products[0].pk).update(quantity=2)
+
+            response = self._upload_receipt(payment)
+        self.assertEqual(response.status_code, 409, response.content)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "rejected")
+
+        # Staff confirming it anyway must not mark it paid with no stock taken.
+        model_admin = OrderAdmin(Order, admin.site)
+        with mock.patch.object(model_admin, "message_user") as message_user:
+            model_admin.mark_confirmed(RequestFactory().post("/"), Order.objects.filter(pk=order.pk))
+        self.assertIn("skipped", message_user.call_args_list[0].args[1])
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, "failed")
+        self.assertEqual(self._stock(), 2)
+
+    def test_receipts_for_cancelled_orders_are_refused(self):
+        order, payment = self._rejected_qr_order()
+        Order.objects.filter(pk=order.pk).update(order_status="cancelled")
+
+        self.assertEqual(self._upload_receipt(payment).status_code, 409)
+        self.assertEqual(self._stock(), 100)
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title_en="Drinks", title_kh="Drinks")
+        # All created today, so "newest" order falls back to the id tie-breaker.
+        cls.ids = [
+            Product.objects.create(
+                category=category, name=f"Drink {index}", price=Decimal("1.00"), quantity=1
+            ).pk
+            for index in range(7)
+        ]
+
+    def _walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.json()["results"]]
+            url = response.json()["next"]
+            pages += 1
+        return ids, pages
+
+    def _next_cursor(self, url):
+        next_url = self.client.get(url).json()["next"]
+        return parse_qs(urlsplit(next_url).query)["cursor"][0]
+
+    def test_pages_cover_every_row_once_with_ties_broken_by_id(self):
+        self.assertEqual(self._walk("/api/products/?page_size=3"), (sorted(self.ids, reverse=True), 3))
+        self.assertEqual(self._walk("/api/products/?page_size=3&ordering=id"), (sorted(self.ids), 3))
+
+    def test_cursor_holds_the_last_rows_ordering_values(self):
+        cursor = self._next_cursor("/api/products/?page_size=2")
+        response = self.client.get("/api/products/?page_size=2")
+
+        self.assertNotIn("=", cursor)
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last = Product.objects.get(pk=response.json()["results"][-1]["id"])
+        self.assertEqual(payload, {"o": "newest", "v": [last.product_date.isoformat(), last.pk]})
+
+    def test_rows_created_between_pages_do_not_shift_the_next_page(self):
+        first = self.client.get("/api/products/?page_size=3").json()
+        Product.objects.create(
+            category=Category.objects.get(), name="Late drink", price=Decimal("1.00"), quantity=1
+        )
+        rest, _ = self._walk(first["next"])
+
+        self.assertEqual([row["id"] for row in first["results"]] + rest, sorted(self.ids, reverse=True))
+
+    def test_bad_cursors_are_not_found(self):
+        cursor = self._next_cursor("/api/products/?page_size=2&ordering=id")
+
+        self.assertEqual(self.client.get("/api/products/?cursor=not-a-cursor").status_code, 404)
+        # A cursor only fits the ordering it was issued for.
+        self.assertEqual(self.client.get(f"/api/products/?cursor={cursor}").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/products/?cursor={cursor}&ordering=id").status_code, 200)
+
+    @override_settings(API_PAGE_SIZE=4, API_MAX_PAGE_SIZE=5)
+    def test_pagination_is_opt_in_and_page_size_is_capped(self):
+        self.assertEqual(len(self.client.get("/api/products/").json()), 7)
+        self.assertEqual(len(self.client.get("/api/products/?page_size=100").json()["results"]), 5)
+        self.assertEqual(len(self.client.get("/api/products/?page_size=zero").json()["results"]), 4)
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title_en="Fruit", title_kh="ផ្លែឈើ")
+        for index in range(3):
+            Product.objects.create(
+                category=category, name=f"Mango {index}", price=Decimal("2.00"), quantity=4
+            )
+
+    def _product_select(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [q["sql"] for q in queries if 'FROM "accounts_product"' in q["sql"]]
+        self.assertEqual(len(selects), 1)
+        return response.json(), selects[0]
+
+    def test_fields_narrow_the_rows_and_the_columns(self):
+        rows, sql = self._product_select("/api/products/?fields=id,name,nope")
+
+        self.assertEqual([set(row) for row in rows], [{"id", "name"}] * 3)
+        self.assertIn('"accounts_product"."name"', sql)
+        self.assertNotIn('"accounts_product"."price"', sql)
+        self.assertNotIn("accounts_category", sql)
+
+    def test_computed_fields_load_the_columns_they_read(self):
+        rows, sql = self._product_select("/api/products/?fields=id,category_name,image_url")
+
+        self.assertEqual(rows[0]["category_name"], "Fruit")
+        self.assertIn('"accounts_category"."title_en"', sql)
+        self.assertIn('"accounts_product"."image"', sql)
+        self.assertNotIn('"accounts_product"."image_variants"', sql)
+
+    def test_omit_drops_fields_and_pages_keep_their_ordering_columns(self):
+        response = self.client.get("/api/products/?omit=image_variants,category_name&page_size=2")
+        body = response.json()
+
+        self.assertNotIn("image_variants", body["results"][0])
+        self.assertIn("price", body["results"][0])
+        self.assertEqual(len(self.client.get(body["next"]).json()["results"]), 1)
+
+    def test_only_reads_are_narrowed(self):
+        factory = RequestFactory()
+
+        self.assertIsNone(selected_field_names(factory.post("/api/products/?fields=id"), ProductSerializer))
+        self.assertIsNone(selected_field_names(factory.get("/api/products/"), ProductSerializer))
+        self.assertEqual(
+            selected_field_names(factory.get("/api/products/?fields=name,id"), ProductSerializer), ["id", "name"]
+        )
+
+
+class ProductFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rice = Category.objects.create(title_en="Rice", title_kh="អង្ករ")
+        noodles = Category.objects.create(title_en="Noodles", title_kh="មី")
+
+        def product(name, category, price, quantity, tag="", currency="USD"):
+            return Product.objects.create(
+                category=category, name=name, price=Decimal(price), quantity=quantity, tag=tag, currency=currency
+            )
+
+        cls.hot_khr = product("Hot KHR rice", cls.rice, "4000", 3, tag="hot", currency="KHR")
+        cls.hot_usd = product("Hot USD rice", cls.rice, "4.00", 3, tag="hot")
+        cls.sold_out = product("Sold out rice", cls.rice, "3.00", 0, tag="hot")
+        cls.cheap = product("Cheap rice", cls.rice, "1.00", 9)
+        cls.noodle = product("Hot noodles", noodles, "3.50", 5, tag="hot")
+
+    def _ids(self, query):
+        response = self.client.get(f"/api/products/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return sorted(row["id"] for row in response.json())
+
+    def test_filters_compose(self):
+        self.assertEqual(
+            self._ids(f"category={self.rice.pk}&tag=HOT"),
+            sorted([self.hot_khr.pk, self.hot_usd.pk, self.sold_out.pk]),
+        )
+        self.assertEqual(self._ids(f"category={self.rice.pk}&tag=hot&in_stock=yes&currency=usd"), [self.hot_usd.pk])
+        self.assertEqual(self._ids("min_price=3&max_price=4&in_stock=1"), sorted([self.hot_usd.pk, self.noodle.pk]))
+        self.assertEqual(self._ids("in_stock=false"), [self.sold_out.pk])
+        self.assertEqual(self._ids("tag=&currency="), sorted(Product.objects.values_list("pk", flat=True)))
+
+    def test_filters_apply_across_keyset_pages(self):
+        response = self.client.get("/api/products/?tag=hot&page_size=2&ordering=id")
+        ids = [row["id"] for row in response.json()["results"]]
+        ids += [row["id"] for row in self.client.get(response.json()["next"]).json()["results"]]
+
+        self.assertEqual(ids, sorted([self.hot_khr.pk, self.hot_usd.pk, self.sold_out.pk, self.noodle.pk]))
+
+    def test_detail_urls_ignore_list_filters(self):
+        response = self.client.get(f"/api/products/{self.sold_out.pk}/?in_stock=1&tag=new")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], self.sold_out.pk)
+
+    def test_every_bad_value_is_reported(self):
+        response = self.client.get("/api/products/?category=rice&tag=new&currency=EUR&min_price=NaN&in_stock=maybe")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"category", "tag", "currency", "min_price", "in_stock"})
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username="history", password="x", email="history@example.com", phone="098765432"
+        )
+        cls.token = AuthToken.objects.create(key="h" * 40, user=cls.user)
+        category = Category.objects.create(title_en="Fruit", title_kh="Fruit")
+        products = [
+            Product.objects.create(category=category, name=f"Fruit {index}", price=Decimal("2.00"), quantity=10)
+            for index in range(3)
+        ]
+        for _ in range(5):
+            order = Order.objects.create(
+                user=cls.user,
+                customer_name="History",
+                phone="098765432",
+                address="Siem Reap",
+                total_amount=Decimal("6.00"),
+                payment_method="ABA_QR",
+            )
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=1)
+            Payment.objects.create(
+                order=order, method="ABA_QR", amount=order.total_amount, receipt_image="payments/r.jpg"
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_list_runs_a_fixed_number_of_queries(self):
+        # Token, orders, items with products, receipt payments.
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/orders/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        for order in response.data:
+            self.assertEqual(len(order["items"]), 3)
+            self.assertTrue(order["receipt_url"])
+
+    def test_cursor_pages_are_newest_first_and_complete(self):
+        seen = []
+        url = "/api/orders/?page_size=2"
+        while url:
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(order["id"] for order in response.data["results"])
+            url = response.data["next"]
+        expected = list(
+            Order.objects.filter(user=self.user).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+
+class TelegramClientTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubTelegramServer().start()
+        self.addCleanup(self.stub.stop)
+        # Rate limits are covered by test_group_bucket_spaces_messages.
+        self.telegram = TelegramClient(
+            "test-token", base_url=self.stub.base_url, group_rate=None, chat_rate=None
+        )
+        self.addCleanup(self.telegram.close)
+
+    def test_messages_reuse_one_connection(self):
+        for index in range(5):
+            result = self.telegram.send_message("-100", f"message {index}")
+        self.assertEqual(result["text"], "message 4")
+        self.assertEqual(len(self.stub.calls), 5)
+        self.assertEqual(len(self.stub.connections), 1)
+
+    def test_dispatch_uploads_photos_through_the_typed_method(self):
+        keyboard = {"inline_keyboard": [[{"text": "OK", "callback_data": "ok"}]]}
+        result = self.telegram.dispatch(
+            "sendPhoto",
+            {"chat_id": "-100", "photo": io.BytesIO(b"jpeg"), "caption": "Receipt", "reply_markup": keyboard},
+        )
+        self.assertTrue(result["photo"][0]["file_id"])
+        method, params = self.stub.calls[-1]
+        self.assertEqual(method, "sendPhoto")
+        self.assertEqual(params["photo"]["size"], 4)
+        self.assertEqual(json.loads(params["reply_markup"]), keyboard)
+
+    def test_short_retry_after_is_waited_out(self):
+        self.stub.fail_with_429(1, retry_after=0.05)
+        self.telegram.answer_callback_query("cb-1", text="Done")
+        self.assertEqual([method for method, _ in self.stub.calls], ["answerCallbackQuery"] * 2)
+
+    def test_long_retry_after_is_raised_for_rescheduling(self):
+        self.stub.fail_with_429(1, retry_after=30)
+        with self.assertRaises(TelegramError) as raised:
+            self.telegram.send_message("-100", "later")
+        self.assertEqual(raised.exception.retry_after, 30)
+        self.assertFalse(raised.exception.permanent)
+
+    def test_group_bucket_spaces_messages(self):
+        now = [0.0]
+        sleeps = []
+        bucket = TokenBucket(20 / 60, 20, clock=lambda: now[0], sleep=sleeps.append)
+        for _ in range(20):
+            bucket.acquire()
+        self.assertEqual(sleeps, [])
+        bucket.acquire()
+        self.assertAlmostEqual(sleeps[0], 3.0)
+        now[0] += 60
+        bucket.pause(10)
+        bucket.acquire()
+        self.assertAlmostEqual(sleeps[1], 13.0)
+
+
+class OutboxPhotoTests(TestCase):
+    def setUp(self):
+        self.stub = StubTelegramServer().start()
+        self.addCleanup(self.stub.stop)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(
+            TELEGRAM_API_BASE=self.stub.base_url, TELEGRAM_BOT_TOKEN="test-token", MEDIA_ROOT=media_root.name
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_receipt_is_uploaded_once_and_shrunk(self):
+        buffer = io.BytesIO()
+        Image.effect_noise((2400, 1800), 64).convert("RGB").save(buffer, "JPEG", quality=95)
+        name = default_storage.save("payments/receipt.jpg", ContentFile(buffer.getvalue()))
+        for caption in ("New order", "Receipt uploaded"):
+            enqueue("sendPhoto", {"chat_id": "-100", "caption": caption, "photo": "https://x/r.jpg"}, attachment=name)
+
+        call_command("run_outbox_worker", "--once", stdout=io.StringIO())
+
+        (_, first), (_, second) = self.stub.calls
+        self.assertLess(first["photo"]["size"], len(buffer.getvalue()))
+        cached = TelegramFile.objects.get(name=name)
+        self.assertEqual(second["photo"], cached.file_id)
+        self.assertFalse(NotificationJob.objects.exclude(status=NotificationJob.SENT).exists())
+
+
+class OutboxClaimTests(TestCase):
+    def test_renewed_claims_are_not_released_as_stale(self):
+        job = enqueue("sendMessage", {"chat_id": "-100", "text": "New order"})
+        self.assertEqual(claim([job]), [job])
+        later = timezone.now() + CLAIM_TIMEOUT + timedelta(seconds=1)
+
+        renew_claims([job], now=later - timedelta(seconds=30))
+        self.assertEqual(release_stale_claims(now=later), 0)
+        self.assertEqual(release_stale_claims(now=later + CLAIM_TIMEOUT), 1)
+
+    def test_worker_renews_claims_while_a_chat_is_still_sending(self):
+        for text in ("First", "Second"):
+            enqueue("sendMessage", {"chat_id": "-100", "text": text})
+
+        def slow_send(jobs, file_ids):
+            time.sleep(0.2)
+            return [(job, {}, None) for job in jobs]
+
+        worker = "accounts.management.commands.run_outbox_worker"
+        with mock.patch(f"{worker}.send_chat", side_effect=slow_send), mock.patch(
+            f"{worker}.CLAIM_RENEW_SECONDS", 0.02
+        ), mock.patch(f"{worker}.renew_claims", wraps=renew_claims) as renew:
+            call_command("run_outbox_worker", "--once", stdout=io.StringIO())
+
+        self.assertTrue(renew.called)
+        self.assertEqual([job.payload["text"] for job in renew.call_args.args[0]], ["First", "Second"])
+        self.assertEqual(NotificationJob.objects.filter(status=NotificationJob.SENT).count(), 2)
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class OrderEventSocketTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="owner", password="x", email="owner@example.com")
+        cls.other = User.objects.create(username="other", password="x", email="other@example.com")
+        cls.token = AuthToken.objects.create(key="w" * 40, user=cls.owner)
+        cls.orders = [
+            Order.objects.create(
+                user=user,
+                customer_name=user.username,
+                phone="012000000",
+                address="Phnom Penh",
+                total_amount=Decimal("1.00"),
+                payment_method="COD",
+            )
+            for user in (cls.other, cls.owner)
+        ]
+
+    def test_sockets_need_a_token_and_only_see_their_own_orders(self):
+        async_to_sync(self._check_sockets)()
+
+    # asgiref's communicator rather than channels.testing, which imports
+    # daphne; the deploy serves with uvicorn.
+    async def _connect(self, headers=()):
+        scope = {"type": "websocket", "path": "/ws/orders/", "query_string": b"", "headers": list(headers)}
+        socket = ApplicationCommunicator(OrderEventConsumer.as_asgi(), scope)
+        await socket.send_input({"type": "websocket.connect"})
+        reply = await socket.receive_output()
+        return socket, reply["type"] == "websocket.accept"
+
+    async def _check_sockets(self):
+        _, connected = await self._connect()
+        self.assertFalse(connected)
+
+        socket, connected = await self._connect([(b"authorization", f"Token {self.token.key}".encode())])
+        self.assertTrue(connected)
+        for order in self.orders:
+            await sync_to_async(_broadcast_order_event)(order, "created")
+        message = await socket.receive_output()
+        self.assertEqual(json.loads(message["text"])["order_id"], self.orders[1].id)
+        self.assertTrue(await socket.receive_nothing())
+        await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+        await socket.wait()
+
+
+class RecordingNotifyLayer(PostgresChannelLayer):
+    """
+    The PostgreSQL layer's send path with a NOTIFY stand-in any database
+    runs, so the transaction handling is tested on SQLite too.
+    """
+
+    notify_sql = "SELECT %s, %s"
+    sent = []
+
+    def _notify_sync(self, pg_channel, data):
+        super()._notify_sync(pg_channel, data)
+        self.sent.append(json.loads(data))
+
+
+@skipIf(psycopg is None, "psycopg is not installed")
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "accounts.tests.RecordingNotifyLayer"}})
+class ChannelLayerTransactionTests(TestCase):
+    def test_broadcast_inside_atomic_keeps_the_transaction(self):
+        RecordingNotifyLayer.sent.clear()
+        user = User.objects.create(username="atomic", password="x", email="atomic@example.com")
+        order = Order.objects.create(
+            user=user,
+            customer_name="Atomic",
+            phone="012000000",
+            address="Phnom Penh",
+            total_amount=Decimal("1.00"),
+            payment_method="COD",
+        )
+        with transaction.atomic(), mock.patch.object(connection, "close", wraps=connection.close) as close:
+            Order.objects.filter(pk=order.pk).update(order_status="confirmed")
+            _broadcast_order_event(order, "status_approve")
+            # Closing here would throw away the update above (SQLite's
+            # in-memory test database ignores close(), so check the call).
+            close.assert_not_called()
+            self.assertEqual(Order.objects.get(pk=order.pk).order_status, "confirmed")
+        self.assertEqual(
+            [message["g"] for message in RecordingNotifyLayer.sent], ["orders_admin", f"user_{user.pk}"]
+        )
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = json.dumps([{"id": index, "name": f"Product {index}"} for index in range(200)]).encode()
+
+    def _process(self, response, accept="gzip, deflate, br"):
+        request = RequestFactory().get("/api/products/", HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response).process_response(request, response)
+
+    def _json(self, body=None, **headers):
+        response = HttpResponse(self.body if body is None else body, content_type="application/json")
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    @skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred_when_accepted(self):
+        response = self._process(self._json())
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), self.body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzip_when_brotli_is_refused(self):
+        response = self._process(self._json(), accept="br;q=0, gzip;q=0.5")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_identity_still_varies_on_accept_encoding(self):
+        for accept in ("", "identity", "gzip;q=0, br;q=0"):
+            response = self._process(self._json(), accept=accept)
+            self.assertFalse(response.has_header("Content-Encoding"), accept)
+            self.assertEqual(response.content, self.body)
+            self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_small_bodies_are_sent_as_is(self):
+        response = self._process(self._json(b'{"ok": true}'))
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_encoded_and_html_responses_are_untouched(self):
+        encoded = self._process(self._json(**{"Content-Encoding": "gzip"}))
+        self.assertEqual(encoded.content, self.body)
+        self.assertFalse(encoded.has_header("Vary"))
+        html = self._process(HttpResponse(b"<p>csrf</p>" * 500, content_type="text/html"))
+        self.assertFalse(html.has_header("Content-Encoding"))
+
+    def test_streaming_responses_are_compressed_as_they_stream(self):
+        chunks = [self.body[index:index + 500] for index in range(0, len(self.body), 500)]
+        response = StreamingHttpResponse(iter(chunks), content_type="text/csv")
+        response["Content-Length"] = str(len(self.body))
+        response = self._process(response, accept="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("Content-Length"))
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.body)
+
+    def test_strong_etag_becomes_weak(self):
+        response = self._process(self._json(ETag='"v1"'), accept="gzip")
+        self.assertEqual(response["ETag"], 'W/"v1"')
+
+
+class CompressionConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title_en="Snacks", title_kh="Snacks")
+        for index in range(30):
+            Product.objects.create(
+                category=category, name=f"Snack {index}", price=Decimal("1.00"), quantity=5
+            )
+
+    def test_weak_etag_from_a_compressed_list_revalidates(self):
+        response = self.client.get("/api/products/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+
+        response = self.client.get("/api/products/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+@override_settings(MEDIA_CACHE_MAX_AGE=60, MEDIA_SENDFILE="")
+class MediaServingTests(SimpleTestCase):
+    content = b"0123456789" * 10
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.media_root = media_root.name
+        with open(f"{self.media_root}/notes.txt", "wb") as handle:
+            handle.write(self.content)
+        self.factory = RequestFactory()
+
+    def _get(self, path="notes.txt", method="get", **headers):
+        return serve_media(getattr(self.factory, method)(f"/media/{path}", **headers), path)
+
+    def _body(self, response):
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def test_full_response_carries_validators(self):
+        response = self._get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._body(response), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        self.assertTrue(response["ETag"].startswith('"'))
+        head = self._get(method="head")
+        self.assertEqual((head["Content-Length"], self._body(head)), (str(len(self.content)), b""))
+
+    def test_validators_answer_304(self):
+        first = self._get()
+
+        by_etag = self._get(HTTP_IF_NONE_MATCH=first["ETag"])
+        by_date = self._get(HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual((by_etag.status_code, by_date.status_code), (304, 304))
+        self.assertEqual(by_etag["ETag"], first["ETag"])
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_single_ranges(self):
+        response = self._get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(self._body(response), self.content[10:20])
+
+        suffix = self._get(HTTP_RANGE="bytes=-5")
+        self.assertEqual((suffix["Content-Range"], self._body(suffix)), ("bytes 95-99/100", self.content[-5:]))
+        self.assertEqual(self._get(HTTP_RANGE="bytes=90-")["Content-Length"], "10")
+
+        unsatisfiable = self._get(HTTP_RANGE="bytes=100-")
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable["Content-Range"]), (416, "bytes */100"))
+        # Multi-range and malformed headers get the whole file.
+        self.assertEqual(self._get(HTTP_RANGE="bytes=0-1,5-6").status_code, 200)
+        self.assertEqual(self._get(HTTP_RANGE="pages=1").status_code, 200)
+
+    def test_if_range_only_honours_the_current_etag(self):
+        etag = self._get()["ETag"]
+
+        self.assertEqual(self._get(HTTP_RANGE="bytes=0-4", HTTP_IF_RANGE=etag).status_code, 206)
+        stale = self._get(HTTP_RANGE="bytes=0-4", HTTP_IF_RANGE='"old"')
+        self.assertEqual((stale.status_code, self._body(stale)), (200, self.content))
+
+    def test_only_content_hashed_names_are_immutable(self):
+        hashed, legacy = "0123456789abcdef0123456789abcdef.txt", "upload_0123456789abcdef.txt"
+        for name in (hashed, legacy):
+            with open(f"{self.media_root}/{name}", "wb") as handle:
+                handle.write(b"x")
+
+        self.assertEqual(self._get(hashed)["Cache-Control"], "public, max-age=31536000, immutable")
+        # A legacy name with a timestamp or UUID fragment can be overwritten.
+        self.assertEqual(self._get(legacy)["Cache-Control"], "public, max-age=60")
+
+    def test_missing_files(self):
+        placeholder = self._get("products/gone.jpg")
+        self.assertEqual((placeholder.status_code, placeholder["Content-Type"]), (200, "image/svg+xml"))
+        self.assertEqual(placeholder["Cache-Control"], "no-cache")
+        self.assertEqual(self._get("products/gone.jpg", HTTP_IF_NONE_MATCH=placeholder["ETag"]).status_code, 304)
+
+        for path in ("gone.txt", "../settings.py", ""):
+            with self.assertRaises(Http404):
+                self._get(path)
+
+    @override_settings(MEDIA_SENDFILE="x-accel-redirect", MEDIA_ACCEL_REDIRECT_PREFIX="/protected/")
+    def test_sendfile_hands_the_body_to_the_proxy(self):
+        response = self._get()
+
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/notes.txt")
+        self.assertEqual(self._body(response), b"")
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+
+class HashedMediaStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(
+            MEDIA_ROOT=media_root.name,
+            STORAGES={
+                "default": {"BACKEND": "accounts.storage.HashedMediaStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.category = Category.objects.create(title_en="Tea", title_kh="Tea")
+
+    def _product(self, content):
+        product = Product.objects.create(category=self.category, name="Tea", price=Decimal("1.00"), quantity=1)
+        product.image.save("tea.jpg", ContentFile(content))
+        return product
+
+    def test_prune_removes_only_unreferenced_hashed_files(self):
+        first = self._product(b"shared")
+        self._product(b"shared")
+        replaced = first.image.name
+        first.image.save("tea.jpg", ContentFile(b"new"))
+        lone = self._product(b"old")
+        orphan = lone.image.name
+        lone.image.save("tea.jpg", ContentFile(b"newer"))
+        # The old file is shared or may still be served, so saving keeps it.
+        self.assertTrue(default_storage.exists(orphan))
+        MediaManifest.objects.update(created_at=timezone.now() - timedelta(days=2))
+        recent = default_storage.save("products/tea.jpg", ContentFile(b"not committed yet"))
+
+        out = io.StringIO()
+        call_command("media_fix", "--prune-hashed", stdout=out)
+
+        self.assertIn("Pruned 1 unreferenced hashed files.", out.getvalue())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertFalse(MediaManifest.objects.filter(hashed_name=orphan).exists())
+        for name in (replaced, first.image.name, lone.image.name, recent):
+            self.assertTrue(default_storage.exists(name))
+
+
+class MessagePackTests(TestCase):
+    def test_renderer_and_parser_round_trip(self):
+        data = {
+            "price": Decimal("12.50"),
+            "created_at": datetime(2025, 3, 8, 9, 42, tzinfo=dt_timezone.utc),
+            "tags": ("rice", "sale"),
+            "note": "ស្រូវ",
+        }
+        body = MessagePackRenderer().render(data)
+        parsed = MessagePackParser().parse(io.BytesIO(body))
+        self.assertEqual(
+            parsed,
+            {
+                # Decimals stay lossless, as strings.
+                "price": "12.50",
+                "created_at": "2025-03-08T09:42:00+00:00",
+                "tags": ["rice", "sale"],
+                "note": "ស្រូវ",
+            },
+        )
+
+    def test_api_negotiates_msgpack_both_ways(self):
+        category = Category.objects.create(title_en="Rice", title_kh="Rice")
+        Product.objects.create(category=category, name="Jasmine", price=Decimal("3.25"), quantity=4)
+        response = self.client.get("/api/products/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(self.client.get("/api/products/").content))
+
+        User.objects.create(
+            username="packer", password=make_password("secret"), email="packer@example.com", phone="011222333"
+        )
+        response = self.client.post(
+            "/api/login/",
+            msgpack.packb({"phone": "011222333", "password": "secret"}),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(msgpack.unpackb(response.content)["token"])
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(title_en="Rice", title_kh="អង្ករ")
+
+    def test_a_rejected_batch_reports_only_the_rows_at_fault(self):
+        csv_file = io.BytesIO(
+            b"sku,name,category,price,quantity\n"
+            b"R-1,Jasmine,Rice,3.50,10\n"
+            b"BAD,Broken,Rice,1.00,1\n"
+            b"R-2,Sticky,\xe1\x9e\xa2\xe1\x9e\x84\xe1\x9f\x92\xe1\x9e\x80\xe1\x9e\x9a,2.00,5\n"
+        )
+        bulk_create = Product.objects.bulk_create
+
+        def reject_bad(objs, **kwargs):
+            if any(product.sku == "BAD" for product in objs):
+                raise IntegrityError("constraint failed")
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Product.objects, "bulk_create", side_effect=reject_bad):
+            result = import_products(csv_file, "products.csv")
+
+        self.assertEqual((result.rows, result.imported, result.failed), (3, 2, 1))
+        self.assertEqual(result.errors, [(3, "Database error: constraint failed")])
+        self.assertEqual(sorted(Product.objects.values_list("sku", flat=True)), ["R-1", "R-2"])
+
+    def test_xlsx_files_import(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(["SKU", "Name", "Category", "Price", "Quantity"])
+        workbook.active.append(["X-1", "Fragrant", "Rice", 4.25, 7])
+        data = io.BytesIO()
+        workbook.save(data)
+        data.seek(0)
+
+        result = import_products(data, "products.xlsx")
+
+        self.assertEqual((result.imported, result.failed), (1, 0))
+        product = Product.objects.get(sku="X-1")
+        self.assertEqual((product.price, product.quantity), (Decimal("4.25"), 7))
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rice = Category.objects.create(title_en="Rice", title_kh="អង្ករ")
+        kitchen = Category.objects.create(title_en="Kitchen", title_kh="ផ្ទះបាយ")
+        cls.jasmine = Product.objects.create(
+            category=rice, name="អង្ករផ្កាម្លិះ Jasmine", price=Decimal("3.50"), quantity=10
+        )
+        cls.cooker = Product.objects.create(
+            category=kitchen, name="Rice cooker", price=Decimal("25.00"), quantity=2
+        )
+        cls.flower = Product.objects.create(
+            category=kitchen, name="ផ្កា vase", price=Decimal("4.00"), quantity=3
+        )
+
+    def test_khmer_is_indexed_as_cluster_unigrams_and_bigrams(self):
+        # អ + ង្ក (subscript) + រ
+        self.assertEqual(index_terms("អង្ករ", 6), {"អ": 3, "ង្ក": 3, "រ": 3, "អង្ក": 6, "ង្ករ": 6})
+        self.assertEqual(query_terms("ផ្កាម្លិះ"), ["ផ្កាម្លិះ"])
+        self.assertEqual(query_terms("ផ្កា"), ["ផ្កា"])
+        self.assertEqual(query_terms("ឆ្នាំ២០២៥"), ["ឆ្នាំ", "2025"])
+
+    def test_latin_words_are_indexed_with_their_prefixes(self):
+        terms = index_terms("Jasmine!", 6)
+
+        self.assertEqual(terms["jasmine"], 6)
+        self.assertEqual([terms[prefix] for prefix in ("ja", "jas", "jasmin")], [3, 3, 3])
+        self.assertNotIn("j", terms)
+        self.assertEqual(query_terms("  JAS,  rice "), ["jas", "rice"])
+
+    def test_khmer_substrings_match(self):
+        self.assertEqual([pk for pk, _ in search_product_ids("ផ្កាម្លិះ")], [self.jasmine.pk])
+        self.assertEqual(
+            sorted(pk for pk, _ in search_product_ids("ផ្កា")), sorted([self.jasmine.pk, self.flower.pk])
+        )
+        # Both clusters occur, but not next to each other.
+        self.assertEqual(search_product_ids("ផ្កាអង្ករ"), [])
+
+    def test_latin_prefixes_match_and_every_term_is_required(self):
+        self.assertEqual([pk for pk, _ in search_product_ids("jas")], [self.jasmine.pk])
+        self.assertEqual([pk for pk, _ in search_product_ids("rice coo")], [self.cooker.pk])
+        self.assertEqual(search_product_ids("jasmine cooker"), [])
+        self.assertEqual(search_product_ids("  ,; "), [])
+
+    def test_name_matches_outrank_category_matches(self):
+        results = search_product_ids("rice")
+
+        self.assertEqual([pk for pk, _ in results], [self.cooker.pk, self.jasmine.pk])
+        self.assertGreater(results[0][1], results[1][1])
+        # One extra row tells the caller there is a next page.
+        self.assertEqual(len(search_product_ids("rice", limit=1)), 2)
+        self.assertEqual([pk for pk, _ in search_product_ids("rice", limit=1, offset=1)], [self.jasmine.pk])
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, IMAGE_VARIANT_WIDTHS=(160, 320))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.category = Category.objects.create(title_en="Tea", title_kh="Tea")
+
+    def _upload(self, name, content):
+        product = Product(category=self.category, name=name, price=Decimal("1.00"), quantity=1)
+        product.image.save(f"{name}.jpg", ContentFile(content), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        return product
+
+    def test_variants_are_built_by_the_worker_not_on_save(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600), "green").save(buffer, "JPEG")
+        product = self._upload("green", buffer.getvalue())
+        broken = self._upload("broken", b"not an image")
+
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+        response = self.client.get(f"/api/products/{product.pk}/")
+        self.assertEqual(response.data["image_variants"], {})
+        self.assertTrue(response.data["image_url"])
+
+        out = io.StringIO()
+        call_command("build_image_variants", "--model", "product", stdout=out)
+        self.assertIn("product: 1 built, 1 unreadable", out.getvalue())
+        product.refresh_from_db()
+        self.assertEqual(sorted(product.image_variants["webp"]), ["160", "320"])
+        response = self.client.get(f"/api/products/{product.pk}/")
+        self.assertEqual(sorted(response.data["image_variants"]["webp"]), ["160", "320"])
+
+        # Neither the built nor the unreadable image is picked up again.
+        out = io.StringIO()
+        call_command("build_image_variants", "--model", "product", stdout=out)
+        self.assertIn("product: up to date", out.getvalue())
+        broken.refresh_from_db()
+        self.assertEqual(broken.image_variants, {"source": broken.image.name})
+
+    def _jpeg(self, colour="green"):
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600), colour).save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    def test_uploads_are_queued_and_built_by_the_watch_worker(self):
+        product = self._upload("green", self._jpeg())
+        broken = self._upload("broken", b"not an image")
+        self.assertEqual(
+            sorted(ImageVariantJob.objects.values_list("object_id", flat=True)), sorted([product.pk, broken.pk])
+        )
+
+        self.assertEqual(work_queue(), (1, 1, 0))
+        self.assertFalse(ImageVariantJob.objects.exists())
+        product.refresh_from_db()
+        self.assertEqual(sorted(product.image_variants["webp"]), ["160", "320"])
+        broken.refresh_from_db()
+        self.assertEqual(broken.image_variants, {"source": broken.image.name})
+
+        # Saving without a new image queues nothing.
+        product.name = "Green tea"
+        product.save()
+        self.assertFalse(ImageVariantJob.objects.exists())
+        product.image.save("green2.jpg", ContentFile(self._jpeg("red")))
+        self.assertEqual(ImageVariantJob.objects.get().object_id, product.pk)
+
+    def test_unreadable_files_are_retried_not_recorded_as_done(self):
+        product = self._upload("green", self._jpeg())
+
+        with mock.patch("accounts.images.Image.open", side_effect=OSError("image file is truncated")):
+            self.assertEqual(work_queue(), (0, 0, 1))
+        job = ImageVariantJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("truncated", job.last_error)
+        self.assertGreater(job.next_attempt_at, timezone.now())
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+        # Not due yet.
+        self.assertEqual(work_queue(), (0, 0, 0))
+
+        self.assertEqual(work_queue(now=job.next_attempt_at), (1, 0, 0))
+        self.assertFalse(ImageVariantJob.objects.exists())
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants["source"], product.image.name)
+
+    def test_one_off_runs_leave_unreadable_files_pending(self):
+        product = self._upload("green", self._jpeg())
+        out, err = io.StringIO(), io.StringIO()
+
+        with mock.patch("accounts.images.Image.open", side_effect=OSError("image file is truncated")):
+            call_command("build_image_variants", "--model", "product", stdout=out, stderr=err)
+        self.assertIn("product: 0 built, 0 unreadable, 1 failed", out.getvalue())
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
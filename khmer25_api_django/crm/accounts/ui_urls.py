@@ -9,6 +9,7 @@ urlpatterns = [
     path("dashbord/", ui_views.dashboard_view, name="admin-dashboard-legacy"),
     path("products/", ui_views.products_list_view, name="admin-products-list"),
     path("products/new/", ui_views.products_form_view, name="admin-products-new"),
+    path("products/import/", ui_views.products_import_view, name="admin-products-import"),
     path("products/<int:product_id>/edit/", ui_views.products_edit_view, name="admin-products-edit"),
     path("products/<int:product_id>/delete/", ui_views.products_delete_view, name="admin-products-delete"),
     path("products/<int:product_id>/", ui_views.products_detail_view, name="admin-products-detail"),
@@ -7,6 +7,7 @@ import re
 from decimal import Decimal, InvalidOperation
 
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
 from django.db.models.functions import Coalesce, TruncDate
 from django.http import HttpResponse, JsonResponse
@@ -14,6 +15,10 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
 
+from .catalog import bump_catalog_version
+from .importer import ImportFileError, import_products
+from .inventory import InsufficientStock, secure_stock
+from .search import index_category
 from .models import AdminProfile, Banner, Category, Order, OrderItem, Product, User
 
 PAYWAY_SAMPLE_LINK = "https://link.payway.com.kh/aba?id=BC9C1637D99A&dynamic=true&source_caller=sdk&pid=af_app_invites&link_action=abaqr&shortlink=qom57m9s&created_from_app=true&acc=007253721&af_siteid=968860649&userid=BC9C1637D99A&code=099743&c=abaqr&af_referrer_uid=1695695806092-3948219"
@@ -463,6 +468,21 @@ def products_edit_view(request, product_id):
     )
 
 
+@require_admin
+def products_import_view(request):
+    context = {}
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if not upload:
+            context["error"] = "Please choose a CSV or XLSX file."
+        else:
+            try:
+                context["result"] = import_products(upload.file, upload.name)
+            except ImportFileError as exc:
+                context["error"] = str(exc)
+    return render(request, "pages/products/import.html", context)
+
+
 @require_admin
 def products_delete_view(request, product_id):
     if request.method == "POST":
@@ -499,6 +519,9 @@ def categories_list_view(request):
                     title_en=name_en,
                     title_kh=name_kh,
                 )
+                # queryset.update() skips post_save, so do its work here.
+                bump_catalog_version("category")
+                index_category(category_id)
                 if image:
                     category = Category.objects.get(pk=category_id)
                     category.image = image
@@ -539,10 +562,21 @@ def orders_detail_view(request, order_id):
     order = get_object_or_404(Order.objects.select_related("user"), pk=order_id)
     if request.method == "POST":
         if request.POST.get("action") == "mark_delivered":
-            order.order_status = "completed"
-            order.payment_status = "paid"
-            order.save(update_fields=["order_status", "payment_status"])
-            if request.headers.get("x-requested-with") == "XMLHttpRequest":
+            ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
+            try:
+                with transaction.atomic():
+                    order = Order.objects.select_for_update().get(pk=order.pk)
+                    secure_stock(order)
+                    order.order_status = "completed"
+                    order.payment_status = "paid"
+                    order.save(update_fields=["order_status", "payment_status"])
+            except InsufficientStock as exc:
+                if ajax:
+                    return JsonResponse({"status": "error", "detail": str(exc)}, status=409)
+                return redirect(
+                    f"{reverse('admin-orders-detail', kwargs={'order_id': order.id})}?status=out_of_stock"
+                )
+            if ajax:
                 return JsonResponse({"status": "ok"})
             return redirect(f"{reverse('admin-orders-detail', kwargs={'order_id': order.id})}?status=delivered")
     items = OrderItem.objects.filter(order=order).select_related("product")
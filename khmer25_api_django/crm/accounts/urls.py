@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     CategoryViewSet, ProductViewSet, UserViewSet, CartViewSet, OrderViewSet,
-    OrderItemViewSet,  BannerViewSet,
+    OrderItemViewSet,  BannerViewSet, home_feed,
     SupplierViewSet, register_user, login_user, get_user_info,
     telegram_webhook, create_payway_payment, payway_callback,
     create_qr_payment, upload_qr_receipt, get_qr_payment,
@@ -22,6 +22,8 @@ router.register(r'suppliers', SupplierViewSet)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("home/", home_feed, name="home-feed"),
+    path("home", home_feed, name="home-feed-ns"),
     # Auth endpoints reachable at /api/register and /api/login
     path("register/", register_user, name="register-user"),
     path("register", register_user, name="register-user-ns"),
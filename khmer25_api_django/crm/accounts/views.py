@@ -7,13 +7,13 @@ from decimal import Decimal
 from typing import Optional
 from urllib.parse import urlencode, urlparse, parse_qsl, urlunparse, quote
 
-import requests
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.conf import settings
 from django.contrib.auth.hashers import check_password
 from django.db import transaction
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.utils.html import escape
 from django.views.decorators.csrf import csrf_exempt
@@ -32,6 +32,7 @@ from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from .models import (
     Category,
     Product,
@@ -58,16 +59,38 @@ from .serializers import (
     PaymentSerializer,
 )
 from .authentication import AuthTokenAuthentication
+from .catalog import (
+    CatalogETagMixin,
+    apply_catalog_headers,
+    catalog_etag,
+    etag_matches,
+    get_catalog_fragment,
+    get_catalog_versions,
+    not_modified,
+)
+from .consumers import ADMIN_GROUP, user_group
+from .fieldsets import SparseQuerysetMixin, selected_field_names
+from .idempotency import idempotent
+from .filters import ProductFilterBackend
+from .inventory import (
+    InsufficientStock,
+    reclaim_stock,
+    release_stock,
+    reservation_expiry,
+    secure_stock,
+)
+from .orders import (
+    OrderInputError,
+    create_order,
+    order_detail_prefetches,
+    parse_order_lines,
+    prefetch_order_details,
+)
+from .outbox import enqueue
+from .pagination import KeysetPagination, positive_int
+from .search import search_product_ids
+from .telegram import telegram_config
 
-# Telegram configuration (provided by client)
-TELEGRAM_BOT_TOKEN = "8342567023:AAE_GIwaUb5yEoHHlHRFdz0jzsNjc6ksClM"
-TELEGRAM_CHAT_ID = "-1003393371435"
-
-
-def _get_telegram_config():
-    token = getattr(settings, "TELEGRAM_BOT_TOKEN", None) or TELEGRAM_BOT_TOKEN
-    chat_id = getattr(settings, "TELEGRAM_CHAT_ID", None) or TELEGRAM_CHAT_ID
-    return token, chat_id
 
 
 def _format_amount(value: Decimal) -> str:
@@ -193,9 +216,11 @@ def _broadcast_order_event(order: Order, event_type: str, extra: Optional[dict]
     }
     if extra:
         payload.update(extra)
-    async_to_sync(channel_layer.group_send)("orders", payload)
+    # One message per interested socket: the owner's devices and the admin
+    # dashboards.
+    async_to_sync(channel_layer.group_send)(ADMIN_GROUP, payload)
     if order.user_id:
-        async_to_sync(channel_layer.group_send)(f"user_{order.user_id}", payload)
+        async_to_sync(channel_layer.group_send)(user_group(order.user_id), payload)
 
 def _get_order_by_identifier(identifier: Optional[str]) -> Optional[Order]:
     if not identifier:
@@ -221,16 +246,54 @@ def _normalize_payload_dict(data) -> dict:
     except Exception:
         return {}
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogETagMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    catalog_sections = ("category",)
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    pagination_class = KeysetPagination
+    keyset_orderings = {"id": ("id",)}
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogETagMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    # Product rows embed category_name, so category edits change this list too.
+    catalog_sections = ("product", "category")
     queryset = Product.objects.select_related("category").all()
     serializer_class = ProductSerializer
     parser_classes = [MultiPartParser, FormParser]
     authentication_classes = [AuthTokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_orderings = {
+        "newest": ("-product_date", "-id"),
+        "id": ("id",),
+    }
+    sparse_required_fields = ("id", "product_date")
+    filter_backends = [ProductFilterBackend]
+
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        """
+        Ranked search over product names and category titles (Khmer/English).
+        Query params: q (required), page, page_size.
+        """
+        query = (request.query_params.get("q") or "").strip()
+        if not query:
+            return Response(
+                {"detail": "Query parameter 'q' is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page_size = self.paginator.get_page_size(request)
+        page = positive_int(request.query_params.get("page"), 1)
+        ranked = search_product_ids(query, limit=page_size, offset=(page - 1) * page_size)
+        has_next = len(ranked) > page_size
+        ranked = ranked[:page_size]
+
+        products = self.get_queryset().in_bulk([product_id for product_id, _ in ranked])
+        results = [products[product_id] for product_id, _ in ranked if product_id in products]
+        serializer = self.get_serializer(results, many=True)
+        next_url = None
+        if has_next:
+            next_url = replace_query_param(request.build_absolute_uri(), "page", page + 1)
+        return Response({"query": query, "next": next_url, "results": serializer.data})
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -244,12 +307,15 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]      # <--- IMPORTANT
 
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all().order_by("-created_at")
+class OrderViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.all().order_by("-created_at", "-id")
     serializer_class = OrderSerializer
     parser_classes = [MultiPartParser, FormParser]
     authentication_classes = [AuthTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_orderings = {"newest": ("-created_at", "-id")}
+    sparse_required_fields = ("id", "created_at")
 
     def get_permissions(self):
         if self.action in ("approve", "reject"):
@@ -261,7 +327,11 @@ class OrderViewSet(viewsets.ModelViewSet):
         user = getattr(self.request, "user", None)
         if not getattr(user, "is_authenticated", False):
             return qs.none()
-        return qs.filter(user=user).order_by("-created_at")
+        qs = qs.filter(user=user).order_by("-created_at", "-id")
+        if self.action in ("list", "retrieve"):
+            fields = selected_field_names(self.request, self.get_serializer_class())
+            qs = qs.prefetch_related(*order_detail_prefetches(fields))
+        return qs
 
     @action(detail=True, methods=["post"], url_path="approve", permission_classes=[AllowAny])
     def approve(self, request, pk=None):
@@ -293,6 +363,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             status=status_code,
         )
 
+    @method_decorator(idempotent("orders.create"))
     def create(self, request, *args, **kwargs):
         """
         Accepts multipart form-data with:
@@ -324,29 +395,6 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # compute totals
-        total = Decimal("0")
-        product_items = []
-        for item in items:
-            try:
-                qty = int(item.get("qty") or item.get("quantity") or 0)
-                price = Decimal(str(item.get("price") or "0"))
-            except Exception:
-                return Response(
-                    {"detail": f"Invalid price/quantity in item {item}"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            if qty <= 0:
-                continue
-            total += price * qty
-            product_items.append((item, qty, price))
-
-        if total <= 0:
-            return Response(
-                {"detail": "Order total must be greater than zero."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
         user = getattr(request, "user", None)
         if not getattr(user, "is_authenticated", False):
             user = None
@@ -356,52 +404,46 @@ class OrderViewSet(viewsets.ModelViewSet):
         payment_status = "pending"  # represents unpaid/awaiting verification
         order_status = "confirmed" if is_cod else "pending"
 
-        order = Order.objects.create(
-            user=user,
-            customer_name=data.get("name") or data.get("customer_name") or "",
-            phone=data.get("phone") or "",
-            address=data.get("address") or "",
-            total_amount=total,
-            payment_method=payment_method,
-            payment_status=payment_status,
-            order_status=order_status,
-            note=data.get("note") or "",
-        )
-
-        for item, qty, price in product_items:
-            product_id = item.get("id")
-            try:
-                product_obj = Product.objects.get(pk=int(product_id))
-            except (TypeError, ValueError, Product.DoesNotExist):
-                return Response(
-                    {"detail": f"Product not found for item {item}"},
-                    status=status.HTTP_400_BAD_REQUEST,
+        # Items are priced from the catalog; client-sent prices are ignored.
+        # The notification is queued in the same transaction as the order.
+        try:
+            with transaction.atomic():
+                order = create_order(
+                    parse_order_lines(items),
+                    user=user,
+                    customer_name=data.get("name") or data.get("customer_name") or "",
+                    phone=data.get("phone") or "",
+                    address=data.get("address") or "",
+                    payment_method=payment_method,
+                    payment_status=payment_status,
+                    order_status=order_status,
+                    note=data.get("note") or "",
                 )
 
-            OrderItem.objects.create(
-                order=order,
-                product=product_obj,
-                product_name=item.get("title") or "",
-                price=price,
-                quantity=qty,
-            )
+                receipt_file = request.data.get("receipt")
+                if receipt_file:
+                    Payment.objects.create(
+                        order=order,
+                        method=payment_method,
+                        amount=order.total_amount,
+                        receipt_image=receipt_file,
+                        receipt_uploaded_at=timezone.now(),
+                        status="pending",
+                    )
 
-        receipt_file = request.data.get("receipt")
-        if receipt_file:
-            Payment.objects.create(
-                order=order,
-                method=payment_method,
-                amount=total,
-                receipt_image=receipt_file,
-                receipt_uploaded_at=timezone.now(),
-                status="pending",
+                if payment_method == "COD":
+                    self._send_telegram_notification(order, request)
+        except OrderInputError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as exc:
+            return Response(
+                {"detail": str(exc), "product_id": exc.product.pk},
+                status=status.HTTP_409_CONFLICT,
             )
 
-        if payment_method == "COD":
-            self._send_telegram_notification(order, request)
-
         _broadcast_order_event(order, "created")
 
+        prefetch_order_details([order])
         serializer = self.get_serializer(order)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -411,209 +453,162 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def _send_telegram_notification(self, order: Order, request):
         """
-        Push order details to Telegram chat with inline Approve/Reject buttons.
+        Queue order details for the Telegram chat with inline Approve/Reject
+        buttons (delivered by run_outbox_worker).
         """
-        try:
-            token, chat_id = _get_telegram_config()
-            if not token or not chat_id:
-                return
-
-            receipt_file = None
-            receipt_url = None
-            payment = order.payments.first()
-            if payment and payment.receipt_image:
-                try:
-                    # Prefer sending the binary to Telegram to avoid inaccessible hostnames
-                    receipt_file = payment.receipt_image.path
-                except Exception:
-                    receipt_file = None
-                if not receipt_file:
-                    try:
-                        receipt_url = request.build_absolute_uri(payment.receipt_image.url)
-                    except Exception:
-                        receipt_url = payment.receipt_image.url
-
-            created_at = timezone.localtime(order.created_at).strftime("%Y-%m-%d %H:%M")
-            title_prefix = "New COD Order" if order.payment_method == "COD" else "New PayByQR Order"
-            location_link = _build_location_link(order.address)
-            lines = [
-                f"🧾 {title_prefix} ({escape(order.payment_status).title()})",
-                f"OrderCode: {escape(order.order_code)}",
-                f"Name: {escape(order.customer_name)}",
-                f"Phone: {escape(order.phone)}",
-                f"Address: {escape(order.address)}",
-                f"Payment: {escape(order.payment_method)}",
-                f"Status: {escape(order.payment_status)}",
-                f"Date: {created_at}",
-            ]
-            if location_link:
-                lines.append(f'Location: <a href="{escape(location_link)}">Open Map</a>')
-            if order.note:
-                lines.append(f"Note: {escape(order.note)}")
-
-            lines.append("Items:")
-            for item in order.items.all():
-                lines.append(
-                    f"- {escape(item.product_name)} — QTY {item.quantity} — ${item.price} — Subtotal ${item.subtotal or 0}"
-                )
-
-            lines.append(f"Total: ${order.total_amount}")
-            if order.payment_method != "COD":
-                payway_link = ""
-                for item in order.items.select_related("product").all():
-                    link = getattr(item.product, "payway_link", "") if item.product else ""
-                    if link:
-                        payway_link = _with_amount_url(
-                            link, Decimal(str(order.total_amount))
-                        )
-                        break
-                if payway_link:
-                    lines.append(f"PayWay Link: {escape(payway_link)}")
-            lines.append("✅ Receipt Image:" if (receipt_file or receipt_url) else "Receipt: (not provided)")
-
-            text = "\n".join(lines)
-
-            keyboard = None
-            if order.payment_method != "COD" and order.payment_status == "pending":
-                # Allow admins to resolve pending payments directly from Telegram
-                keyboard = {
-                    "inline_keyboard": [
-                        [
-                            {"text": "✅ Approve", "callback_data": f"approve:{order.id}"},
-                            {"text": "❌ Reject", "callback_data": f"reject:{order.id}"},
-                        ]
-                    ]
-                }
-
-            base = f"https://api.telegram.org/bot{token}"
-            payload = {
-                "chat_id": chat_id,
-                "parse_mode": "HTML",
-            }
-            if keyboard:
-                payload["reply_markup"] = json.dumps(keyboard)
-            if receipt_file:
-                with open(receipt_file, "rb") as fh:
-                    files = {"photo": fh}
-                    payload.update({"caption": text})
-                    requests.post(f"{base}/sendPhoto", data=payload, files=files, timeout=10)
-            elif receipt_url:
-                payload.update({"photo": receipt_url, "caption": text})
-                requests.post(f"{base}/sendPhoto", data=payload, timeout=10)
-            else:
-                payload.update({"text": text})
-                # If we have no keyboard (e.g. already paid), still send message
-                if keyboard:
-                    requests.post(f"{base}/sendMessage", data=payload, timeout=10)
-                else:
-                    requests.post(
-                        f"{base}/sendMessage",
-                        json=payload,
-                        timeout=10,
-                    )
-        except Exception as exc:
-            # Do not break order creation if Telegram fails
-            print(f"[telegram] failed to send notification: {exc}")
-
-
-def _send_telegram_receipt_upload(order: Order, payment: Payment, request):
-    try:
-        token, chat_id = _get_telegram_config()
+        token, chat_id = telegram_config()
         if not token or not chat_id:
             return
-        receipt_file = None
+
+        receipt_name = ""
         receipt_url = None
-        if payment.receipt_image:
-            try:
-                receipt_file = payment.receipt_image.path
-            except Exception:
-                receipt_file = None
+        payment = order.payments.first()
+        if payment and payment.receipt_image:
+            # The worker uploads the file itself; the URL is its fallback.
+            receipt_name = payment.receipt_image.name
             try:
                 receipt_url = request.build_absolute_uri(payment.receipt_image.url)
             except Exception:
                 receipt_url = payment.receipt_image.url
+
         created_at = timezone.localtime(order.created_at).strftime("%Y-%m-%d %H:%M")
-        status_map = {
-            "pending": "⏳ Pending",
-            "verified": "✅ Paid",
-            "rejected": "❌ Rejected",
-            "failed": "❌ Failed",
-        }
-        status_text = status_map.get(payment.status, payment.status)
-        method_labels = {
-            "COD": "Cash on Delivery (COD)",
-            "ABA_QR": "ABA QR",
-            "AC_QR": "AC QR",
-            "ABA_PAYWAY": "ABA PayWay",
-        }
-        method_text = method_labels.get(payment.method, payment.method)
+        title_prefix = "New COD Order" if order.payment_method == "COD" else "New PayByQR Order"
         location_link = _build_location_link(order.address)
         lines = [
-            "🧾 PAYMENT RECEIPT UPLOADED",
-            "",
-            f"Order Code: {order.order_code}",
+            f"🧾 {title_prefix} ({escape(order.payment_status).title()})",
+            f"OrderCode: {escape(order.order_code)}",
+            f"Name: {escape(order.customer_name)}",
+            f"Phone: {escape(order.phone)}",
+            f"Address: {escape(order.address)}",
+            f"Payment: {escape(order.payment_method)}",
+            f"Status: {escape(order.payment_status)}",
             f"Date: {created_at}",
-            "",
-            "👤 Customer Information",
-            f"Name: {order.customer_name or 'Guest'}",
-            f"Phone: {order.phone or 'N/A'}",
-            f"Address: {order.address or '-'}",
-            "",
-            "💳 Payment Details",
-            f"Method: {method_text}",
-            f"Status: {status_text}",
-            "",
-            "📦 Order Items",
         ]
         if location_link:
-            lines.extend(["📍 Location", location_link, ""])
-        index = 1
+            lines.append(f'Location: <a href="{escape(location_link)}">Open Map</a>')
+        if order.note:
+            lines.append(f"Note: {escape(order.note)}")
+
+        lines.append("Items:")
         for item in order.items.all():
-            lines.extend(
-                [
-                    f"{index}️⃣ {item.product_name}",
-                    f"• Qty: {item.quantity}",
-                    f"• Price: ${item.price}",
-                    f"• Subtotal: ${item.subtotal or 0}",
-                    "",
-                ]
+            lines.append(
+                f"- {escape(item.product_name)} — QTY {item.quantity} — ${item.price} — Subtotal ${item.subtotal or 0}"
             )
-            index += 1
+
+        lines.append(f"Total: ${order.total_amount}")
+        if order.payment_method != "COD":
+            payway_link = ""
+            for item in order.items.select_related("product").all():
+                link = getattr(item.product, "payway_link", "") if item.product else ""
+                if link:
+                    payway_link = _with_amount_url(
+                        link, Decimal(str(order.total_amount))
+                    )
+                    break
+            if payway_link:
+                lines.append(f"PayWay Link: {escape(payway_link)}")
+        lines.append("✅ Receipt Image:" if (receipt_name or receipt_url) else "Receipt: (not provided)")
+
+        text = "\n".join(lines)
+
+        payload = {
+            "chat_id": chat_id,
+            "parse_mode": "HTML",
+        }
+        if order.payment_method != "COD" and order.payment_status == "pending":
+            # Allow admins to resolve pending payments directly from Telegram
+            payload["reply_markup"] = {
+                "inline_keyboard": [
+                    [
+                        {"text": "✅ Approve", "callback_data": f"approve:{order.id}"},
+                        {"text": "❌ Reject", "callback_data": f"reject:{order.id}"},
+                    ]
+                ]
+            }
+        if receipt_url:
+            payload.update({"photo": receipt_url, "caption": text})
+            enqueue("sendPhoto", payload, attachment=receipt_name)
+        else:
+            payload["text"] = text
+            enqueue("sendMessage", payload)
+
+
+def _send_telegram_receipt_upload(order: Order, payment: Payment, request):
+    """
+    Queue the receipt photo and order summary for the Telegram chat.
+    """
+    token, chat_id = telegram_config()
+    if not token or not chat_id:
+        return
+    receipt_name = ""
+    receipt_url = None
+    if payment.receipt_image:
+        receipt_name = payment.receipt_image.name
+        try:
+            receipt_url = request.build_absolute_uri(payment.receipt_image.url)
+        except Exception:
+            receipt_url = payment.receipt_image.url
+    created_at = timezone.localtime(order.created_at).strftime("%Y-%m-%d %H:%M")
+    status_map = {
+        "pending": "⏳ Pending",
+        "verified": "✅ Paid",
+        "rejected": "❌ Rejected",
+        "failed": "❌ Failed",
+    }
+    status_text = status_map.get(payment.status, payment.status)
+    method_labels = {
+        "COD": "Cash on Delivery (COD)",
+        "ABA_QR": "ABA QR",
+        "AC_QR": "AC QR",
+        "ABA_PAYWAY": "ABA PayWay",
+    }
+    method_text = method_labels.get(payment.method, payment.method)
+    location_link = _build_location_link(order.address)
+    lines = [
+        "🧾 PAYMENT RECEIPT UPLOADED",
+        "",
+        f"Order Code: {order.order_code}",
+        f"Date: {created_at}",
+        "",
+        "👤 Customer Information",
+        f"Name: {order.customer_name or 'Guest'}",
+        f"Phone: {order.phone or 'N/A'}",
+        f"Address: {order.address or '-'}",
+        "",
+        "💳 Payment Details",
+        f"Method: {method_text}",
+        f"Status: {status_text}",
+        "",
+        "📦 Order Items",
+    ]
+    if location_link:
+        lines.extend(["📍 Location", location_link, ""])
+    index = 1
+    for item in order.items.all():
         lines.extend(
             [
-                "💰 Total Amount",
-                f"🟢 ${order.total_amount}",
+                f"{index}️⃣ {item.product_name}",
+                f"• Qty: {item.quantity}",
+                f"• Price: ${item.price}",
+                f"• Subtotal: ${item.subtotal or 0}",
+                "",
             ]
         )
-        if order.note:
-            lines.extend(["", "📝 Note", order.note])
-        text = "\n".join(lines)
-        base = f"https://api.telegram.org/bot{token}"
-        if receipt_file:
-            with open(receipt_file, "rb") as fh:
-                files = {"photo": fh}
-                payload = {"chat_id": chat_id, "caption": text}
-                requests.post(
-                    f"{base}/sendPhoto",
-                    data=payload,
-                    files=files,
-                    timeout=10,
-                )
-        elif receipt_url:
-            payload = {"chat_id": chat_id, "photo": receipt_url, "caption": text}
-            requests.post(
-                f"{base}/sendPhoto",
-                data=payload,
-                timeout=10,
-            )
-        else:
-            requests.post(
-                f"{base}/sendMessage",
-                json={"chat_id": chat_id, "text": text},
-                timeout=10,
-            )
-    except Exception as exc:
-        print(f"[telegram] receipt upload notify failed: {exc}")
+        index += 1
+    lines.extend(
+        [
+            "💰 Total Amount",
+            f"🟢 ${order.total_amount}",
+        ]
+    )
+    if order.note:
+        lines.extend(["", "📝 Note", order.note])
+    text = "\n".join(lines)
+    if receipt_url:
+        payload = {"chat_id": chat_id, "photo": receipt_url, "caption": text}
+        enqueue("sendPhoto", payload, attachment=receipt_name)
+    else:
+        enqueue("sendMessage", {"chat_id": chat_id, "text": text})
 
 class OrderItemViewSet(viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
@@ -625,13 +620,61 @@ class OrderItemViewSet(viewsets.ModelViewSet):
 
 
 
-class BannerViewSet(viewsets.ModelViewSet):
+class BannerViewSet(CatalogETagMixin, viewsets.ModelViewSet):
+    catalog_sections = ("banner",)
     queryset = Banner.objects.all()
     serializer_class = BannerSerializer
     parser_classes = [MultiPartParser, FormParser]
 
 
+HOME_SECTIONS = ("banner", "category", "product")
+
 
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def home_feed(request):
+    """
+    Everything the app's home screen needs in one round trip:
+    banners, categories and the newest ``hot`` and ``discount`` products.
+    Query params: limit (products per rail).
+    """
+    limit = positive_int(
+        request.query_params.get("limit"),
+        getattr(settings, "HOME_PRODUCT_LIMIT", 10),
+        cap=getattr(settings, "API_MAX_PAGE_SIZE", 200),
+    )
+    banner_v, category_v, product_v = get_catalog_versions(HOME_SECTIONS)
+    etag = catalog_etag(request, HOME_SECTIONS, (banner_v, category_v, product_v))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    context = {"request": request}
+
+    def products_with_tag(tag):
+        queryset = (
+            Product.objects.select_related("category")
+            .filter(tag=tag)
+            .order_by("-product_date", "-id")[:limit]
+        )
+        return ProductSerializer(queryset, many=True, context=context).data
+
+    data = {
+        "banners": get_catalog_fragment(
+            request, "home:banners", ("banner",), (banner_v,),
+            lambda: BannerSerializer(Banner.objects.all(), many=True, context=context).data,
+        ),
+        "categories": get_catalog_fragment(
+            request, "home:categories", ("category",), (category_v,),
+            lambda: CategorySerializer(Category.objects.all(), many=True, context=context).data,
+        ),
+    }
+    # Product rows embed category_name, so they also depend on "category".
+    for tag in ("hot", "discount"):
+        data[tag] = get_catalog_fragment(
+            request, f"home:{tag}:{limit}", ("product", "category"), (product_v, category_v),
+            lambda tag=tag: products_with_tag(tag),
+        )
+    return apply_catalog_headers(Response(data), etag)
 
 
 class SupplierViewSet(viewsets.ModelViewSet):
@@ -642,6 +685,7 @@ class SupplierViewSet(viewsets.ModelViewSet):
 @api_view(["POST"])
 @authentication_classes([AuthTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent("payments.payway")
 def create_payway_payment(request):
     """
     Admin-triggered endpoint to generate an ABA PayWay payment link for an order.
@@ -766,6 +810,7 @@ def create_payway_payment(request):
 @api_view(["POST"])
 @authentication_classes([AuthTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent("payments.qr")
 def create_qr_payment(request):
     data = request.data or {}
     order_ref = data.get("order_id") or data.get("order_code")
@@ -873,19 +918,37 @@ def upload_qr_receipt(request):
     if error:
         return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
 
-    payment.receipt_image = receipt_file
-    payment.receipt_uploaded_at = timezone.now()
-    if payment.status in ("rejected", "failed"):
-        payment.status = "pending"
-    payment.save(update_fields=["receipt_image", "receipt_uploaded_at", "status", "updated_at"])
-
     order = payment.order
-    if order and order.payment_status != "paid":
-        order.payment_status = "pending"
-        order.save(update_fields=["payment_status", "updated_at"])
+    try:
+        with transaction.atomic():
+            if order:
+                order = Order.objects.select_for_update().get(pk=order.pk)
+                if order.order_status == "cancelled":
+                    return Response({"detail": "Order was cancelled."}, status=status.HTTP_409_CONFLICT)
+                if order.payment_status != "paid":
+                    # A rejected or failed order gave its stock back; the
+                    # resubmitted receipt only stands if the units are still there.
+                    reclaim_stock(order, reservation_expiry(order.payment_method))
+
+            payment.receipt_image = receipt_file
+            payment.receipt_uploaded_at = timezone.now()
+            if payment.status in ("rejected", "failed"):
+                payment.status = "pending"
+            payment.save(update_fields=["receipt_image", "receipt_uploaded_at", "status", "updated_at"])
+
+            if order and order.payment_status != "paid":
+                order.payment_status = "pending"
+                order.save(update_fields=["payment_status", "updated_at"])
+
+            if order:
+                _send_telegram_receipt_upload(order, payment, request)
+    except InsufficientStock as exc:
+        return Response(
+            {"detail": str(exc), "product_id": exc.product.pk},
+            status=status.HTTP_409_CONFLICT,
+        )
 
     if order:
-        _send_telegram_receipt_upload(order, payment, request)
         _broadcast_order_event(
             order,
             "receipt_uploaded",
@@ -1035,12 +1098,22 @@ def payway_callback(request):
 
     if _is_payway_success(status_text, data) and amount_valid and hash_valid:
         with transaction.atomic():
+            order = Order.objects.select_for_update().get(pk=order.pk)
+            payment.order = order
             payment.status = "verified"
             payment.paid_at = timezone.now()
             payment.save()
 
+            # The money has arrived either way; an order whose released
+            # stock has since been sold stays pending for staff to resolve.
+            in_stock = True
+            if order.order_status != "cancelled":
+                try:
+                    secure_stock(order)
+                except InsufficientStock:
+                    in_stock = False
             order.payment_status = "paid"
-            if order.order_status == "pending":
+            if order.order_status == "pending" and in_stock:
                 order.order_status = "confirmed"
             order.payment_method = "ABA_PAYWAY"
             order.save(update_fields=["payment_status", "order_status", "payment_method", "updated_at"])
@@ -1050,16 +1123,27 @@ def payway_callback(request):
             tx.processed_at = timezone.now()
             tx.save()
 
-        _send_telegram_payment_update(order, payment, tx)
+            _send_telegram_payment_update(order, payment, tx)
         return Response(
             {"detail": "Payment verified", "transaction_id": tx_id},
             status=status.HTTP_200_OK,
         )
 
-    payment.status = "failed" if status_text else "rejected"
-    payment.save()
-    tx.payment = payment
-    tx.save(update_fields=["payment"])
+    # Only a signed failure report releases the order's stock; an unsigned
+    # callback must not be able to restock someone else's order.
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order.pk)
+        payment.order = order
+        payment.status = "failed" if status_text else "rejected"
+        payment.save()
+        tx.payment = payment
+        tx.save(update_fields=["payment"])
+        if hash_valid and not _is_payway_success(status_text, data) and order.payment_status != "paid":
+            order.payment_status = "failed"
+            order.save(update_fields=["payment_status", "updated_at"])
+            # Like a rejection from Telegram: the units go back on sale now,
+            # not when expire_reservations next runs.
+            release_stock(order)
 
     return Response(
         {
@@ -1074,9 +1158,9 @@ def payway_callback(request):
 
 def _send_telegram_payment_update(order: Order, payment: Payment, tx: PaymentTransaction):
     """
-    Notify Telegram when a payment is confirmed.
+    Queue a Telegram message when a payment is confirmed.
     """
-    token, chat_id = _get_telegram_config()
+    token, chat_id = telegram_config()
     if not token or not chat_id:
         return
 
@@ -1090,18 +1174,12 @@ def _send_telegram_payment_update(order: Order, payment: Payment, tx: PaymentTra
         f"Status: {payment.status}",
         f"Paid at: {paid_time}",
     ]
+    if order.order_status == "pending":
+        lines.append("⚠️ Out of stock: the order was not confirmed.")
     if location_link:
         lines.append(f"Location: {location_link}")
     text = "\n".join(lines)
-    try:
-        base = f"https://api.telegram.org/bot{token}"
-        requests.post(
-            f"{base}/sendMessage",
-            json={"chat_id": chat_id, "text": text},
-            timeout=10,
-        )
-    except Exception as exc:
-        print(f"[telegram] failed to send payment update: {exc}")
+    enqueue("sendMessage", {"chat_id": chat_id, "text": text})
 
 
 def _apply_order_decision(order: Order, action: str):
@@ -1110,31 +1188,41 @@ def _apply_order_decision(order: Order, action: str):
     Returns (processed: bool, message: str).
     """
     action = action.lower()
-    # Prevent double-processing
-    if order.payment_status in ("paid", "failed") or order.order_status in ("cancelled", "completed"):
-        return False, f"Order {order.order_code} already processed."
-
-    if action == "approve":
-        order.order_status = "confirmed"
-        order.payment_status = "paid"
-        msg = f"✅ Order {order.order_code} approved."
-    elif action == "reject":
-        order.order_status = "pending" if order.payment_method != "COD" else "cancelled"
-        order.payment_status = "failed"
-        msg = f"❌ Order {order.order_code} rejected."
-    else:
+    if action not in ("approve", "reject"):
         return False, "Unsupported action."
 
-    order.save(update_fields=["order_status", "payment_status"])
+    with transaction.atomic():
+        # Locked, so a concurrent approve and reject cannot both pass the
+        # check below (a late reject would restock an approved order).
+        order = Order.objects.select_for_update().get(pk=order.pk)
+        # Prevent double-processing
+        if order.payment_status in ("paid", "failed") or order.order_status in ("cancelled", "completed"):
+            return False, f"Order {order.order_code} already processed."
 
-    for payment in order.payments.all():
         if action == "approve":
-            payment.status = "verified"
-            payment.paid_at = timezone.now()
-        elif action == "reject":
-            payment.status = "rejected"
-            payment.paid_at = None
-        payment.save(update_fields=["status", "paid_at"])
+            try:
+                secure_stock(order)
+            except InsufficientStock as exc:
+                return False, f"⚠️ Order {order.order_code} not approved: {exc}"
+            order.order_status = "confirmed"
+            order.payment_status = "paid"
+            msg = f"✅ Order {order.order_code} approved."
+        else:
+            order.order_status = "pending" if order.payment_method != "COD" else "cancelled"
+            order.payment_status = "failed"
+            msg = f"❌ Order {order.order_code} rejected."
+            release_stock(order)
+
+        order.save(update_fields=["order_status", "payment_status"])
+
+        for payment in order.payments.all():
+            if action == "approve":
+                payment.status = "verified"
+                payment.paid_at = timezone.now()
+            else:
+                payment.status = "rejected"
+                payment.paid_at = None
+            payment.save(update_fields=["status", "paid_at"])
 
     _broadcast_order_event(order, f"status_{action}")
     return True, msg
@@ -1167,50 +1255,36 @@ def telegram_webhook(request):
     if not order:
         return Response(status=status.HTTP_200_OK)
 
-    processed, status_text = _apply_order_decision(order, action)
-
-    token, default_chat_id = _get_telegram_config()
-    if not token:
-        return Response(status=status.HTTP_200_OK)
-
-    base = f"https://api.telegram.org/bot{token}"
+    token, default_chat_id = telegram_config()
     msg = callback.get("message", {})
     chat_id = msg.get("chat", {}).get("id") or default_chat_id
     message_id = msg.get("message_id")
 
-    try:
-        # Acknowledge button press
-        requests.post(
-            f"{base}/answerCallbackQuery",
-            json={
-              "callback_query_id": callback.get("id"),
-              "text": status_text,
-              "show_alert": False,
-            },
-            timeout=10,
-        )
-        # Remove inline buttons to prevent duplicate actions
-        if message_id:
-            requests.post(
-                f"{base}/editMessageReplyMarkup",
-                json={
-                    "chat_id": chat_id,
-                    "message_id": message_id,
-                    "reply_markup": {"inline_keyboard": []},
+    with transaction.atomic():
+        processed, status_text = _apply_order_decision(order, action)
+        if token:
+            # Acknowledge button press
+            enqueue(
+                "answerCallbackQuery",
+                {
+                    "callback_query_id": callback.get("id"),
+                    "text": status_text,
+                    "show_alert": False,
                 },
-                timeout=10,
+                chat_id=chat_id,
             )
-        # Notify the chat
-        requests.post(
-            f"{base}/sendMessage",
-            json={
-              "chat_id": chat_id,
-              "text": status_text,
-            },
-            timeout=10,
-        )
-    except Exception as exc:
-        print(f"[telegram] callback handling failed: {exc}")
+            # Remove inline buttons to prevent duplicate actions
+            if message_id:
+                enqueue(
+                    "editMessageReplyMarkup",
+                    {
+                        "chat_id": chat_id,
+                        "message_id": message_id,
+                        "reply_markup": {"inline_keyboard": []},
+                    },
+                )
+            # Notify the chat
+            enqueue("sendMessage", {"chat_id": chat_id, "text": status_text})
 
     return Response(status=status.HTTP_200_OK)
 
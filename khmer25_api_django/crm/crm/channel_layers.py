@@ -0,0 +1,302 @@
+"""
+Channel layer over PostgreSQL LISTEN/NOTIFY, so WebSocket events reach
+consumers in every worker process and on every node that shares the
+database.
+
+Each process keeps one extra connection to the existing database and
+LISTENs on:
+
+- its own process channel, for ``send()`` to one of its consumers
+  (``new_channel()`` names embed the process);
+- one channel per group that has members in this process.
+
+``group_send`` is a single ``NOTIFY`` on the group's channel. PostgreSQL
+hands it to each listening process once, and each process delivers it to
+its own members, so a message costs one delivery per interested socket and
+nothing for processes without members. Group membership never leaves the
+process: there is no table to keep in sync, and a crashed process simply
+stops listening. ``group_add`` must therefore run in the process that owns
+the channel, as consumers do.
+
+NOTIFY goes out on Django's own connection, so inside
+``transaction.atomic()`` it is delivered at commit and dropped on
+rollback. Delivery is at most once (like the Redis layer): messages that
+arrive while a process is reconnecting are lost. Messages are JSON and must
+fit NOTIFY's 8000-byte payload.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+
+from asgiref.sync import sync_to_async
+from channels.layers import BaseChannelLayer
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+try:
+    import psycopg
+    from psycopg import sql
+except ImportError:  # only needed when this layer is configured
+    psycopg = None
+
+logger = logging.getLogger(__name__)
+
+MAX_PAYLOAD_BYTES = 7999
+RECONNECT_DELAY = 1.0
+# DATABASES OPTIONS that are libpq connection parameters.
+LIBPQ_OPTIONS = {
+    "application_name",
+    "connect_timeout",
+    "options",
+    "sslcert",
+    "sslkey",
+    "sslmode",
+    "sslrootcert",
+    "target_session_attrs",
+}
+
+
+class PostgresChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+    notify_sql = "SELECT pg_notify(%s, %s)"
+
+    def __init__(self, alias="default", prefix="cl", expiry=60, capacity=100, channel_capacity=None):
+        if psycopg is None:
+            raise ImproperlyConfigured("PostgresChannelLayer requires psycopg (pip install psycopg).")
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.alias = alias
+        self.prefix = prefix
+        self.client_prefix = uuid.uuid4().hex
+        self._queues = {}
+        self._groups = {}
+        # PostgreSQL channels this process wants to LISTEN on.
+        self._listening = set()
+        self._conn = None
+        self._loop = None
+        self._lock = None
+        self._reconnect_task = None
+
+    # Names
+
+    def _pg_channel(self, kind, name):
+        digest = hashlib.sha1(f"{self.prefix}:{name}".encode("utf-8")).hexdigest()
+        return f"{self.prefix}_{kind}_{digest[:40]}"
+
+    def _route(self, channel):
+        if "!" in channel:
+            # "specific.<client_prefix>!<id>": the owning process.
+            return self._pg_channel("p", channel.split("!", 1)[0].rsplit(".", 1)[-1])
+        return self._pg_channel("c", channel)
+
+    async def new_channel(self, prefix="specific"):
+        return f"{prefix}.{self.client_prefix}!{uuid.uuid4().hex}"
+
+    # Sending
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        await self._notify(self._route(channel), {"c": channel, "m": message})
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_group_name(group), "Group name not valid"
+        await self._notify(self._pg_channel("g", group), {"g": group, "m": message})
+
+    async def _notify(self, pg_channel, payload):
+        data = json.dumps(payload, separators=(",", ":"), default=str)
+        if len(data.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+            raise ValueError(f"Channel message is {len(data)} bytes; NOTIFY allows {MAX_PAYLOAD_BYTES}.")
+        # Not database_sync_to_async: its close_old_connections() would close
+        # the caller's connection, and its transaction, inside atomic().
+        await sync_to_async(self._notify_sync, thread_sensitive=True)(pg_channel, data)
+
+    def _notify_sync(self, pg_channel, data):
+        connection = connections[self.alias]
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+        with connection.cursor() as cursor:
+            cursor.execute(self.notify_sql, [pg_channel, data])
+
+    # Receiving
+
+    def _queue(self, channel):
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        # Before any await, so messages for a consumer that is still
+        # connecting are kept.
+        queue = self._queue(channel)
+        if "!" in channel:
+            await self._ensure_listener()
+        else:
+            await self._listen(self._route(channel))
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            # The consumer is gone; forget its queue unless others wait on it.
+            if queue.empty() and not any(channel in members for members in self._groups.values()):
+                self._queues.pop(channel, None)
+            raise
+
+    def _deliver(self, data):
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return
+        if "g" in payload:
+            channels = self._groups.get(payload["g"], ())
+        else:
+            channels = [payload["c"]] if payload["c"] in self._queues else ()
+        for channel in channels:
+            queue = self._queue(channel)
+            if queue.full():
+                logger.warning("Channel %s is full; dropping a message.", channel)
+                continue
+            queue.put_nowait(payload["m"])
+
+    # Groups
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        self._groups.setdefault(group, set()).add(channel)
+        self._queue(channel)
+        await self._listen(self._pg_channel("g", group))
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        members = self._groups.get(group)
+        if members is None:
+            return
+        members.discard(channel)
+        if not members:
+            del self._groups[group]
+            await self._unlisten(self._pg_channel("g", group))
+
+    async def flush(self):
+        self._queues.clear()
+        self._groups.clear()
+        self._listening.clear()
+        if self._conn is not None:
+            self._loop.remove_reader(self._conn.fileno())
+            await self._conn.close()
+            self._conn = None
+
+    # The LISTEN connection
+
+    def _conninfo(self):
+        database = settings.DATABASES[self.alias]
+        params = {
+            "dbname": database.get("NAME"),
+            "user": database.get("USER"),
+            "password": database.get("PASSWORD"),
+            "host": database.get("HOST"),
+            "port": database.get("PORT"),
+        }
+        params.update(
+            (key, value) for key, value in (database.get("OPTIONS") or {}).items() if key in LIBPQ_OPTIONS
+        )
+        return {key: value for key, value in params.items() if value not in (None, "")}
+
+    async def _ensure_listener(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (tests): start over on this one.
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._conn = None
+        if self._conn is not None:
+            return
+        async with self._lock:
+            if self._conn is None:
+                await self._connect()
+
+    async def _connect(self):
+        conn = await psycopg.AsyncConnection.connect(**self._conninfo(), autocommit=True)
+        # Notifications that arrive while psycopg runs a command of ours.
+        conn.add_notify_handler(lambda notify: self._deliver(notify.payload))
+        self._conn = conn
+        self._listening.add(self._pg_channel("p", self.client_prefix))
+        for name in sorted(self._listening):
+            await self._execute("LISTEN", name)
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+
+    async def _execute(self, command, name):
+        """
+        Run LISTEN/UNLISTEN with the socket reader detached, so psycopg is
+        the only one reading the connection meanwhile.
+        """
+        conn = self._conn
+        fileno = conn.fileno()
+        self._loop.remove_reader(fileno)
+        try:
+            await conn.execute(sql.SQL(command + " {}").format(sql.Identifier(name)))
+        finally:
+            if not conn.closed:
+                self._loop.add_reader(fileno, self._on_readable)
+                self._drain()
+
+    async def _listen(self, name):
+        await self._ensure_listener()
+        if name in self._listening:
+            return
+        async with self._lock:
+            if name not in self._listening and self._conn is not None:
+                await self._execute("LISTEN", name)
+            self._listening.add(name)
+
+    async def _unlisten(self, name):
+        if name not in self._listening:
+            return
+        self._listening.discard(name)
+        if self._conn is None or self._loop is not asyncio.get_running_loop():
+            return
+        async with self._lock:
+            if name not in self._listening and self._conn is not None:
+                await self._execute("UNLISTEN", name)
+
+    def _on_readable(self):
+        try:
+            self._conn.pgconn.consume_input()
+        except psycopg.OperationalError as exc:
+            logger.warning("Channel layer connection lost: %s", exc)
+            self._connection_lost()
+            return
+        self._drain()
+
+    def _drain(self):
+        pgconn = self._conn.pgconn
+        while True:
+            notify = pgconn.notifies()
+            if notify is None:
+                return
+            self._deliver(notify.extra.decode("utf-8"))
+
+    def _connection_lost(self):
+        conn, self._conn = self._conn, None
+        try:
+            self._loop.remove_reader(conn.fileno())
+        except (OSError, ValueError, psycopg.Error):
+            pass
+        conn.pgconn.finish()
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while self._conn is None:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                async with self._lock:
+                    if self._conn is None:
+                        await self._connect()
+            except psycopg.OperationalError as exc:
+                logger.warning("Channel layer reconnect failed: %s", exc)
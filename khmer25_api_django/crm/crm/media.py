@@ -0,0 +1,192 @@
+"""
+Media file serving for deployments without a separate web server for
+``/media/`` (Railway, local runs).
+
+Each request costs one ``stat()``. Responses carry ``ETag`` and
+``Last-Modified`` so repeat requests get ``304 Not Modified``, single byte
+ranges are honoured, and content-hashed names are marked immutable. With
+``MEDIA_SENDFILE`` set, the proxy in front of gunicorn streams the file
+(``X-Accel-Redirect`` for nginx, ``X-Sendfile`` for Apache/lighttpd) and the
+worker is free as soon as the headers are written.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import filepath_to_uri
+from django.utils.http import http_date, parse_http_date_safe
+
+from accounts.storage import is_hashed_name
+
+PLACEHOLDER = "accounts/img/placeholder.svg"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+@lru_cache(maxsize=256)
+def _content_type(extension):
+    content_type, _ = mimetypes.guess_type("file" + extension)
+    return content_type or "application/octet-stream"
+
+
+def content_type_for(path):
+    return _content_type(os.path.splitext(path)[1].lower())
+
+
+def cache_control_for(path):
+    # Only names written by accounts.storage never change meaning; other
+    # uploads (timestamps, UUID fragments) may be overwritten in place.
+    if is_hashed_name(path):
+        return IMMUTABLE_CACHE_CONTROL
+    max_age = getattr(settings, "MEDIA_CACHE_MAX_AGE", 300)
+    return f"public, max-age={max_age}"
+
+
+def file_etag(stat_result):
+    return '"%x-%x"' % (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+@lru_cache(maxsize=1)
+def placeholder_bytes():
+    path = finders.find(PLACEHOLDER)
+    if not path:
+        return None
+    with open(path, "rb") as handle:
+        content = handle.read()
+    return content, '"%s"' % hashlib.sha1(content).hexdigest()
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single ``bytes=`` range, None to ignore the
+    header (missing, malformed or multi-range), or "unsatisfiable".
+    """
+    match = RANGE_RE.match((header or "").strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        return "unsatisfiable"
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _if_range_allows(request, etag, mtime):
+    value = request.META.get("HTTP_IF_RANGE")
+    if not value:
+        return True
+    if value.startswith(('"', "W/")):
+        return value == etag
+    since = parse_http_date_safe(value)
+    return since is not None and int(mtime) <= since
+
+
+def _file_chunks(path, start, length):
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(path, full_path, content_type):
+    mode = (getattr(settings, "MEDIA_SENDFILE", "") or "").lower()
+    if mode == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + filepath_to_uri(path).lstrip("/")
+        return response
+    if mode == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+        return response
+    return None
+
+
+def _placeholder_response(request, path):
+    if not content_type_for(path).startswith("image/"):
+        raise Http404("Media file not found.")
+    placeholder = placeholder_bytes()
+    if placeholder is None:
+        raise Http404("Media file not found.")
+    content, etag = placeholder
+    # The real file may appear later, so revalidate every time.
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(b"" if request.method == "HEAD" else content, content_type="image/svg+xml")
+        response["Content-Length"] = str(len(content))
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Media file not found.")
+    try:
+        stat_result = os.stat(full_path)
+    except OSError:
+        return _placeholder_response(request, path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404("Media file not found.")
+
+    etag = file_etag(stat_result)
+    mtime = stat_result.st_mtime
+    size = stat_result.st_size
+    content_type = content_type_for(path)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if response is None:
+        response = _sendfile_response(path, full_path, content_type)
+    if response is None:
+        byte_range = None
+        if request.method == "GET" and _if_range_allows(request, etag, mtime):
+            byte_range = parse_range(request.META.get("HTTP_RANGE"), size)
+        if byte_range == "unsatisfiable":
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _file_chunks(full_path, start, length), status=206, content_type=content_type
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(length)
+        elif request.method == "HEAD":
+            response = HttpResponse(content_type=content_type)
+            response["Content-Length"] = str(size)
+        else:
+            response = FileResponse(open(full_path, "rb"), content_type=content_type)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(mtime)
+    response["Cache-Control"] = cache_control_for(path)
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,184 @@
+"""
+Brotli/gzip compression for API responses.
+
+WhiteNoise already serves pre-compressed static files; this covers the
+dynamic JSON from DRF and the dashboard's JSON endpoints. HTML is left alone
+by default: those pages embed CSRF tokens, which compression would expose to
+BREACH-style attacks.
+
+Brotli is used when the client accepts ``br``; otherwise gzip (also when
+the ``brotli`` package is missing, e.g. a bare development install).
+Buffered responses report the achieved ratio in ``X-Compression-Ratio``
+(original bytes / sent bytes); streaming responses log it when the stream
+ends, since their headers are already sent.
+"""
+import logging
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "application/vnd.api+json",
+    "application/javascript",
+    "application/msgpack",
+    "application/xml",
+    "image/svg+xml",
+    "text/css",
+    "text/csv",
+    "text/javascript",
+    "text/plain",
+)
+
+
+def parse_accept_encoding(header):
+    """
+    {coding: q} from an Accept-Encoding header.
+    """
+    codings = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def choose_encoding(header):
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    candidates = []
+    if brotli is not None:
+        candidates.append(("br", codings.get("br", wildcard)))
+    candidates.append(("gzip", codings.get("gzip", wildcard)))
+    # Prefer br on ties; it is listed first and max() keeps the first.
+    encoding, quality = max(candidates, key=lambda item: item[1])
+    return encoding if quality > 0 else None
+
+
+def _compressor(encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=getattr(settings, "COMPRESSION_BROTLI_QUALITY", 5))
+        return compressor.process, compressor.finish
+    level = getattr(settings, "COMPRESSION_GZIP_LEVEL", 6)
+    # wbits=31: gzip container.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_bytes(data, encoding):
+    process, finish = _compressor(encoding)
+    return process(data) + finish()
+
+
+class _Meter:
+    def __init__(self, path, encoding):
+        self.path = path
+        self.encoding = encoding
+        self.original = 0
+        self.sent = 0
+
+    def report(self):
+        if self.sent:
+            logger.info(
+                "compressed %s (%s): %d -> %d bytes, ratio %.2f",
+                self.path, self.encoding, self.original, self.sent, self.original / self.sent,
+            )
+
+
+def compress_stream(chunks, encoding, meter):
+    process, finish = _compressor(encoding)
+    for chunk in chunks:
+        meter.original += len(chunk)
+        data = process(chunk)
+        if data:
+            meter.sent += len(data)
+            yield data
+    data = finish()
+    meter.sent += len(data)
+    yield data
+    meter.report()
+
+
+async def compress_async_stream(chunks, encoding, meter):
+    process, finish = _compressor(encoding)
+    async for chunk in chunks:
+        meter.original += len(chunk)
+        data = process(chunk)
+        if data:
+            meter.sent += len(data)
+            yield data
+    data = finish()
+    meter.sent += len(data)
+    yield data
+    meter.report()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 1024)
+        self.content_types = tuple(
+            getattr(settings, "COMPRESSION_CONTENT_TYPES", DEFAULT_CONTENT_TYPES)
+        )
+
+    def _compressible(self, response):
+        if response.status_code != 200 or response.has_header("Content-Encoding"):
+            return False
+        content_type = response.get("Content-Type", "").split(";", 1)[0].strip().lower()
+        return content_type in self.content_types
+
+    def process_response(self, request, response):
+        if not self._compressible(response):
+            return response
+        # The body depends on Accept-Encoding from here on, compressed or not.
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING"))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            meter = _Meter(request.path, encoding)
+            if response.is_async:
+                response.streaming_content = compress_async_stream(
+                    response.streaming_content, encoding, meter
+                )
+            else:
+                response.streaming_content = compress_stream(
+                    response.streaming_content, encoding, meter
+                )
+            del response["Content-Length"]
+        else:
+            original = len(response.content)
+            if original < self.min_size:
+                return response
+            compressed = compress_bytes(response.content, encoding)
+            if len(compressed) >= original:
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+            response["X-Compression-Ratio"] = "%.2f" % (original / len(compressed))
+
+        # The compressed bytes differ, so a strong validator must become weak.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
@@ -15,6 +15,7 @@ import os
 import sys
 
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -86,6 +87,7 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "crm.middleware.CompressionMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -98,11 +100,26 @@ CORS_ALLOW_ALL_ORIGINS = os.getenv("CORS_ALLOW_ALL_ORIGINS", "True").lower() ==
 
 MEDIA_URL = os.getenv("MEDIA_URL", "/media/")
 MEDIA_ROOT = os.getenv("MEDIA_ROOT", str(BASE_DIR / "media"))
+# Absolute prefix for media URLs in API responses (e.g. a CDN). When empty,
+# URLs are built from the request host.
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "")
+# Widths (px) of the resized WebP/JPEG copies made for uploaded images.
+IMAGE_VARIANT_WIDTHS = tuple(
+    int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "160,320,640,1280").split(",") if width.strip()
+)
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
 # Default to serving media unless explicitly disabled.
 SERVE_MEDIA = os.getenv("SERVE_MEDIA", "True").lower() == "true"
 if not SERVE_MEDIA and "runserver" in sys.argv:
     # Serve media in local dev even when DEBUG is false.
     SERVE_MEDIA = True
+# Browser cache lifetime for media without a content hash in its name.
+MEDIA_CACHE_MAX_AGE = int(os.getenv("MEDIA_CACHE_MAX_AGE", "300"))
+# Hand file bodies to the front proxy: "x-accel-redirect" (nginx, with an
+# internal location at MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or
+# "x-sendfile" (Apache/lighttpd). Empty streams from Django.
+MEDIA_SENDFILE = os.getenv("MEDIA_SENDFILE", "").strip().lower()
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
 
 # Ensure media directory exists when using a mounted volume.
 try:
@@ -134,13 +151,6 @@ TEMPLATES = [
 WSGI_APPLICATION = 'crm.wsgi.application'
 ASGI_APPLICATION = 'crm.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
-
-
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
@@ -174,6 +184,25 @@ else:
         }
     }
 
+# ProductSearchTerm's unique constraint INCLUDEs weight on PostgreSQL; on
+# sqlite migration 0034 keeps the plain (term, product) constraint instead.
+SILENCED_SYSTEM_CHECKS = ["models.W039"]
+
+
+# Order events must reach sockets held by any worker process, so on
+# PostgreSQL the channel layer rides on LISTEN/NOTIFY; the in-memory layer
+# only works with a single process (sqlite development).
+_default_channel_layer = (
+    "crm.channel_layers.PostgresChannelLayer"
+    if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql"
+    else "channels.layers.InMemoryChannelLayer"
+)
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": os.getenv("CHANNEL_LAYER_BACKEND", _default_channel_layer),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -217,10 +246,26 @@ STATICFILES_STORAGE = os.getenv(
 )
 WHITENOISE_USE_FINDERS = True
 
+# Store uploads under content hashes (accounts.storage) so media URLs can be
+# cached forever; migrate existing files with `manage.py media_fix --hash-names`.
+MEDIA_HASHED_STORAGE = os.getenv("MEDIA_HASHED_STORAGE", "False").lower() == "true"
+STORAGES = {
+    "default": {
+        "BACKEND": (
+            "accounts.storage.HashedMediaStorage"
+            if MEDIA_HASHED_STORAGE
+            else "django.core.files.storage.FileSystemStorage"
+        ),
+    },
+    "staticfiles": {"BACKEND": STATICFILES_STORAGE},
+}
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:64129",
     "http://localhost:65008",
 ]
+# Flutter web sends Idempotency-Key on checkout/payment POSTs.
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 CSRF_TRUSTED_ORIGINS = _split_env_list("CSRF_TRUSTED_ORIGINS")
 
@@ -233,6 +278,52 @@ if _railway_public_domain:
         ]
     )
 
+# --- API ---
+# Keyset pagination is opt-in per request (?page_size= / ?cursor=).
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "50"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "200"))
+# MessagePack (Accept: application/msgpack) for the mobile app; JSON stays
+# the default.
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "accounts.renderers.MessagePackRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+        "accounts.renderers.MessagePackParser",
+    ],
+}
+# Minutes an unpaid QR/PayWay order holds its stock before
+# `manage.py expire_reservations` cancels it and restocks.
+STOCK_RESERVATION_TTL_MINUTES = int(os.getenv("STOCK_RESERVATION_TTL_MINUTES", "30"))
+# How long a stored Idempotency-Key response is replayed for retries of
+# POST /api/orders/, /api/payment/qr and /api/payments/create.
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# Products per rail (hot, discount) on /api/home/; ?limit= overrides up to the max page size.
+HOME_PRODUCT_LIMIT = int(os.getenv("HOME_PRODUCT_LIMIT", "10"))
+
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) in production
+# so every worker shares the catalog response cache.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+CATALOG_CACHE_ALIAS = os.getenv("CATALOG_CACHE_ALIAS", "default")
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "300"))
+
+# Response compression (crm.middleware). Brotli needs the optional `brotli`
+# package; without it clients get gzip.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
 # --- Payment / Telegram integrations ---
 PAYWAY_MERCHANT_ID = os.getenv("PAYWAY_MERCHANT_ID", "")
 PAYWAY_API_KEY = os.getenv("PAYWAY_API_KEY", "")
@@ -261,6 +352,17 @@ PAYMENT_QR_CODE_URLS = {
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
+# Bot API base URL (point at a stub server for load tests) and the per-group
+# message rate the client keeps under (Telegram allows about 20/minute).
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+TELEGRAM_GROUP_RATE_PER_MINUTE = int(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))
+# Receipt photos are shrunk to this many pixels on the long side before the
+# first upload; later messages reuse Telegram's file_id.
+TELEGRAM_PHOTO_MAX_SIDE = int(os.getenv("TELEGRAM_PHOTO_MAX_SIDE", "1280"))
+# Notification outbox (`manage.py run_outbox_worker`): delivery attempts
+# before a job is marked failed, and days sent jobs are kept.
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
 
 
  
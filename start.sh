@@ -16,6 +16,22 @@ python manage.py collectstatic --noinput
 if [ "${SEED_DATA}" = "true" ]; then
   python manage.py seed_data --reset
 fi
+: "${RUN_OUTBOX_WORKER:=true}"
+if [ "${RUN_OUTBOX_WORKER}" = "true" ]; then
+  # Delivers queued Telegram notifications; set to false when it runs as its own service.
+  python manage.py run_outbox_worker &
+fi
+: "${RUN_IMAGE_WORKER:=true}"
+if [ "${RUN_IMAGE_WORKER}" = "true" ]; then
+  # Resizes uploaded images off the request path; set to false when it runs as its own service.
+  python manage.py build_image_variants --watch &
+fi
 : "${GUNICORN_TIMEOUT:=120}"
 : "${PORT:=8000}"
-gunicorn crm.wsgi:application --bind 0.0.0.0:${PORT} --timeout "${GUNICORN_TIMEOUT}"
+: "${SERVER_MODE:=asgi}"
+if [ "${SERVER_MODE}" = "wsgi" ]; then
+  # HTTP only; WebSocket order events need the ASGI server.
+  exec gunicorn crm.wsgi:application --bind 0.0.0.0:${PORT} --timeout "${GUNICORN_TIMEOUT}"
+fi
+exec uvicorn crm.asgi:application --host 0.0.0.0 --port "${PORT}" \
+  --workers "${WEB_CONCURRENCY:-2}" --proxy-headers --forwarded-allow-ips='*'